@@ -1,8 +1,10 @@
 from __future__ import absolute_import, annotations
 
 import os
+import tempfile
+import time
 from pathlib import Path
-from typing import NoReturn
+from typing import Iterable, NoReturn
 
 import appdirs
 
@@ -10,6 +12,14 @@ from kslurm.utils import get_hash
 
 CACHE_PATH = Path(appdirs.user_cache_dir("kslurm"))
 
+COMPLETION_CACHE = CACHE_PATH / "completion"
+
+ARRAY_CACHE = CACHE_PATH / "arrays"
+
+# Seconds after which array index files no submission has used are removed. Tasks
+# read them when they start, so this must outlast how long arrays queue and run
+ARRAY_INDEX_TTL = 30 * 24 * 60 * 60
+
 
 class Cache:
     def __init__(self):
@@ -42,3 +52,56 @@ class Cache:
 
     def __iter__(self) -> NoReturn:
         raise NotImplementedError()
+
+
+def update_completion(source: str, words: Iterable[str]):
+    """Record the current values of a dynamic completion source
+
+    These are read by the script generated by `kslurm completion bash`. Completion is
+    never essential, so any failure to write is ignored
+    """
+    path = COMPLETION_CACHE / source
+    data = "".join(f"{word}\n" for word in sorted(words))
+    try:
+        if path.exists() and path.read_text() == data:
+            return
+        COMPLETION_CACHE.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=COMPLETION_CACHE, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def array_index(commands: Iterable[str]) -> Path:
+    """Write the commands of a job array to an index file, one per line
+
+    Files are named after their contents, so resubmitting the same commands reuses
+    the existing index. Tasks must be able to read the index from the compute nodes.
+    Indices unused for ARRAY_INDEX_TTL are removed whenever a new one is written
+    """
+    data = "".join(f"{command}\n" for command in commands)
+    path = ARRAY_CACHE / f"{get_hash(data)}.txt"
+    if path.exists():
+        os.utime(path)
+        return path
+    ARRAY_CACHE.mkdir(parents=True, exist_ok=True)
+    _prune(ARRAY_CACHE, ARRAY_INDEX_TTL)
+    fd, tmp = tempfile.mkstemp(dir=ARRAY_CACHE, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+
+def _prune(directory: Path, ttl: float):
+    """Remove the files in directory last modified more than ttl seconds ago"""
+    cutoff = time.time() - ttl
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
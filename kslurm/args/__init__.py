@@ -1,4 +1,4 @@
-__submodules__ = ["command", "arg_types"]
+__submodules__ = ["command", "arg_types", "batch"]
 
 __ignore__ = ["T", "S", "C", "P", "Exc"]
 
@@ -24,8 +24,13 @@ from kslurm.args.arg_types import (
     shape,
     subcommand,
 )
+from kslurm.args.batch import (
+    BatchResult,
+    parse_batch,
+)
 
 __all__ = [
+    "BatchResult",
     "CommandArgs",
     "CommandError",
     "HelpRequest",
@@ -39,6 +44,7 @@ __all__ = [
     "flag",
     "help_parser",
     "keyword",
+    "parse_batch",
     "path",
     "positional",
     "shape",
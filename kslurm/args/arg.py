@@ -1,13 +1,17 @@
 from __future__ import absolute_import, annotations
 
 import abc
+import os
+import stat
 import textwrap as txt
 from typing import (
     Any,
     Callable,
+    ClassVar,
     DefaultDict,
     Generic,
     Literal,
+    Mapping,
     Optional,
     Protocol,
     TypeVar,
@@ -28,6 +32,10 @@ S = TypeVar("S")
 
 HelpRow = Union[list[Union[Text, str]], list[Text], list[str]]
 
+# Shell completion of an arg's values: either a fixed set of words, or the name of a
+# completion source (see kslurm.args.completion)
+Completion = Union[str, tuple[str, ...], None]
+
 
 class _SkipHelp:
     """
@@ -81,6 +89,13 @@ def _mandatoryarg_err(
     )
 
 
+def _invalid_value_err(err: ValidationError):
+    return ValidationError(
+        f"""{Fore.RED + Style.BRIGHT}ERROR:{Style.RESET_ALL}
+    Invalid value for "{Style.BRIGHT}{{label}}{Style.RESET_ALL}": {err.msg}"""
+    )
+
+
 class AbstractHelpTemplate(abc.ABC):
     title: str
     description: str | None = None
@@ -131,12 +146,47 @@ class AbstractHelpTemplate(abc.ABC):
         return t
 
 
-@attr.frozen
+class FsProbe:
+    """Memoized filesystem lookups shared by all matchers of a single parse
+
+    Each path is stat'ed at most once, no matter how many parsers test it or whether
+    they check for existence, directories, or both. stat_calls counts the real stat
+    calls made by every probe, so tests can check the cost of parsing an argv
+    """
+
+    stat_calls: ClassVar[int] = 0
+
+    def __init__(self):
+        self._stats: dict[str, Optional[os.stat_result]] = {}
+
+    def stat(self, path: str) -> Optional[os.stat_result]:
+        try:
+            return self._stats[path]
+        except KeyError:
+            pass
+        FsProbe.stat_calls += 1
+        try:
+            result = os.stat(path)
+        except (OSError, ValueError):
+            result = None
+        self._stats[path] = result
+        return result
+
+    def exists(self, path: str):
+        return self.stat(path) is not None
+
+    def is_dir(self, path: str):
+        result = self.stat(path)
+        return result is not None and stat.S_ISDIR(result.st_mode)
+
+
+@attr.define
 class Context:
     args: list[str]
     current_arg: int
-    params: dict[str, Parser[Any]]
+    params: Mapping[str, Parser[Any]]
     last_matched: Optional[Parser[Any]]
+    fs: FsProbe = attr.field(factory=FsProbe)
 
 
 class ActionProtocol(Generic[T], Protocol):
@@ -176,13 +226,7 @@ class Parser(Generic[T]):
                 raw_value=self.raw_value + [value],
             )
         except ValidationError as err:
-            return attr.evolve(
-                self,
-                validation_err=ValidationError(
-                    f"""{Fore.RED + Style.BRIGHT}ERROR:{Style.RESET_ALL}
-    Invalid value for "{Style.BRIGHT}{{label}}{Style.RESET_ALL}": {err.msg}"""
-                ),
-            )
+            return attr.evolve(self, validation_err=_invalid_value_err(err))
 
     def __repr__(self) -> str:
         # values_repr =
@@ -321,6 +365,7 @@ class Arg(ParamInterface[T], SimpleParsable[T], Helpable):
     optional: bool = False
 
     _value: Optional[T] = None
+    complete: Completion = None
 
     @property
     def value(self) -> T:
@@ -401,6 +446,7 @@ class ParamSet(ParamInterface[T], SimpleParsable[T], Helpable):
     help: str = ""
     help_template: Optional[AbstractHelpTemplate] = None
     optional: bool = False
+    complete: Completion = None
 
     @property
     def value(self):
@@ -2,22 +2,15 @@ from __future__ import absolute_import, annotations
 
 import uuid
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, TypeVar
-
-from typing_extensions import ParamSpec
-
-if TYPE_CHECKING:
-    from typing_extensions import StrictTypeGuard
-else:
-    from typing_extensions import TypeGuard
-
-    StrictTypeGuard = TypeGuard
+from typing import Any, Callable, Dict, List, Optional, TypeVar
 
 import attr
+from typing_extensions import ParamSpec
 
 import kslurm.args.actions as actions
 import kslurm.args.matchers as matchers
-from kslurm.args.arg import Arg, ParamSet, Parser
+import kslurm.args.registry as registry
+from kslurm.args.arg import Arg, Completion, ParamSet, Parser
 from kslurm.args.help_templates import PositionalArg, ShapeArg, SubcommandTemplate
 from kslurm.args.protocols import Command, WrappedCommand
 from kslurm.exceptions import ValidationError
@@ -35,6 +28,7 @@ def positional(
     help: str = "",
     name: str = "",
     format: Callable[[str], T] = actions.NO_CONVERT,
+    complete: Completion = None,
 ) -> Arg[T]:
     return Arg[T](
         parser=Parser(
@@ -46,6 +40,7 @@ def positional(
         help_template=PositionalArg(),
         name=name,
         default=default,
+        complete=complete,
     )
 
 
@@ -75,30 +70,26 @@ def choice(
         help_template=PositionalArg(),
         name=name,
         default=default,
+        complete=tuple(match),
     )
 
 
-C = TypeVar("C", bound="Command[Any] | Command[[]]")
-
-
-def _is_command(command: WrappedCommand | C) -> StrictTypeGuard[C]:
-    return hasattr(command, "cli")
-
-
 class InvalidSubcommand(Exception):
     pass
 
 
 def subcommand(
-    commands: Dict[str, WrappedCommand | Command[...] | Command[[]]],
-    default: Optional[WrappedCommand | Command[...] | Command[[]]] = None,
+    commands: Dict[str, WrappedCommand | Command[...] | Command[[]] | str],
+    default: Optional[WrappedCommand | Command[...] | Command[[]] | str] = None,
 ):
-    cli = {
-        name: command.cli if _is_command(command) else command
-        for name, command in commands.items()
-    }
+    """Select between a set of commands
+
+    Commands may be given as import paths ("package.module:attribute"), in which
+    case the module is only imported once that command is selected
+    """
+    cli = {name: registry.get_command(command) for name, command in commands.items()}
 
-    _default = default.cli if default and _is_command(default) else default
+    _default = registry.get_command(default) if default else None
 
     def get_action(val: str):
         if val in cli.keys():
@@ -194,6 +185,7 @@ def keyword(
     help: str = "",
     lazy: bool = False,
     id: str = "",
+    complete: Completion = None,
 ) -> Any:
     pid = str(uuid.uuid4().int)
     action = (
@@ -217,6 +209,7 @@ def keyword(
         name=", ".join(match) + " <value>",
         default=default,
         id=id,
+        complete=complete,
     )
 
 
@@ -6,7 +6,7 @@ from typing import Any, Callable, Literal, NoReturn, Optional, TypeVar, overload
 from typing_extensions import ParamSpec
 
 import kslurm.args.arg_types as arg_types
-from kslurm.args.arg import ParamSet, Parser
+from kslurm.args.arg import Completion, ParamSet, Parser
 from kslurm.args.command import Command
 from kslurm.args.protocols import WrappedCommand
 from kslurm.exceptions import ValidationError
@@ -22,6 +22,7 @@ def positional(
     *,
     help: str = ...,
     name: str = ...,
+    complete: Completion = ...,
 ) -> Any: ...
 @overload
 def positional(
@@ -30,6 +31,7 @@ def positional(
     format: Callable[[str], T],
     help: str = ...,
     name: str = ...,
+    complete: Completion = ...,
 ) -> T: ...
 @overload
 def positional(
@@ -38,6 +40,7 @@ def positional(
     format: Callable[[str], T] = ...,
     help: str = ...,
     name: str = ...,
+    complete: Completion = ...,
 ) -> T: ...
 @overload
 def choice(
@@ -66,8 +69,8 @@ def choice(
     name: str = ...,
 ) -> T: ...
 def subcommand(
-    commands: dict[str, WrappedCommand | Command[...] | Command[[]]],
-    default: Optional[WrappedCommand | Command[...] | Command[[]]] = ...,
+    commands: dict[str, WrappedCommand | Command[...] | Command[[]] | str],
+    default: Optional[WrappedCommand | Command[...] | Command[[]] | str] = ...,
 ) -> arg_types.Subcommand: ...
 
 class InvalidSubcommand(ValidationError):
@@ -125,6 +128,7 @@ def keyword(
     num: None = ...,
     lazy: bool = ...,
     help: str = ...,
+    complete: Completion = ...,
 ) -> Any: ...
 @overload
 def keyword(
@@ -134,6 +138,7 @@ def keyword(
     num: int,
     lazy: bool = ...,
     help: str = ...,
+    complete: Completion = ...,
 ) -> list[Any]: ...
 @overload
 def keyword(
@@ -144,6 +149,7 @@ def keyword(
     num: None = ...,
     lazy: bool = ...,
     help: str = ...,
+    complete: Completion = ...,
 ) -> T: ...
 @overload
 def keyword(
@@ -154,6 +160,7 @@ def keyword(
     num: Literal[0],
     lazy: bool = ...,
     help: str = ...,
+    complete: Completion = ...,
 ) -> NoReturn: ...
 @overload
 def keyword(
@@ -164,6 +171,7 @@ def keyword(
     num: int,
     lazy: bool = ...,
     help: str = ...,
+    complete: Completion = ...,
 ) -> list[T]: ...
 @overload
 def keyword(
@@ -174,6 +182,7 @@ def keyword(
     num: None = ...,
     lazy: bool = ...,
     help: str = ...,
+    complete: Completion = ...,
 ) -> T: ...
 @overload
 def keyword(
@@ -184,6 +193,7 @@ def keyword(
     num: int,
     lazy: bool = ...,
     help: str = ...,
+    complete: Completion = ...,
 ) -> list[T]: ...
 @overload
 def keyword(
@@ -195,6 +205,7 @@ def keyword(
     lazy: bool = ...,
     help: str = ...,
     id: str,
+    complete: Completion = ...,
 ) -> ParamSet[Any]: ...
 
 class HelpRequest(Exception): ...
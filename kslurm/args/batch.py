@@ -0,0 +1,73 @@
+from __future__ import absolute_import, annotations
+
+from typing import Any, Generic, Iterable, Optional, TypeVar
+
+import attrs
+
+from kslurm.args.arg import FsProbe, Parser
+from kslurm.args.helpers import get_arg_dict, get_parsers, read_parsers
+from kslurm.args.parser import compile_parsers, parse_args
+from kslurm.exceptions import CommandLineError, TailError, TemplateError
+
+M = TypeVar("M")
+
+
+@attrs.frozen
+class BatchResult(Generic[M]):
+    """Outcome of parsing one argv of a batch
+
+    model is None whenever errors is not empty. parsers holds the parsers as
+    matched against the argv, and tail any args left unmatched (e.g. the command of
+    a kbatch style argv)
+    """
+
+    argv: list[str]
+    model: Optional[M]
+    parsers: dict[str, Parser[Any]]
+    tail: list[str]
+    errors: list[Exception]
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+def parse_batch(
+    model: type[M],
+    argvs: Iterable[list[str]],
+    allow_unknown: bool = True,
+    terminate_on_unknown: bool = True,
+) -> list[BatchResult[M]]:
+    """Parse many argvs against the same model in one pass
+
+    The parsers and dispatch table of the model are built once and shared by every
+    argv, as are filesystem lookups. Invalid argvs don't stop the batch: their errors
+    are returned in their result.
+    """
+    models = get_arg_dict(model)
+    parsers = get_parsers(models)
+    dispatch = compile_parsers(parsers)
+    fs = FsProbe()
+    results: list[BatchResult[M]] = []
+    for argv in argvs:
+        errors: list[Exception] = []
+        value: Optional[M] = None
+        parsed, tail = parsers, list[str]()
+        try:
+            parsed, tail = parse_args(
+                argv,
+                parsers,
+                terminate_on_unknown=terminate_on_unknown,
+                dispatch=dispatch,
+                fs=fs,
+            )
+            values, arg_errors = read_parsers(models, parsed)
+            errors.extend(arg_errors.values())
+            if tail and not allow_unknown:
+                errors.append(TailError(f"{tail} does not match any args"))
+            if not errors:
+                value = model(**values)
+        except (CommandLineError, TemplateError) as err:
+            errors.append(err)
+        results.append(BatchResult(list(argv), value, parsed, tail, errors))
+    return results
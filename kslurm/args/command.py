@@ -1,21 +1,23 @@
 from __future__ import absolute_import, annotations
 
 import functools as ft
+import importlib
 import inspect
 import itertools as it
 import sys
+from pathlib import Path
 from typing import Any, Callable, Literal, Optional, TypeVar, Union, overload
 
 import attr
-import docstring_parser as doc
 from rich.text import Text
 from typing_extensions import ParamSpec
 
+from kslurm.args import introspection
 from kslurm.args.arg import Arg, Parser
 from kslurm.args.arg_types import HelpRequest, help_parser
 from kslurm.args.help import HelpText
 from kslurm.args.helpers import get_arg_dict, get_parsers, read_parsers
-from kslurm.args.parser import parse_args
+from kslurm.args.parser import DispatchTable, compile_parsers, parse_args
 from kslurm.args.protocols import Command
 from kslurm.exceptions import CommandLineError, TailError
 from kslurm.style import console, stderr
@@ -99,6 +101,33 @@ class CommandError(Exception):
         self.msg = msg
 
 
+# Modules laying out help text, whose source is part of the key of cached help
+_HELP_MODULES = [
+    "kslurm.args.arg",
+    "kslurm.args.command",
+    "kslurm.args.help",
+    "kslurm.args.help_templates",
+    "kslurm.style",
+]
+
+
+def _docstr(func: Callable[..., Any]):
+    import docstring_parser as doc
+
+    docobj = doc.parse(func.__doc__ or "")
+    return (
+        (docobj.short_description or "")
+        + (docobj.blank_after_short_description and "\n\n" or "\n")
+        + (docobj.long_description or "")
+    )
+
+
+def _render(helptext: HelpText) -> str:
+    with console.capture() as capture:
+        console.print(helptext)
+    return capture.get()
+
+
 @overload
 def command(
     maybe_func: None = ...,
@@ -158,6 +187,8 @@ def command(
                 },
             )
             model.__doc__ = func.__doc__
+            model.__module__ = func.__module__
+            model.__qualname__ = f"{func.__qualname__}__Model__"
         else:
             for param in params.parameters.values():
                 annotation = (
@@ -201,22 +232,70 @@ def command(
                     )
                 command_args.model = param.name
 
-        docobj = doc.parse(func.__doc__ or "")
-        docstr = (
-            (docobj.short_description or "")
-            + (docobj.blank_after_short_description and "\n\n" or "\n")
-            + (docobj.long_description or "")
-        )
+        @ft.cache
+        def get_model_dict():
+            return get_arg_dict(model)
+
+        def get_docstr():
+            return introspection.cached(func, "command-doc", lambda: _docstr(func))
 
-        model_dict = get_arg_dict(model)
         if command_args.tail:
             usage_suffix = "command_args"
         else:
             usage_suffix = ""
 
         class Wrapper:
+            _parsers: Optional[Parsers] = None
+            _dispatch: Optional[DispatchTable] = None
+
             def get_helptext(self, entrypoint: str):
-                return HelpText(entrypoint, model_dict, docstr, usage_suffix)
+                return HelpText(
+                    entrypoint, get_model_dict(), get_docstr(), usage_suffix
+                )
+
+            def print_help(self, entrypoint: str, usage_only: bool = False):
+                """Print the help text of the command to the console
+
+                Laying out the help with rich is comparatively slow, so the rendered
+                text is cached on disk for each terminal width and color system
+                """
+
+                def render():
+                    helptext = self.get_helptext(entrypoint)
+                    return _render(
+                        helptext.with_usage_only() if usage_only else helptext
+                    )
+
+                kind = ":".join(
+                    [
+                        "help",
+                        Path(entrypoint).name,
+                        "usage" if usage_only else "full",
+                        str(console.width),
+                        str(console.color_system),
+                    ]
+                )
+                related = [
+                    *model.__mro__,
+                    *map(importlib.import_module, _HELP_MODULES),
+                ]
+                console.file.write(
+                    introspection.cached(func, kind, render, related=related)
+                )
+                console.file.flush()
+
+            def get_parsers(self):
+                """Get the parsers of the command along with their dispatch table
+
+                Both are built on first use and reused for every subsequent parse
+                """
+                if self._parsers is None or self._dispatch is None:
+                    self._parsers = {
+                        **get_parsers(get_model_dict()),
+                        "help": help_parser().with_id("help"),
+                    }
+                    self._dispatch = compile_parsers(self._parsers)
+                return self._parsers, self._dispatch
 
             @ft.wraps(func)
             def __call__(self, *args: P.args, **kwargs: P.kwargs):
@@ -236,22 +315,22 @@ def command(
 
             @ft.wraps(func)
             def cli(self, argv: list[str] = sys.argv):
-                helptext = self.get_helptext(argv[0])
+                parsers, dispatch = self.get_parsers()
                 try:
                     parsed_list, tail = parse_args(
                         argv[1:],
-                        {
-                            **get_parsers(model_dict),
-                            "help": help_parser().with_id("help"),
-                        },
+                        parsers,
                         terminate_on_unknown=terminate_on_unknown,
                         allow_unknown=unknown,
+                        dispatch=dispatch,
                     )
 
-                    parsed, errors = read_parsers(model_dict, parsed_list, False, False)
+                    parsed, errors = read_parsers(
+                        get_model_dict(), parsed_list, False, False
+                    )
 
                     if errors or isinstance(tail, TailError):
-                        console.print(helptext.with_usage_only())
+                        self.print_help(argv[0], usage_only=True)
                         for error in errors.values():
                             stderr.print(Text.from_ansi(error.msg))
                         if isinstance(tail, TailError):
@@ -273,13 +352,13 @@ def command(
                             args[command_args.name] = argv[0]
 
                         if command_args.helptext is not None:
-                            args[command_args.helptext] = helptext
+                            args[command_args.helptext] = self.get_helptext(argv[0])
                     else:
                         args = parsed
 
                 except (HelpRequest, *exceptions) as err:
                     if isinstance(err, HelpRequest) and not isinstance(err, exceptions):
-                        console.print(helptext)
+                        self.print_help(argv[0])
                         return 0
 
                     args: dict[str, Any] = {}
@@ -296,7 +375,7 @@ def command(
                         args[command_args.name] = argv[0]
 
                     if command_args.helptext is not None:
-                        args[command_args.helptext] = helptext
+                        args[command_args.helptext] = self.get_helptext(argv[0])
                 try:
                     return func(**args) or 0  # type: ignore
                 except CommandError as err:
@@ -0,0 +1,168 @@
+from __future__ import absolute_import, annotations
+
+import shlex
+from pathlib import Path
+from typing import Any, Optional
+
+import attr
+
+import kslurm.args.matchers as matchers
+import kslurm.args.registry as registry
+from kslurm.args.arg import SKIPHELP, Arg, Completion, ParamSet
+from kslurm.args.help_templates import SubcommandTemplate
+from kslurm.args.protocols import WrappedCommand
+
+# Completion sources handled by bash itself. Any other source is read, one word per
+# line, from a file of the same name in the completion cache directory
+BUILTIN_SOURCES = {"file": "-f", "dir": "-d"}
+
+
+@attr.frozen
+class CompletionNode:
+    """Everything that can be completed at one level of a command
+
+    words holds all flags, options, subcommand names, and fixed positional choices.
+    values holds the completion of each option that takes a value, and sources holds
+    the sources completing positional args
+    """
+
+    words: tuple[str, ...] = ()
+    values: dict[str, Optional[str]] = {}
+    sources: tuple[str, ...] = ()
+    subcommands: dict[str, CompletionNode] = {}
+
+
+def _split(complete: Completion) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    if complete is None:
+        return (), ()
+    if isinstance(complete, str):
+        return (), (complete,)
+    return complete, ()
+
+
+def get_node(command: WrappedCommand, name: str) -> CompletionNode:
+    """Build the completion tree of a command by walking its models"""
+    wrapper: Any = getattr(registry.resolve(command), "__self__", None)
+    if not hasattr(wrapper, "get_helptext"):
+        return CompletionNode()
+    words: list[str] = ["-h", "--help"]
+    values: dict[str, Optional[str]] = {}
+    sources: list[str] = []
+    subcommands: dict[str, CompletionNode] = {}
+    for model in wrapper.get_helptext(name).models.values():
+        if model.help is SKIPHELP:
+            continue
+        if isinstance(model, ParamSet):
+            source = model.complete if isinstance(model.complete, str) else None
+            for option in getattr(model.parent.match, "choices", ()):
+                values[option] = source
+            continue
+        if not isinstance(model, Arg):
+            continue
+        match = model.parser.match
+        if isinstance(model.help_template, SubcommandTemplate):
+            for subname, subcommand in model.help_template.commands.items():
+                if not subname.startswith("_"):
+                    subcommands[subname] = get_node(subcommand, f"{name} {subname}")
+        elif isinstance(match, matchers.choice):
+            words.extend(match.choices)
+        elif isinstance(match, matchers.path):
+            sources.append("dir" if match.is_dir else "file")
+        else:
+            fixed, dynamic = _split(model.complete)
+            words.extend(fixed)
+            sources.extend(dynamic)
+    return CompletionNode(
+        words=tuple(dict.fromkeys([*words, *values, *subcommands])),
+        values=values,
+        sources=tuple(dict.fromkeys(sources)),
+        subcommands=subcommands,
+    )
+
+
+def _flatten(node: CompletionNode, path: str):
+    yield path, node
+    for name, subnode in node.subcommands.items():
+        yield from _flatten(subnode, f"{path} {name}")
+
+
+def _assoc(name: str, entries: dict[str, str]):
+    items = "".join(
+        f"\n  [{shlex.quote(key)}]={shlex.quote(value)}"
+        for key, value in entries.items()
+    )
+    return f"declare -gA {name}=({items}\n)"
+
+
+_DRIVER = """
+_kslurm_complete_source () {
+  local file
+  case $1 in
+    %(builtins)s
+    '') ;;
+    *)
+      file="$_kslurm_completion_cache/$1"
+      [[ -r $file ]] && COMPREPLY+=($(compgen -W "$(<"$file")" -- "$2"))
+      ;;
+  esac
+}
+
+_kslurm_complete () {
+  local cur node word source i
+  COMPREPLY=()
+  cur=${COMP_WORDS[COMP_CWORD]}
+  node=${COMP_WORDS[0]##*/}
+  for ((i = 1; i < COMP_CWORD; i++)); do
+    word=${COMP_WORDS[i]}
+    if [[ -n ${_kslurm_values["$node $word"]+x} ]]; then
+      if ((++i == COMP_CWORD)); then
+        _kslurm_complete_source "${_kslurm_values["$node $word"]}" "$cur"
+        return
+      fi
+    elif [[ -n ${_kslurm_words["$node $word"]+x} ]]; then
+      node="$node $word"
+    fi
+  done
+  COMPREPLY=($(compgen -W "${_kslurm_words[$node]}" -- "$cur"))
+  [[ $cur == -* ]] && return
+  for source in ${_kslurm_sources[$node]}; do
+    _kslurm_complete_source "$source" "$cur"
+  done
+}
+"""
+
+
+def bash_script(commands: dict[str, WrappedCommand], cache: Path) -> str:
+    """Render a self-contained bash completion script for the given entrypoints
+
+    The script never calls back into python. Values that change at runtime are read
+    from the files in cache, which must be kept up to date by the commands
+    themselves
+    """
+    words: dict[str, str] = {}
+    values: dict[str, str] = {}
+    sources: dict[str, str] = {}
+    for name, command in commands.items():
+        for path, node in _flatten(get_node(command, name), name):
+            words[path] = " ".join(node.words)
+            if node.sources:
+                sources[path] = " ".join(node.sources)
+            for option, source in node.values.items():
+                values[f"{path} {option}"] = source or ""
+    builtins = "\n    ".join(
+        f'{source}) COMPREPLY+=($(compgen {flag} -- "$2")) ;;'
+        for source, flag in BUILTIN_SOURCES.items()
+    )
+    return "\n".join(
+        [
+            "# bash completion for kslurm, generated by `kslurm completion bash`",
+            f"_kslurm_completion_cache={shlex.quote(str(cache))}",
+            _assoc("_kslurm_words", words),
+            _assoc("_kslurm_values", values),
+            _assoc("_kslurm_sources", sources),
+            _DRIVER % {"builtins": builtins},
+            "complete -o bashdefault -o default -F _kslurm_complete "
+            + " ".join(commands),
+            "",
+        ]
+    )
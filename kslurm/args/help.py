@@ -71,6 +71,9 @@ class HelpText:
     def __rich__(self):
         models = self.models
         script_name = Path(self.script).name
+        # Template rows are collected on the class, so clear out any left over from
+        # previous renders
+        AbstractHelpTemplate.rows.clear()
 
         templates: set[type[AbstractHelpTemplate]] = set()
         usages: dict[type[AbstractHelpTemplate], list[str]] = DefaultDict(list)
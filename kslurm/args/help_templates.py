@@ -4,16 +4,21 @@ import itertools as it
 from typing import Any, Optional, Union
 
 import attr
-import docstring_parser as doc
 import more_itertools as itx
 from rich.text import Text
-from tabulate import tabulate
 from typing_extensions import Self
 
+from kslurm.args import introspection, registry
 from kslurm.args.arg import AbstractHelpTemplate, HelpRow
 from kslurm.args.protocols import WrappedCommand
 
 
+def _short_description(func: WrappedCommand) -> str:
+    import docstring_parser as doc
+
+    return doc.parse(func.__doc__ or "").short_description or ""
+
+
 @attr.frozen
 class ShapeArg(AbstractHelpTemplate):
     title = "Shape Args"
@@ -102,15 +107,20 @@ class SubcommandTemplate(AbstractHelpTemplate):
     @property
     def command_list(self):
         return (
-            [
-                name,
-                doc.parse(func.__doc__ or "").short_description or "",
-            ]
+            [name, self._describe(registry.resolve(func))]
             for name, func in self.commands.items()
         )
 
+    @staticmethod
+    def _describe(func: WrappedCommand) -> str:
+        return introspection.cached(
+            func, "short-description", lambda: _short_description(func)
+        )
+
     @property
     def help(self):
+        from tabulate import tabulate
+
         return tabulate(list(self.command_list), tablefmt="plain")
         # t = Table.grid(padding=(0, 2), expand=True)
         # for _ in range(2):
@@ -19,10 +19,9 @@ from typing import (
 )
 
 import attr
-import docstring_parser as docparse
 import more_itertools as itx
 
-from kslurm.args import actions
+from kslurm.args import actions, introspection
 from kslurm.args.arg import (
     Arg,
     Helpable,
@@ -200,12 +199,25 @@ def _parse_description(desc: str):
     return helptxt, meta
 
 
+def _get_model_docs(models: ModelType) -> dict[str, tuple[str, dict[str, Any]]]:
+    import docstring_parser as docparse
+
+    doc = docparse.parse(models.__doc__ or "")
+    return {
+        arg.arg_name: _parse_description(arg.description or "") for arg in doc.params
+    }
+
+
+def get_model_docs(models: ModelType) -> dict[str, tuple[str, dict[str, Any]]]:
+    """Get the help text and metadata of each attribute documented on the model"""
+    return introspection.cached(models, "model-docs", lambda: _get_model_docs(models))
+
+
 def get_arg_dict(models: ModelType) -> ModelDict:
     if not attr.has(models):
         raise TypeError(f"{type(models)} is not a supported object for arg models")
 
-    doc = docparse.parse(models.__doc__ or "")
-    arghelps = {arg.arg_name: arg for arg in doc.params}
+    arghelps = get_model_docs(models)
     fields = attr.fields(models)
     result: ModelDict = {}
     for field in fields:
@@ -253,7 +265,7 @@ def get_arg_dict(models: ModelType) -> ModelDict:
             updates["optional"] = True
 
         if field.name in arghelps:
-            desc, meta = _parse_description(arghelps[field.name].description or "")
+            desc, meta = arghelps[field.name]
             if "name" in meta:
                 updates["name"] = meta["name"]
             if isinstance(default, Helpable):
@@ -0,0 +1,116 @@
+from __future__ import absolute_import, annotations
+
+import functools as ft
+import json
+import os
+import sys
+import tempfile
+import types
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, TypeVar
+
+import kslurm
+from kslurm.appcache import CACHE_PATH
+from kslurm.utils import get_hash
+
+T = TypeVar("T")
+
+INTROSPECTION_CACHE = CACHE_PATH / "introspection"
+
+# Cache files loaded in this process, indexed by source file
+_loaded: dict[str, dict[str, Any]] = {}
+
+
+@ft.cache
+def _version() -> str:
+    # importlib.metadata takes longer to import than the cache saves, so read the
+    # version straight from the name of our dist-info folder
+    site = Path(kslurm.__file__).parent.parent
+    try:
+        for entry in os.scandir(site):
+            if entry.name.startswith("kslurm-") and entry.name.endswith(".dist-info"):
+                return entry.name[len("kslurm-") : -len(".dist-info")]
+    except OSError:
+        pass
+    return "dev"
+
+
+def _source_file(obj: Any) -> Optional[str]:
+    if isinstance(obj, types.ModuleType):
+        return getattr(obj, "__file__", None)
+    module = sys.modules.get(getattr(obj, "__module__", None) or "")
+    return getattr(module, "__file__", None)
+
+
+def _cache_path(source: str):
+    return INTROSPECTION_CACHE / f"{get_hash(source)}.json"
+
+
+def _file_hash(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return get_hash(f.read())
+    except OSError:
+        return None
+
+
+def _load(source: str) -> dict[str, Any]:
+    if source in _loaded:
+        return _loaded[source]
+    key = None if (digest := _file_hash(source)) is None else f"{digest}-{_version()}"
+    try:
+        with _cache_path(source).open("r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    if key is None or data.get("key") != key:
+        data = {"key": key, "entries": {}}
+    _loaded[source] = data
+    return data
+
+
+def _write(source: str, data: dict[str, Any]):
+    if data["key"] is None:
+        return
+    try:
+        INTROSPECTION_CACHE.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=INTROSPECTION_CACHE, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, _cache_path(source))
+    except OSError:
+        pass
+
+
+def cached(
+    obj: Any, kind: str, compute: Callable[[], T], related: Iterable[Any] = ()
+) -> T:
+    """Get introspection data about obj, computing it only if not cached on disk
+
+    Entries are stored per source file of the module defining obj, keyed by the hash
+    of that file and the kslurm version, so any edit to the source invalidates all
+    entries derived from it. Docstrings can be assigned from other modules at
+    runtime, so entries are additionally keyed by the hash of obj's docstring.
+    Objects or modules from other modules that the data depends on can be given as
+    related, in which case their source files are hashed into the entry as well.
+    Computed values must be json serializable, and should not rely on tuples
+    surviving the round trip.
+    """
+    source = _source_file(obj)
+    if source is None:
+        return compute()
+    data = _load(source)
+    name = ":".join(
+        [kind, getattr(obj, "__qualname__", ""), get_hash(obj.__doc__ or "")]
+    )
+    related_sources = {
+        other for other in map(_source_file, related) if other not in {None, source}
+    }
+    if related_sources:
+        name += ":" + get_hash(
+            ",".join(str(_file_hash(other)) for other in sorted(related_sources))
+        )
+    if name not in data["entries"]:
+        data["entries"][name] = compute()
+        _write(source, data)
+    return data["entries"][name]
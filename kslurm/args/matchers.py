@@ -2,12 +2,11 @@ from __future__ import absolute_import
 
 import abc
 import re
-from pathlib import Path
-from typing import Any, Callable, Literal, Optional, overload
+from typing import Any, Optional
 
 import attrs
 
-from kslurm.args.arg import Context, Parser
+from kslurm.args.arg import Context, FsProbe, Parser
 
 
 class BasicMatcher(abc.ABC):
@@ -15,8 +14,12 @@ class BasicMatcher(abc.ABC):
     max_len: Optional[int] = None
 
     def __call__(self, arg: str, param: Parser[Any], context: Context):
+        return self.accepts(param) and self.test_in(arg, context)
+
+    def accepts(self, param: Parser[Any]) -> bool:
+        """Check if param can take another value, independent of the arg tested"""
         if param.value is None and param.validation_err is None:
-            return self.test(arg)
+            return True
         if not self.duplicates:
             return False
         if self.max_len is not None:
@@ -25,12 +28,16 @@ class BasicMatcher(abc.ABC):
                     return False
             except KeyError:
                 pass
-        return self.test(arg)
+        return True
 
     @abc.abstractmethod
     def test(self, arg: str) -> bool:
         raise NotImplementedError()
 
+    def test_in(self, arg: str, context: Context) -> bool:
+        """Test arg as part of a parse, sharing any lookups cached in context"""
+        return self.test(arg)
+
     def settings(self, duplicates: bool = False, max_len: Optional[int] = None):
         self.duplicates = duplicates
         self.max_len = max_len
@@ -58,10 +65,17 @@ class path(BasicMatcher):
     is_dir: bool = False
 
     def test(self, arg: str):
-        is_path = "/" in arg and Path(arg).exists()
+        return self.probe(arg, FsProbe())
+
+    def test_in(self, arg: str, context: Context):
+        return self.probe(arg, context.fs)
+
+    def probe(self, arg: str, fs: FsProbe):
+        if "/" not in arg:
+            return False
         if self.is_dir:
-            return is_path and Path(arg).is_dir()
-        return is_path
+            return fs.is_dir(arg)
+        return fs.exists(arg)
 
 
 class everything(BasicMatcher):
@@ -69,36 +83,33 @@ class everything(BasicMatcher):
         return True
 
 
-@overload
-def option_chain(
-    initializer: str, number: Literal[1], matcher: BasicMatcher
-) -> Callable[[str, Parser[Any], Context], bool]:
-    ...
-
+@attrs.frozen
+class option_chain:
+    """Match args immediately following the initializer parser
 
-@overload
-def option_chain(
-    initializer: str, number: Optional[int], matcher: BasicMatcher
-) -> Callable[[str, Parser[list[Any]], Context], bool]:
-    ...
+    If number is 1, only the arg directly after the initializer is matched. Otherwise,
+    up to number args (or unlimited, if None) are matched in sequence
+    """
 
+    initializer: str
+    number: Optional[int]
+    matcher: BasicMatcher
 
-def option_chain(initializer: str, number: Optional[int], matcher: BasicMatcher) -> Any:
-    def inner_single(arg: str, _: Parser[Any], context: Context):
-        if context.last_matched is not None and context.last_matched.id == initializer:
-            return matcher.test(arg)
-        return False
+    def follows(self, id: str) -> list[str]:
+        """List the ids of parsers after which this chain may match"""
+        if self.number == 1:
+            return [self.initializer]
+        return [self.initializer, id]
 
-    def inner_chain(arg: str, param: Parser[list[Any]], context: Context):
-        if (
-            context.last_matched is not None
-            and context.last_matched.id in [initializer, param.id]
-            and (number is None or len(param.value or []) <= number)
+    def __call__(self, arg: str, param: Parser[Any], context: Context):
+        if context.last_matched is None:
+            return False
+        if self.number == 1:
+            if context.last_matched.id == self.initializer:
+                return self.matcher.test_in(arg, context)
+            return False
+        if context.last_matched.id in [self.initializer, param.id] and (
+            self.number is None or len(param.value or []) <= self.number
         ):
-            return matcher.test(arg)
+            return self.matcher.test_in(arg, context)
         return False
-
-    if number == 1:
-        return inner_single
-    else:
-        return inner_chain
@@ -1,23 +1,196 @@
 from __future__ import absolute_import, annotations
 
-from copy import copy
-from typing import Any, Iterable, TypeVar, Union
+import re
+from collections import ChainMap
+from typing import Any, Iterable, Optional, TypeVar, Union, cast
 
-from kslurm.args.arg import Arg, Context, Parser
-from kslurm.exceptions import TailError
+import attr
+
+import kslurm.args.matchers as matchers
+from kslurm.args.arg import Arg, Context, FsProbe, Parser, _invalid_value_err
+from kslurm.exceptions import TailError, ValidationError
 
 T = TypeVar("T", bound=Union[dict[str, Arg[Any]], type])
 S = TypeVar("S")
 
+# Patterns using backreferences or global inline flags can't be safely merged into
+# the combined shape regex, as they would change meaning once concatenated
+_UNMERGEABLE = re.compile(r"\\[1-9]|\(\?P=|^\(\?[aiLmsux]+\)")
+
+
+# Upper bound on the number of distinct fragments memoized by a DispatchTable
+_CANDIDATE_CACHE_SIZE = 4096
+
+Candidate = tuple[int, str, bool]
+
+
+@attr.frozen
+class DispatchTable:
+    """Precompiled lookup structure for matching fragments to parsers
+
+    Choice matchers are indexed by their exact keywords, string regex matchers are
+    merged into a single pattern, and option chains are indexed by the parsers they
+    follow, so only parsers that could possibly match a fragment are visited. All
+    other matchers are tested in priority order as fallbacks. Candidates found
+    through the keyword and shape indices are already known to match the fragment,
+    so only the parser state needs to be checked.
+
+    Candidates are returned as (rank, id, pretested) tuples, sorted by rank
+    """
+
+    rank: dict[str, int]
+    keywords: dict[str, tuple[str, ...]]
+    shapes: Optional[re.Pattern[str]]
+    shape_groups: dict[str, str]
+    follows: dict[str, tuple[Candidate, ...]]
+    fallback: tuple[Candidate, ...]
+    _cache: dict[str, tuple[Candidate, ...]] = attr.field(factory=dict, init=False)
+
+    def candidates(
+        self, fragment: str, last_matched: Optional[str] = None
+    ) -> tuple[Candidate, ...]:
+        if (base := self._cache.get(fragment)) is None:
+            base = self._lookup(fragment)
+            if len(self._cache) >= _CANDIDATE_CACHE_SIZE:
+                self._cache.clear()
+            self._cache[fragment] = base
+        if last_matched is not None and last_matched in self.follows:
+            # Both runs are already sorted by rank, so this is effectively a merge
+            return tuple(sorted([*self.follows[last_matched], *base]))
+        return base
+
+    def _lookup(self, fragment: str):
+        hits = [(self.rank[id], id, True) for id in self.keywords.get(fragment, ())]
+        if self.shapes is not None and (match := self.shapes.match(fragment)):
+            hits.extend(
+                (self.rank[id], id, True)
+                for group, id in self.shape_groups.items()
+                if match.group(group) is not None
+            )
+        if not hits:
+            return self.fallback
+        return tuple(sorted([*hits, *self.fallback]))
+
+
+def compile_parsers(parsers: dict[str, Parser[Any]]) -> DispatchTable:
+    ordered = sorted(parsers.values(), key=lambda param: param.priority, reverse=True)
+    keywords: dict[str, list[str]] = {}
+    shapes: dict[str, str] = {}
+    follows: dict[str, list[str]] = {}
+    fallback: list[str] = []
+    for parser in ordered:
+        match = parser.match
+        if isinstance(match, matchers.choice):
+            for keyword in match.choices:
+                keywords.setdefault(keyword, []).append(parser.id)
+        elif (
+            isinstance(match, matchers.regex)
+            and isinstance(match.pattern, str)
+            and not _UNMERGEABLE.search(match.pattern)
+        ):
+            shapes[parser.id] = match.pattern
+        elif isinstance(match, matchers.option_chain):
+            for predecessor in match.follows(parser.id):
+                follows.setdefault(predecessor, []).append(parser.id)
+        else:
+            fallback.append(parser.id)
+
+    shape_groups = {f"_{i}": id for i, id in enumerate(shapes)}
+    try:
+        combined = (
+            re.compile(
+                "".join(
+                    f"(?:(?=(?P<{group}>{shapes[id]})))?"
+                    for group, id in shape_groups.items()
+                )
+            )
+            if shapes
+            else None
+        )
+    except re.error:
+        # Fall back to testing each pattern individually
+        combined = None
+        shape_groups = {}
+        untested = {*shapes, *fallback}
+        fallback = [parser.id for parser in ordered if parser.id in untested]
+
+    rank = {parser.id: i for i, parser in enumerate(ordered)}
+    return DispatchTable(
+        rank=rank,
+        keywords={keyword: tuple(ids) for keyword, ids in keywords.items()},
+        shapes=combined,
+        shape_groups=shape_groups,
+        follows={
+            predecessor: tuple((rank[id], id, False) for id in ids)
+            for predecessor, ids in follows.items()
+        },
+        fallback=tuple((rank[id], id, False) for id in fallback),
+    )
+
+
+class _ParseState:
+    """Mutable stand-in for a Parser while args are being matched
+
+    Exposes the same attributes as Parser, so matchers and actions can treat it as
+    one, but values are updated in place rather than evolving a new frozen Parser
+    for every matched token. States are only created for parsers that actually
+    receive a value, and are frozen back into Parsers once parsing is complete
+    """
+
+    __slots__ = (
+        "parser",
+        "id",
+        "priority",
+        "match",
+        "action",
+        "terminal",
+        "value",
+        "raw_value",
+        "validation_err",
+    )
+
+    def __init__(self, parser: Parser[Any]):
+        self.parser = parser
+        self.id = parser.id
+        self.priority = parser.priority
+        self.match = parser.match
+        self.action = parser.action
+        self.terminal = parser.terminal
+        self.value = parser.value
+        self.raw_value = parser.raw_value
+        self.validation_err = parser.validation_err
+
+    def update(self, value: str, context: Context):
+        try:
+            self.value = self.action(value, cast("Parser[Any]", self), context)
+        except ValidationError as err:
+            self.validation_err = _invalid_value_err(err)
+            return
+        # raw_value is shared with the original parser until the first update
+        if self.raw_value is self.parser.raw_value:
+            self.raw_value = [*self.raw_value, value]
+        else:
+            self.raw_value.append(value)
+
+    def freeze(self) -> Parser[Any]:
+        return attr.evolve(
+            self.parser,
+            value=self.value,
+            raw_value=self.raw_value,
+            validation_err=self.validation_err,
+        )
+
 
 def parse_args(
     args: Iterable[str],
     models: dict[str, Parser[Any]],
     allow_unknown: bool = True,
     terminate_on_unknown: bool = True,
+    dispatch: Optional[DispatchTable] = None,
+    fs: Optional[FsProbe] = None,
 ):
 
-    parsed, tail = _match_args(args, models, terminate_on_unknown)
+    parsed, tail = _match_args(args, models, terminate_on_unknown, dispatch, fs)
 
     if tail and not allow_unknown:
         tail = TailError(f"{tail} does not match any args")
@@ -29,43 +202,47 @@ def _match_args(
     args: Iterable[str],
     parsers: dict[str, Parser[Any]],
     terminate_on_unknown: bool = True,
+    dispatch: Optional[DispatchTable] = None,
+    fs: Optional[FsProbe] = None,
 ):
-
-    updated_params = copy(parsers)
+    states: dict[str, _ParseState] = {}
     terminated = False
 
     tail: list[str] = []
 
-    sorted_params = [
-        parser.id
-        for parser in sorted(
-            parsers.values(), key=lambda param: param.priority, reverse=True
-        )
-    ]
+    table = dispatch if dispatch is not None else compile_parsers(parsers)
     arg_list = list(args)
-    last_match = None
+    context = Context(
+        args=arg_list,
+        current_arg=0,
+        params=cast("dict[str, Parser[Any]]", ChainMap(states, parsers)),
+        last_matched=None,
+        fs=fs if fs is not None else FsProbe(),
+    )
     for i, arg in enumerate(arg_list):
         if terminated:
             tail.append(arg)
             continue
+        context.current_arg = i
         next_fragment = arg
         while isinstance(next_fragment, str):
             fragment: str = next_fragment
 
-            context = Context(
-                args=arg_list,
-                current_arg=i,
-                params=updated_params,
-                last_matched=last_match,
-            )
             matched_arg = False
-            for id in sorted_params:
-                parser = updated_params[id]
-                if next_fragment := parser.match(fragment, parser, context):
-                    updated_params[id] = parser.with_value(fragment, context)
-                    if parser.terminal:
+            last_id = None if context.last_matched is None else context.last_matched.id
+            for _, id, tested in table.candidates(fragment, last_id):
+                parser: Any = states[id] if id in states else parsers[id]
+                if tested:
+                    next_fragment = parser.match.accepts(parser)
+                else:
+                    next_fragment = parser.match(fragment, parser, context)
+                if next_fragment:
+                    if (state := states.get(id)) is None:
+                        state = states[id] = _ParseState(parsers[id])
+                    state.update(fragment, context)
+                    if state.terminal:
                         terminated = True
-                    last_match = updated_params[parser.id]
+                    context.last_matched = cast("Parser[Any]", state)
                     matched_arg = True
                     break
             if not matched_arg:
@@ -74,4 +251,7 @@ def _match_args(
                 if terminate_on_unknown:
                     terminated = True
 
-    return updated_params, tail
+    return {
+        id: states[id].freeze() if id in states else parser
+        for id, parser in parsers.items()
+    }, tail
@@ -18,6 +18,9 @@ class Command(Protocol, Generic[P]):
     def get_helptext(self, entrypoint: str) -> HelpText:
         ...
 
+    def print_help(self, entrypoint: str, usage_only: bool = ...) -> None:
+        ...
+
     def __call__(self, *args: P.args, **kwargs: P.kwargs) -> int:
         ...
 
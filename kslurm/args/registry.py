@@ -0,0 +1,56 @@
+from __future__ import absolute_import, annotations
+
+import importlib
+import sys
+from typing import Any, Optional
+
+from kslurm.args.protocols import WrappedCommand
+
+
+def _get_cli(command: Any) -> WrappedCommand:
+    return command.cli if hasattr(command, "cli") else command
+
+
+class LazyCommand:
+    """Reference to a command by import path, only imported once called
+
+    Paths are written as "package.module:attribute", where attribute is either a
+    command or a plain cli function
+    """
+
+    def __init__(self, path: str):
+        module, sep, name = path.partition(":")
+        if not sep or not module or not name:
+            raise ValueError(
+                f"Invalid command path '{path}'. Must be written as 'module:attribute'"
+            )
+        self.path = path
+        self._module = module
+        self._name = name
+        self._resolved: Optional[WrappedCommand] = None
+
+    def resolve(self) -> WrappedCommand:
+        if self._resolved is None:
+            module = importlib.import_module(self._module)
+            self._resolved = _get_cli(getattr(module, self._name))
+        return self._resolved
+
+    def __call__(self, argv: list[str] = sys.argv) -> int:
+        return self.resolve()(argv)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}: '{self.path}'>"
+
+
+def get_command(command: Any) -> WrappedCommand:
+    """Convert a command, plain cli function, or import path into a cli function"""
+    if isinstance(command, str):
+        return LazyCommand(command)
+    return _get_cli(command)
+
+
+def resolve(command: WrappedCommand) -> WrappedCommand:
+    """Get the underlying cli function of a possibly lazy command"""
+    if isinstance(command, LazyCommand):
+        return command.resolve()
+    return command
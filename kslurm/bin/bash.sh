@@ -3,6 +3,15 @@ if [[ -z $KSLURM_COMPUTE_NODES ]]; then
   export KSLURM_COMPUTE_NODES=$(sinfo -N -h -o "%N" | uniq)
 fi
 
+_kslurm_run () {
+  # Run kslurm commands through the kslurm daemon if the client is installed
+  if command -v kslurm-client &> /dev/null; then
+    kslurm-client "$@"
+  else
+    command "$@"
+  fi
+}
+
 pip () {
   local installing installtype cmd pipdir wheelhouse
   [[ $1 == install || $1 == uninstall ]] && installing=1 || installing=
@@ -13,7 +22,7 @@ pip () {
   fi
   if [[ -n $installtype ]]; then
     if command -v kslurm &> /dev/null; then
-      pipdir=$(kslurm config pipdir)
+      pipdir=$(_kslurm_run kslurm config pipdir)
       if [[ -z $pipdir ]]; then
         echo "pipdir has not been defined. Please set a pipdir using \`kslurm config pipdir <directory>\`. Typically, this should be a directory in a project space or permanent storage directory."
       else
@@ -1,12 +1,30 @@
+_kslurm_run () {
+  # Run kslurm commands through the kslurm daemon if the client is installed
+  if command -v kslurm-client &> /dev/null; then
+    kslurm-client "$@"
+  else
+    command "$@"
+  fi
+}
+
 _kpy_update_prompt() {
     if command -v kpy &> /dev/null; then
-      local newname=$(kpy _refresh)
+      local newname=$(_kslurm_run kpy _refresh)
       if [[ -z "${VIRTUAL_ENV_DISABLE_PROMPT-}" && -n "${newname}" ]]; then
         export PS1="($newname) ${_OLD_VIRTUAL_PS1-}"
       fi
     fi
 }
 
+_kpy_unmount_on_exit() {
+    # Unmount the venv images loaded by this shell when it exits, keeping any exit
+    # trap already set
+    [[ -n "${_kpy_unmount_trap-}" ]] && return
+    _kpy_unmount_trap=1
+    eval "set -- $(trap -p EXIT)"
+    trap "command kpy _unmount${3:+; $3}" EXIT
+}
+
 kpy () {
     if [[ $1 == load || $1 == activate || $1 == create ]]; then
       IFS='|'
@@ -8,8 +8,17 @@ else
 	use_light=0
 fi
 
-export NEUROGLIA_DIR=$(kslurm neuroglia-helpers --src-dir)
-cfg_profile=$(kslurm config neuroglia_profile)
+_kslurm_run () {
+  # Run kslurm commands through the kslurm daemon if the client is installed
+  if command -v kslurm-client &> /dev/null; then
+    kslurm-client "$@"
+  else
+    command "$@"
+  fi
+}
+
+export NEUROGLIA_DIR=$(_kslurm_run kslurm neuroglia-helpers --src-dir)
+cfg_profile=$(_kslurm_run kslurm config neuroglia_profile)
 
 if [ "$use_light" = 0 ]; then
 	echo "***"
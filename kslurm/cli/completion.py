@@ -0,0 +1,26 @@
+from __future__ import absolute_import
+
+from kslurm.args import choice, command
+
+
+@command(inline=True)
+def completion(shell: str = choice(["bash"], help="Shell to generate completion for")):
+    """Print a shell completion script for all kslurm commands
+
+    The script is static, so completing commands doesn't start python. Save it to a
+    file and source it from your shell config, e.g.
+
+        kslurm completion bash > ~/.kslurm-completion.bash
+        echo "source ~/.kslurm-completion.bash" >> ~/.bashrc
+
+    Regenerate the script after upgrading kslurm.
+    """
+    from kslurm.appcache import COMPLETION_CACHE
+    from kslurm.args import registry
+    from kslurm.args.completion import bash_script
+    from kslurm.daemon.client import ENTRYPOINTS
+    from kslurm.models import job_templates
+
+    job_templates.update_completion()
+    commands = {name: registry.get_command(path) for name, path in ENTRYPOINTS.items()}
+    print(bash_script(commands, COMPLETION_CACHE), end="")
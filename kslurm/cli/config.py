@@ -4,9 +4,6 @@ import re
 import subprocess as sp
 from typing import Any, DefaultDict
 
-from InquirerPy import inquirer as inq  # type: ignore
-from InquirerPy.base import Choice  # type: ignore
-
 import kslurm.appconfig as appconfig
 from kslurm.args import flag, positional
 from kslurm.args.command import CommandError, command
@@ -19,6 +16,9 @@ class InteractiveConfigError(CommandError):
 def _get_account_type(
     accounts: dict[str, set[str]], levelfs: dict[str, str], label: str
 ) -> str:
+    from InquirerPy import inquirer as inq  # type: ignore
+    from InquirerPy.base import Choice  # type: ignore
+
     choices: list[Any] = [
         Choice(account, f"{account} (LevelFS: {levelfs[account + '_' + label]})")
         for account, types in accounts.items()
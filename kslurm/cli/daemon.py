@@ -0,0 +1,106 @@
+from __future__ import absolute_import
+
+import os
+import subprocess as sp
+import sys
+import time
+from typing import Optional
+
+import attrs
+
+from kslurm.args import Subcommand, flag, keyword, subcommand
+from kslurm.args.command import CommandError, command
+from kslurm.daemon import client
+
+
+def _idle_timeout(value: Optional[int]):
+    if value is not None:
+        return value
+    from kslurm.appconfig import Config
+    from kslurm.daemon.server import DEFAULT_IDLE_TIMEOUT
+
+    return int(Config().get("daemon.idle_timeout") or DEFAULT_IDLE_TIMEOUT)
+
+
+@command(inline=True)
+def _start(
+    idle_timeout: int = keyword(
+        ["--idle-timeout", "-t"],
+        default=None,
+        help="Seconds without requests before the daemon shuts down. Defaults to the "
+        "daemon.idle_timeout config value, or 30 min",
+    ),
+    foreground: bool = flag(["--foreground"], help="Run the daemon in this process"),
+):
+    """Start the kslurm daemon
+
+    The daemon keeps kslurm loaded in memory, so commands run with kslurm-client
+    start without importing kslurm. Commands fall back to running normally whenever
+    the daemon isn't running.
+    """
+    timeout = _idle_timeout(idle_timeout)
+    if foreground:
+        from kslurm.daemon.server import DaemonRunning, serve
+
+        try:
+            serve(timeout)
+        except DaemonRunning as err:
+            raise CommandError(str(err))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if client.control("ping") is not None:
+        raise CommandError("kslurm daemon is already running")
+    os.makedirs(client.socket_dir(), mode=0o700, exist_ok=True)
+    log = os.path.join(client.socket_dir(), "daemon.log")
+    with open(log, "a") as f:
+        sp.Popen(
+            [sys.executable, "-m", "kslurm.daemon.server", str(timeout)],
+            stdin=sp.DEVNULL,
+            stdout=f,
+            stderr=f,
+            start_new_session=True,
+        )
+    for _ in range(100):
+        if (reply := client.control("ping")) is not None:
+            print(f"kslurm daemon started (pid {reply['pid']})")
+            return
+        time.sleep(0.05)
+    raise CommandError(f"kslurm daemon failed to start. See {log} for details")
+
+
+@command
+def _stop():
+    """Stop the kslurm daemon"""
+    if client.control("stop") is None:
+        print("kslurm daemon is not running")
+
+
+@command
+def _status():
+    """Check if the kslurm daemon is running"""
+    if (reply := client.control("ping")) is None:
+        print("kslurm daemon is not running")
+        return 1
+    outdated = " (outdated)" if reply.get("stamp") != client.stamp() else ""
+    print(f"kslurm daemon is running (pid {reply['pid']}){outdated}")
+
+
+@attrs.frozen
+class _DaemonModel:
+    command: Subcommand = subcommand(
+        commands={
+            "start": _start.cli,
+            "stop": _stop.cli,
+            "status": _status.cli,
+        },
+    )
+
+
+@command
+def daemon(cmd_name: str, args: _DaemonModel, tail: list[str]):
+    """Manage the kslurm daemon used by kslurm-client"""
+    name, func = args.command
+    entry = f"{cmd_name} {name}"
+    return func([entry, *tail])
@@ -0,0 +1,160 @@
+from __future__ import absolute_import
+
+import csv
+import sys
+from typing import TYPE_CHECKING, Iterable, Optional
+
+import attrs
+
+from kslurm.args import flag, keyword
+from kslurm.args.command import CommandError, command
+from kslurm.exceptions import ValidationError
+
+if TYPE_CHECKING:
+    from kslurm.slurm.efficiency import JobUsage
+
+_PER_JOB_FIELDS = [
+    "jobid",
+    "name",
+    "state",
+    "cpus",
+    "elapsed",
+    "timelimit",
+    "cpu_time",
+    "req_mem",
+    "max_rss",
+    "cpu_efficiency",
+    "mem_efficiency",
+    "time_efficiency",
+]
+
+
+_GROUPINGS = ["name", "template"]
+
+
+def _grouping(value: str):
+    if value not in _GROUPINGS:
+        raise ValidationError(f"--by must be one of {', '.join(_GROUPINGS)}")
+    return value
+
+
+@attrs.frozen
+class _EfficiencyModel:
+    """
+    Attributes:
+        start:
+            Report jobs that ran after this time, in any format accepted by sacct
+            (e.g. 2022-05-01, now-7days)
+
+        end:
+            Report jobs that ran before this time
+
+        by:
+            Group jobs by their name, or by the template they were submitted with
+            (for jobs submitted by kbatch)
+
+        per_job:
+            Report the efficiency of each job rather than of each group
+
+        csv:
+            Print comma separated values rather than a table
+    """
+
+    start: Optional[str] = keyword(["--start", "-S"], default=None)
+    end: Optional[str] = keyword(["--end", "-E"], default=None)
+    by: str = keyword(
+        ["--by"], default="name", format=_grouping, complete=tuple(_GROUPINGS)
+    )
+    per_job: bool = flag(["--per-job"])
+    csv: bool = flag(["--csv"])
+
+
+def _percent(value: Optional[float]):
+    return "" if value is None else f"{value:.0%}"
+
+
+def _quantile_name(q: int):
+    return "max" if q == 100 else f"p{q}"
+
+
+@command
+def efficiency(args: _EfficiencyModel, jobids: list[str]):
+    """Report how efficiently jobs used the cpus, memory and time they requested
+
+    Jobs are given by id, or selected with --start and --end (by default, jobs since
+    midnight). Usage is read with a single call to sacct. For each group of jobs,
+    the median (p50), 90th percentile (p90) and maximum of each efficiency are
+    reported, where memory efficiency compares peak memory use with the memory
+    requested.
+    """
+    from kslurm.slurm import efficiency as eff
+
+    usages = eff.sacct_usage(jobids, args.start, args.end)
+    try:
+        if args.per_job:
+            _print_jobs(usages, args.csv)
+            return
+        if args.by == "template":
+            from kslurm.slurm.jobs import JobRegistry
+
+            registry = JobRegistry()
+            templates = {r.jobid: r.template for r in registry.query()}
+            registry.close()
+            summaries = eff.summarize(usages, eff.by_template(templates))
+        else:
+            summaries = eff.summarize(usages, eff.by_name)
+    except OSError as err:
+        raise CommandError(str(err))
+
+    headers = [args.by.capitalize(), "Jobs"] + [
+        f"{figure} {_quantile_name(q)}"
+        for figure in ["CPU", "Mem", "Time"]
+        for q in eff.PERCENTILES
+    ]
+    rows = [
+        [
+            summary.group,
+            summary.jobs,
+            *(
+                _percent(figures.get(q))
+                for figures in [summary.cpu, summary.mem, summary.time]
+                for q in eff.PERCENTILES
+            ),
+        ]
+        for summary in summaries
+    ]
+    if args.csv:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(headers)
+        writer.writerows(rows)
+        return
+    if not rows:
+        print("No finished jobs found")
+        return
+    from tabulate import tabulate
+
+    print(tabulate(rows, headers=headers, tablefmt="presto"))
+
+
+def _print_jobs(usages: Iterable["JobUsage"], as_csv: bool):
+    """Print the efficiency of each job as soon as it's read"""
+    if as_csv:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(_PER_JOB_FIELDS)
+        for usage in usages:
+            values = [getattr(usage, field) for field in _PER_JOB_FIELDS]
+            writer.writerow(["" if value is None else value for value in values])
+        return
+    row = "{:<16} {:<24} {:<14} {:>5} {:>5} {:>5}"
+    print(row.format("JobID", "Name", "State", "CPU", "Mem", "Time"))
+    for usage in usages:
+        print(
+            row.format(
+                usage.jobid,
+                usage.name[:24],
+                usage.state,
+                _percent(usage.cpu_efficiency),
+                _percent(usage.mem_efficiency),
+                _percent(usage.time_efficiency),
+            )
+        )
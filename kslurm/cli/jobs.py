@@ -0,0 +1,182 @@
+from __future__ import absolute_import
+
+import json
+import os
+from typing import Optional
+
+import attrs
+
+from kslurm.args import flag, keyword
+from kslurm.args.command import CommandError, command
+
+# Width beyond which commands are truncated in the table of jobs
+_COMMAND_WIDTH = 48
+
+
+@attrs.frozen
+class _JobsModel:
+    """
+    Attributes:
+        state:
+            Only list jobs in this state (e.g. running, completed, failed)
+
+        here:
+            Only list jobs submitted from the current directory
+
+        limit:
+            Maximum number of jobs to list
+
+        no_refresh:
+            List the states last recorded instead of querying sacct
+
+        json:
+            Print each job as a line of json, including all of its recorded details
+    """
+
+    state: Optional[str] = keyword(["--state", "-s"], default=None)
+    here: bool = flag(["--here"])
+    limit: int = keyword(["--limit", "-n"], default=20, format=int)
+    no_refresh: bool = flag(["--no-refresh"])
+    json: bool = flag(["--json"])
+
+
+@attrs.frozen
+class _WaitModel:
+    """
+    Attributes:
+        interval:
+            Seconds before checking on the jobs the first time. The interval doubles
+            after each check
+
+        max_interval:
+            Maximum number of seconds between checks
+
+        timeout:
+            Stop waiting after this many seconds, exiting with 124 if any jobs are
+            still queued or running
+
+        quiet:
+            Don't report jobs as they finish
+    """
+
+    interval: float = keyword(["--interval"], default=5.0, format=float)
+    max_interval: float = keyword(["--max-interval"], default=300.0, format=float)
+    timeout: Optional[float] = keyword(["--timeout"], default=None, format=float)
+    quiet: bool = flag(["--quiet", "-q"])
+
+
+def _truncate(text: str, width: int = _COMMAND_WIDTH):
+    return text if len(text) <= width else text[: width - 3] + "..."
+
+
+@command
+def jobs(args: _JobsModel, jobids: list[str]):
+    """List jobs submitted by kbatch, most recent first
+
+    Job ids may be given to list only those jobs. The states of jobs still queued or
+    running are refreshed with a single call to sacct.
+    """
+    from tabulate import tabulate
+
+    from kslurm.slurm.jobs import ACTIVE_STATES, JobRegistry
+
+    states = [args.state.upper()] if args.state else []
+    limit = args.limit if args.limit > 0 else None
+    refresh = not args.no_refresh
+    registry = JobRegistry()
+    records = registry.query(
+        jobids=jobids,
+        # Active jobs may have entered the requested state since last refreshed
+        states=[*states, *ACTIVE_STATES] if states and refresh else states,
+        cwd=os.getcwd() if args.here else None,
+        limit=None if states and refresh else limit,
+    )
+    if refresh:
+        records = registry.refresh(records)
+    registry.close()
+    if states and refresh:
+        records = [r for r in records if (r.state or "PENDING") in states][:limit]
+
+    if args.json:
+        for record in records:
+            print(json.dumps(attrs.asdict(record)))
+        return
+    if not records:
+        print("No jobs found")
+        return
+    print(
+        tabulate(
+            [
+                [
+                    record.jobid,
+                    record.state or "PENDING",
+                    record.exit_code or "",
+                    record.submitted.replace("T", " "),
+                    record.elapsed or "",
+                    _truncate(record.command),
+                ]
+                for record in records
+            ],
+            headers=["JobID", "State", "Exit", "Submitted", "Elapsed", "Command"],
+            tablefmt="presto",
+        )
+    )
+
+
+def wait_for(
+    jobids: list[str],
+    interval: float = 5,
+    max_interval: float = 300,
+    timeout: Optional[float] = None,
+    quiet: bool = False,
+):
+    """Wait for jobs to finish, returning an exit code summarizing their states"""
+    from kslurm.slurm import jobs as registry
+
+    # Collected as jobs finish, so they're recorded even if waiting is interrupted
+    finished: dict[str, registry.JobState] = {}
+
+    def report(jobid: str, state: registry.JobState):
+        finished[jobid] = state
+        if quiet:
+            return
+        if state == registry.UNKNOWN:
+            print(f"Job {jobid} is not known to sacct")
+        else:
+            print(f"Job {jobid} {state[0]} (exit code {state[1]}, elapsed {state[2]})")
+
+    try:
+        registry.wait(jobids, interval, max_interval, timeout, report)
+    except KeyboardInterrupt:
+        return 130
+    except OSError as err:
+        raise CommandError(f"Could not check on jobs: {err}")
+    finally:
+        registry.record_states(
+            {
+                jobid: state
+                for jobid, state in finished.items()
+                if state != registry.UNKNOWN
+            }
+        )
+    status = registry.wait_status(jobids, finished)
+    if status == registry.WAIT_TIMEOUT and not quiet:
+        running = len({registry.base_id(jobid) for jobid in jobids} - set(finished))
+        print(f"Timed out with {running} jobs still queued or running")
+    return status
+
+
+@command
+def wait(args: _WaitModel, jobids: list[str]):
+    """Wait for jobs to finish
+
+    All jobs are checked at once with a single call to sacct, at intervals growing
+    from --interval to --max-interval. Exits with 0 if every job completed
+    successfully, 1 if any failed, were cancelled, or are still unknown to sacct after
+    a few minutes, and 124 on timeout.
+    """
+    if not jobids:
+        raise CommandError("No job ids given")
+    return wait_for(
+        jobids, args.interval, args.max_interval, args.timeout, quiet=args.quiet
+    )
@@ -19,7 +19,7 @@ def _list():
 
 @command(inline=True)
 def _rm(
-    alias: str = positional(),
+    alias: str = positional(complete="aliases"),
 ):
     """Remove an alias"""
     singularity_dir = SingularityDir()
@@ -31,6 +31,7 @@ def _rm(
         path.unlink()
     elif path.exists():
         os.remove(path)
+    singularity_dir.update_completion()
 
 
 @attrs.frozen
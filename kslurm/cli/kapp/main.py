@@ -1,5 +1,6 @@
 from __future__ import absolute_import
 
+import functools as ft
 import os
 import os.path
 import subprocess as sp
@@ -9,8 +10,6 @@ import shutil
 from typing import DefaultDict, Optional
 
 import attrs
-import requests
-from InquirerPy import inquirer as inq  # type: ignore
 
 from kslurm.appcache import Cache
 from kslurm.args import (
@@ -23,14 +22,14 @@ from kslurm.args import (
     positional,
     subcommand,
 )
-from kslurm.cli.kapp.alias import alias_cmd
-from kslurm.cli.kapp.image import img_cmd
-from kslurm.cli.krun import krun
 from kslurm.container import Container, ContainerAlias, SingularityDir
 from kslurm.models import formatters, validators
 from kslurm.utils import get_hash
 
-_SINGULARITY_DIR = SingularityDir()
+
+@ft.cache
+def _singularity_dir():
+    return SingularityDir()
 
 
 def _update_aliases(
@@ -85,7 +84,13 @@ def _pull(
     # ),
 ):
     """Pull a container. Defaults to docker hub."""
+    import requests
+    from InquirerPy import inquirer as inq  # type: ignore
+
+    from kslurm.cli.krun import krun
+
     _check_singularity()
+    singularity_dir = _singularity_dir()
 
     try:
         app = Container.from_uri(uri, lookup_digest=True)
@@ -98,29 +103,29 @@ def _pull(
         )
 
     if alias_name:
-        alias = ContainerAlias(alias_name, _SINGULARITY_DIR)
+        alias = ContainerAlias(alias_name, singularity_dir)
         if alias and not force:
             alias.check_upgrade(app)
     else:
         alias = None
 
-    if _SINGULARITY_DIR.has_container(app):
-        _update_aliases(_SINGULARITY_DIR, app, uri, alias)
+    if singularity_dir.has_container(app):
+        _update_aliases(singularity_dir, app, uri, alias)
         return
 
-    if _SINGULARITY_DIR.has_raw_uri_file(app):
+    if singularity_dir.has_raw_uri_file(app):
         if not inq.confirm(
             f"An image matching {app.uri.uri} already exists, but we can't verify if "
             "it's up to date. Would you like to pull it again?"
         ).execute():
             return
 
-    image_path = _SINGULARITY_DIR.get_data_path(app)
+    image_path = singularity_dir.get_data_path(app)
 
     # Small images we can directly use the singularity command
     if app.docker_data and app.docker_data.size_mb < 200 and not mem:
         sp.run(["singularity", "pull", str(image_path), app.uri.uri])
-        _update_aliases(_SINGULARITY_DIR, app, uri, alias)
+        _update_aliases(singularity_dir, app, uri, alias)
         return
 
     url = (
@@ -148,7 +153,7 @@ def _pull(
         cache[url] = script
         os.chmod(cache.get_path(url), 0o776)
 
-    workdir = _SINGULARITY_DIR.work / get_hash(app.uri.address)
+    workdir = singularity_dir.work / get_hash(app.uri.address)
     frozen_image = workdir / "image"
     proc = sp.run(
         [
@@ -191,18 +196,18 @@ def _pull(
     if ret == 0:
         shutil.rmtree(workdir)
 
-        _update_aliases(_SINGULARITY_DIR, app, uri, alias)
+        _update_aliases(singularity_dir, app, uri, alias)
     return ret
 
 
 @command(inline=True)
 def _path(
-    uri_or_alias: str = positional(),
+    uri_or_alias: str = positional(complete="aliases"),
     quiet: bool = flag(["-q", "--quiet"], help="Don't print any errors"),
 ):
     """Print the path of the given uri or alias"""
     try:
-        container = _SINGULARITY_DIR.find(uri_or_alias)
+        container = _singularity_dir().find(uri_or_alias)
     except Exception as err:
         if not quiet:
             raise err
@@ -210,13 +215,15 @@ def _path(
 
     if container is None:
         raise CommandError(f"No image with identifier '{uri_or_alias}' found")
-    print(_SINGULARITY_DIR.get_data_path(container))
+    print(_singularity_dir().get_data_path(container))
 
 
 @attrs.frozen
 class _RunModel:
     container: Container = positional(
-        format=_SINGULARITY_DIR.find_formatter, name="uri_or_alias"
+        format=lambda arg: _singularity_dir().find_formatter(arg),
+        name="uri_or_alias",
+        complete="aliases",
     )
 
 
@@ -226,7 +233,7 @@ def _generic_run(container: Container, cmd: str, args: list[str]):
         [
             "singularity",
             cmd,
-            _SINGULARITY_DIR.get_data_path(container),
+            _singularity_dir().get_data_path(container),
             *args,
         ]
     )
@@ -259,17 +266,18 @@ def _purge(
 
     Remove all containers not referred to by any uris (e.g. because the uri was removed)
     """
+    singularity_dir = _singularity_dir()
     uri_list = set(
         os.path.basename(os.readlink(path))
-        for path in _SINGULARITY_DIR.iter_images()
+        for path in singularity_dir.iter_images()
         if path.is_symlink()
     )
     snakemake_aliases: dict[str, list[Path]] = DefaultDict(list)
-    for path in _SINGULARITY_DIR.snakemake.iterdir():
+    for path in singularity_dir.snakemake.iterdir():
         if path.is_symlink():
             snakemake_aliases[os.path.basename(os.readlink(path))].append(path)
     count = 0
-    for file in _SINGULARITY_DIR.images.iterdir():
+    for file in singularity_dir.images.iterdir():
         if file.name in uri_list:
             continue
         if dry:
@@ -297,7 +305,7 @@ def _snakemake():
     will be searched and saved. By supplying the path printed by this command, snakemake
     will automatically use any containers pulled using kapp
     """
-    print(_SINGULARITY_DIR.snakemake.resolve())
+    print(_singularity_dir().snakemake.resolve())
 
 
 @attrs.frozen
@@ -306,11 +314,11 @@ class _KappModel:
         commands={
             "pull": _pull.cli,
             "path": _path.cli,
-            "image": img_cmd.cli,
+            "image": "kslurm.cli.kapp.image:img_cmd",
             "run": _run.cli,
             "shell": _shell.cli,
             "exec": _exec.cli,
-            "alias": alias_cmd.cli,
+            "alias": "kslurm.cli.kapp.alias:alias_cmd",
             "purge": _purge.cli,
             "snakemake": _snakemake.cli,
         },
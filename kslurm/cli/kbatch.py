@@ -1,23 +1,158 @@
 from __future__ import absolute_import
 
 import datetime as dt
-import re
-import subprocess
-from typing import Union
+from pathlib import Path
+from typing import Optional, Union
 
+import attrs
 from colorama import Fore
 
+import kslurm.appconfig as appconfig
 import kslurm.text as txt
-from kslurm.args.command import Parsers, command
+from kslurm.appcache import array_index
+from kslurm.args import flag, keyword
+from kslurm.args.command import CommandError, Parsers, command
 from kslurm.exceptions import TemplateError
 from kslurm.models.slurm import SlurmModel
+from kslurm.slurm.estimate import StartEstimate
+from kslurm.slurm.pack import pending_tasks
 from kslurm.slurm.slurm_command import SlurmCommand
 from kslurm.style import console
 
 
+@attrs.frozen
+class _KbatchModel(SlurmModel):
+    array_file: Optional[Path] = keyword(["--array-file"], default=None, format=Path)
+    throttle: Optional[int] = keyword(["--throttle"], default=None, format=int)
+    pack: Optional[Path] = keyword(["--pack"], default=None, format=Path)
+    slots: Optional[int] = keyword(["--slots"], default=None, format=int)
+    no_estimate: bool = flag(["--no-estimate"])
+    wait: bool = flag(["--wait"])
+    auto_size: bool = flag(["--auto-size"])
+
+
+_KbatchModel.__doc__ = f"""{SlurmModel.__doc__}
+        array_file:
+            Submit a job array running each line of this file as a separate task.
+            Blank lines and lines starting with # are skipped. Resources are
+            requested for each task.
+
+        throttle:
+            Maximum number of array tasks running at once
+
+        pack:
+            Run each line of this file as a separate task within a single job,
+            keeping --slots tasks running at once. Exit codes and timings of tasks
+            are written to <file>.results.jsonl. Resubmitting the same file skips
+            tasks already recorded there, so a pack that ran out of time can be
+            resumed.
+
+        slots:
+            Number of packed tasks running at once. Defaults to 1. The job gets one
+            cpu per slot unless more are requested, shared equally by the tasks, as
+            is the memory.
+
+        no_estimate:
+            Submit without estimating when the job will start. Useful for scripted
+            submission.
+
+        wait:
+            Wait for the job to finish, exiting with 0 only if it completed
+            successfully. See kslurm wait for details.
+
+        auto_size:
+            Lower the cpus, memory, and time requested to what previous runs of the
+            command needed, plus a safety margin (autosize.margin in the config, 0.2
+            by default). Without this flag, the resources are only suggested. Set
+            autosize to apply in the config to always apply them, or to off to
+            disable suggestions.
+"""
+
+
+def _describe_start(startdate: Optional[dt.datetime]):
+    """Format a start time as (prefix, time, date, time from now)"""
+    if startdate is None:
+        return "", "", "", ""
+    now = dt.datetime.now()
+    delta = startdate - now
+
+    prefix = "at"
+    # If at least 7am tomorrow
+    if delta.total_seconds() > 16 * 60 * 60 and startdate.date() != now.date():
+        if startdate.date() == now.date() + dt.timedelta(days=1):
+            date = " tomorrow"
+        elif startdate.date() < now.date() + dt.timedelta(days=6):
+            date = f" on {startdate.strftime('%A')}"
+        else:
+            date = f" on {startdate.strftime('%a, %b %d')}"
+    else:
+        date = ""
+    time = startdate.strftime("%I:%M%p")
+
+    ddhr, mn = divmod(int(max(0, delta.total_seconds())) // 60, 60)
+    day, hr = divmod(ddhr, 24)
+    _fromnow = ",".join(
+        filter(
+            None,
+            [
+                f"{day}d" if day else None,
+                f"{hr}h" if day or hr else None,
+                f"{mn}m" if day or hr or mn else None,
+            ],
+        )
+    )
+    fromnow = f"({_fromnow} from now)" if _fromnow else "(immediately)"
+    return prefix, time, date, fromnow
+
+
+def _read_commands(path: Path):
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+    except (OSError, UnicodeDecodeError) as err:
+        raise CommandError(f"Could not read command file {path}: {err}")
+    commands = [line for line in lines if line and not line.startswith("#")]
+    if not commands:
+        raise CommandError(f"Command file {path} contains no commands")
+    return commands
+
+
+def _auto_size(slurm: SlurmCommand, command: list[str], apply: bool):
+    """Suggest or apply resources from previous runs of command
+
+    Returns the fingerprint of the command
+    """
+    from kslurm.slurm import sizing
+
+    config = appconfig.Config()
+    mode = config.get("autosize") or "suggest"
+    fingerprint = sizing.fingerprint(command)
+    if fingerprint is None or (mode == "off" and not apply):
+        return fingerprint
+    try:
+        margin = float(config.get("autosize.margin") or sizing.DEFAULT_MARGIN)
+    except ValueError:
+        raise CommandError("autosize.margin must be a number, e.g. 0.2")
+    suggestion = sizing.suggest_for(
+        fingerprint, slurm.cpu, slurm.mem, slurm.minutes, margin
+    )
+    if suggestion is None:
+        return fingerprint
+    if apply or mode == "apply":
+        slurm.cpu, slurm.mem = suggestion.cpu, suggestion.mem
+        slurm.time = suggestion.time
+        print(f"Resources sized from {suggestion.runs} previous runs: {suggestion}")
+    else:
+        print(
+            f"Previous runs of this command suggest {suggestion}. Use --auto-size to "
+            "request these."
+        )
+    return fingerprint
+
+
 @command(terminate_on_unknown=True)
 def kbatch(
-    args: Union[SlurmModel, TemplateError],
+    args: Union[_KbatchModel, TemplateError],
     command_args: list[str],
     arglist: Parsers,
 ):
@@ -32,89 +167,112 @@ def kbatch(
     To force this behaviour, wrap the $VARIABLE or $(subshell) in quotes:
         '$SLURM_TMPDIR'
         '$(hostname)'
+
+    Many commands can be submitted together as a single job array using
+    --array-file, where each line of the file is run as one task. Short commands
+    are better packed into a single job using --pack, which runs them --slots at a
+    time.
     """
 
     slurm = SlurmCommand(args, command_args, arglist)
     command = slurm.command if slurm.command else f"{Fore.RED}Must provide a command"
+    # Command whose previous runs are used to size the job
+    sized = command_args
+    if isinstance(args, _KbatchModel) and args.array_file is not None:
+        if command_args:
+            raise CommandError("Cannot provide a command along with --array-file")
+        if args.throttle is not None and args.throttle < 1:
+            raise CommandError("--throttle must be at least 1")
+        commands = _read_commands(args.array_file)
+        slurm.set_array(array_index(commands), len(commands), args.throttle)
+        command = f"{len(commands)} commands from {args.array_file}"
+        sized = commands[:1]
+    if isinstance(args, _KbatchModel) and args.pack is not None:
+        if command_args or args.array_file is not None:
+            raise CommandError(
+                "Cannot provide a command or --array-file along with --pack"
+            )
+        slots = args.slots or 1
+        if slots < 1:
+            raise CommandError("--slots must be at least 1")
+        if arglist["cpu"].value is None and not args.job_template:
+            slurm.cpu = max(slurm.cpu, slots)
+        elif slurm.cpu < slots:
+            raise CommandError(f"Need at least one cpu for each of the {slots} slots")
+        commands = _read_commands(args.pack)
+        results = args.pack.resolve().with_name(f"{args.pack.name}.results.jsonl")
+        remaining = len(pending_tasks(commands, results))
+        if not remaining:
+            print(f"All {len(commands)} commands of {args.pack} have already run")
+            print(f"Results are in {results}")
+            return
+        slurm.set_pack(array_index(commands), results, slots)
+        sized = []
+        command = (
+            f"{remaining} of {len(commands)} commands from {args.pack}, "
+            f"{slots} at a time"
+        )
+    elif isinstance(args, _KbatchModel) and args.slots is not None:
+        raise CommandError("--slots can only be used with --pack")
+    if isinstance(args, _KbatchModel) and args.throttle is not None:
+        if args.array_file is None:
+            raise CommandError("--throttle can only be used with --array-file")
+    fingerprint = None
+    if isinstance(args, _KbatchModel) and sized:
+        fingerprint = _auto_size(slurm, sized, args.auto_size)
 
     console.print(txt.KBATCH_MSG.format(slurm_args=slurm.slurm_args, command=command))
     if slurm.command:
-        test = subprocess.run(slurm.batch_test, shell=True, capture_output=True)
-
-        proc = subprocess.run(
-            slurm.batch, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        no_estimate = isinstance(args, _KbatchModel) and args.no_estimate
+        estimate = (
+            None
+            if no_estimate
+            else StartEstimate(slurm.batch_test_argv, slurm.script, slurm.resources)
         )
 
-        out = proc.stdout.decode()
+        result = slurm.submit()
 
-        if proc.returncode != 0:
-            print(Fore.WHITE + out)
+        if not result.ok:
+            if estimate is not None:
+                estimate.cancel()
+            print(Fore.WHITE + result.stdout + result.stderr)
             return 1
         if slurm.test:
-            # output will be the issued command, so we print it
-            print(Fore.WHITE + out)
-
-        if test.returncode == 0 and (
-            match := re.search(
-                r"(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})T"
-                r"(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2})",
-                test.stderr.decode(),
-            )
-        ):
-            startdate = dt.datetime(
-                **{key: int(value) for key, value in match.groupdict().items()}
-            )
-            now = dt.datetime.now()
-            delta = startdate - now
-
-            prefix = "at"
-            # If at least 7am tomorrow
-            if delta.total_seconds() > 16 * 60 * 60 and startdate.date() != now.date():
-                if startdate.date() == now.date() + dt.timedelta(days=1):
-                    date = " tomorrow"
-                elif startdate.date() < now.date() + dt.timedelta(days=6):
-                    date = f" on {startdate.strftime('%A')}"
-                else:
-                    date = f" on {startdate.strftime('%a, %b %d')}"
-            else:
-                date = ""
-            time = startdate.strftime("%I:%M%p")
-
-            ddhr, mn = divmod(int(max(0, delta.total_seconds())) // 60, 60)
-            day, hr = divmod(ddhr, 24)
-            _fromnow = ",".join(
-                filter(
-                    None,
-                    [
-                        f"{day}d" if day else None,
-                        f"{hr}h" if day or hr else None,
-                        f"{mn}m" if day or hr or mn else None,
-                    ],
-                )
-            )
-            fromnow = f"({_fromnow} from now)" if _fromnow else "(immediately)"
-        else:
-            prefix = ""
-            date = ""
-            time = ""
-            fromnow = ""
+            # output will be the job script, so we print it
+            print(Fore.WHITE + result.stdout)
+
+        startdate = estimate.result() if estimate is not None else None
+        prefix, time, date, fromnow = _describe_start(startdate)
 
         if slurm.test:
-            print(
-                f"""Estimated start time {prefix} {Fore.BLUE}{time}{date} \
+            if estimate is not None:
+                print(
+                    f"""Estimated start time {prefix} {Fore.BLUE}{time}{date} \
 {Fore.LIGHTRED_EX}{fromnow}
 """
-            )
+                )
             return
-        slurmid = out.strip()
-        print(
-            f"""Scheduled job {Fore.LIGHTBLACK_EX}{slurmid}
+        from kslurm.slurm.jobs import record_submission
+
+        record_submission(slurm, result, fingerprint)
+        slurmid = result.jobid
+        start = (
+            f"""
     {Fore.WHITE}Estimated start {prefix} {Fore.BLUE}{time}{date} \
-{Fore.LIGHTRED_EX}{fromnow}
+{Fore.LIGHTRED_EX}{fromnow}"""
+            if estimate is not None
+            else ""
+        )
+        print(
+            f"""Scheduled job {Fore.LIGHTBLACK_EX}{slurmid}{start}
     {Fore.WHITE}To cancel, run:
         scancel {slurmid}
         """
         )
+        if isinstance(args, _KbatchModel) and args.wait and slurmid:
+            from kslurm.cli.jobs import wait_for
+
+            return wait_for([slurmid])
 
 
 if __name__ == "__main__":
@@ -12,7 +12,6 @@ from pathlib import Path
 from typing import Any, Union
 
 import attrs
-from yaspin import yaspin
 
 import kslurm.bin
 import kslurm.text as txt
@@ -149,8 +148,7 @@ def _kjupyter(
         return
 
     proc = sp.Popen(
-        slurm.run,
-        shell=True,
+        slurm.run_argv,
         stdin=sp.PIPE,
         stdout=sp.PIPE,
         stderr=sp.STDOUT,
@@ -163,6 +161,8 @@ def _kjupyter(
 
     signal.signal(signal.SIGINT, signal_handler)
 
+    from yaspin import yaspin
+
     port = None
     with yaspin(text="Acquiring resources") as spinner:
         if args.debug:
@@ -377,7 +377,7 @@ def kjupyter(
         if env.active:
             console.print(helptext)
         else:
-            console.print(_kjupyter.get_helptext(entrypoint))
+            _kjupyter.print_help(entrypoint)
         return
     if isinstance(args, InvalidSubcommand):
         if env.active:
@@ -6,7 +6,6 @@ import re
 import shutil
 import subprocess as sp
 import sys
-import tarfile
 import tempfile
 from pathlib import Path
 from typing import Literal, Optional, overload
@@ -18,9 +17,24 @@ from kslurm.appconfig import InvalidPipdirError
 from kslurm.args import Subcommand, choice, flag, keyword, positional, shape, subcommand
 from kslurm.args.command import CommandError, command
 from kslurm.args.help import SKIPHELP
+from kslurm.exceptions import ValidationError
 from kslurm.models import validators
 from kslurm.shell import Shell
-from kslurm.venv import KpyIndex, PromptRefreshError, VenvCache, VenvPrompt, rebase_venv
+from kslurm.venv import (
+    CODECS,
+    ArchiveError,
+    KpyIndex,
+    PromptRefreshError,
+    VenvCache,
+    VenvPrompt,
+    default_codec,
+    detect_codec,
+    linked_image,
+    rebase_venv,
+    record_relocation,
+    unlink_venv,
+    unmount_images,
+)
 
 
 def _get_unique_name(index: KpyIndex, stem: str = "venv", i: int = 0) -> str:
@@ -65,6 +79,41 @@ def _get_slurm_tmpdir(allow_missing: bool = True):
     return Path(os.environ["SLURM_TMPDIR"])
 
 
+def _unmount_images(slurm_tmp: Path, owner: int):
+    index = KpyIndex(slurm_tmp)
+    try:
+        unmount_images(index, owner)
+    except ArchiveError as err:
+        raise CommandError(str(err))
+    finally:
+        index.write()
+
+
+def _enter_venv(venv_dir: Path, script: str, slurm_tmp: Optional[Path]):
+    """Activate a venv in a subshell, or write a script activating it for the kpy
+    wrapper to source
+
+    Images the venv is linked into are held by the shell using them: the subshell,
+    during which kpy waits, or the shell sourcing the script, which unmounts them
+    through kpy _unmount when it exits
+    """
+    shell = _get_shell()
+    image = linked_image(venv_dir) if slurm_tmp else None
+    if slurm_tmp and image is not None:
+        index = KpyIndex(slurm_tmp)
+        index.hold(str(image), os.getppid() if script else os.getpid())
+        index.write()
+    if script:
+        with Path(script).open("w") as f:
+            f.write(shell.source(venv_dir))
+            if image is not None:
+                f.write("\n_kpy_unmount_on_exit\n")
+        return 2
+    shell.activate(venv_dir)
+    if slurm_tmp and image is not None:
+        _unmount_images(slurm_tmp, os.getpid())
+
+
 @command
 def _bash():
     """Echo script for inclusion in .bashrc
@@ -78,18 +127,24 @@ def _bash():
 
 @command(inline=True)
 def _load(
-    name: str = positional(default=""),
+    name: str = positional(default="", complete="venvs"),
     new_name: str = keyword(match=["--as"], format=validators.fs_name),
     script: str = keyword(match=["--script"], help=SKIPHELP),
+    extract: bool = flag(match=["--extract"]),
 ):
     """Load a saved python venv
 
-    Run without name to list available venvs for loading
+    Run without name to list available venvs for loading. On compute nodes, venvs
+    saved as squashfs images are mounted rather than extracted, if squashfuse is
+    installed. The packages of mounted venvs are read-only.
 
     Attributes:
         name: Name of the venv to load. If not specified, list all available venvs
         new_name:
             Load the venv under a different name. Useful for loading the same venv twice
+        extract:
+            Extract venvs saved as images instead of mounting them, so their packages
+            can be changed
     """
     slurm_tmp = _get_slurm_tmpdir()
     if slurm_tmp:
@@ -116,13 +171,25 @@ def _load(
         print("Valid venvs:\n" + str(venv_cache))
         return
 
-    print(f"Unpacking venv '{name}'", end="")
+    mounted = False
+    if index is not None and slurm_tmp and not extract:
+        try:
+            mounted = venv_cache.mount(name, venv_dir, index, slurm_tmp / "tmp")
+        except ArchiveError as err:
+            print(f"Could not mount venv '{name}', extracting instead\n{err}")
+    if mounted:
+        print(f"Mounted venv '{name}'", end="")
+    else:
+        print(f"Unpacking venv '{name}'", end="")
     if label != name:
         print(f" as '{label}'")
     else:
         print()
-    with tarfile.open(venv_cache[name], "r") as tar:
-        tar.extractall(venv_dir)
+    if not mounted:
+        try:
+            venv_cache.extract(name, venv_dir)
+        except ArchiveError as err:
+            raise CommandError(str(err))
 
     print("Updating paths")
     rebase_venv(venv_dir)
@@ -136,18 +203,13 @@ def _load(
         index[label] = str(venv_dir)
         index.write()
 
-    shell = _get_shell()
-    if script:
-        with Path(script).open("w") as f:
-            f.write(shell.source(venv_dir))
-        return 2
-    shell.activate(venv_dir)
+    return _enter_venv(venv_dir, script, slurm_tmp)
 
 
 @command(inline=True)
 def _export(
     mode: str = choice(["venv"], help="What sort of export to perform"),
-    name: str = positional(),
+    name: str = positional(complete="venvs"),
     path: Path = keyword(["--path", "-p"], default=None),
 ):
     """Export a saved venv
@@ -168,8 +230,10 @@ def _export(
         raise CommandError(f"{path} already exists")
 
     print("exporting...")
-    with tarfile.open(venv_cache[name], "r") as tar:
-        tar.extractall(path)
+    try:
+        venv_cache.extract(name, path)
+    except ArchiveError as err:
+        raise CommandError(str(err))
     rebase_venv(path)
 
     print(
@@ -178,10 +242,19 @@ def _export(
     )
 
 
+def _codec(value: str):
+    if value not in CODECS:
+        raise ValidationError(f"--codec must be one of {', '.join(CODECS)}")
+    return value
+
+
 @command(inline=True)
 def _save(
     name: str = positional(format=validators.fs_name),
     force: bool = flag(match=["--force", "-f"]),
+    codec_name: str = keyword(
+        match=["--codec"], default="", format=_codec, complete=tuple(CODECS)
+    ),
 ):
     """Save current venv
 
@@ -191,6 +264,12 @@ def _save(
             will be thrown, unless force is used
         force:
             Overwrite any existing venv with chosen name
+        codec_name:
+            Compression used for the saved venv: zstd, lz4, gzip, none, squashfs
+            for an image that can be mounted when loaded, or store to share files
+            with other venvs saved to the store. Defaults to kpy.codec in the
+            config, or zstd if installed, otherwise gzip. Venvs are loaded with
+            whichever codec they were saved with
     """
     if not os.environ.get("VIRTUAL_ENV"):
         raise CommandError(
@@ -207,17 +286,34 @@ def _save(
             print(f"{name} already exists. Run with -f to force overwrite")
             return
 
-    dest = venv_cache.get_path(name)
+    try:
+        codec = CODECS[codec_name] if codec_name else default_codec()
+    except ArchiveError as err:
+        raise CommandError(str(err))
+    dest = venv_cache.get_path(name, codec)
 
-    _, tmp = tempfile.mkstemp(prefix="kslurm-", suffix=".tar.gz")
+    fd, tmp = tempfile.mkstemp(prefix="kslurm-", suffix=codec.suffix)
+    os.close(fd)
 
     venv_dir = Path(os.environ["VIRTUAL_ENV"])
     prompt = VenvPrompt(venv_dir)
     prompt.update_prompt(name)
     prompt.update_hash()
     prompt.save()
-    with tarfile.open(tmp, mode="w:gz") as tar:
-        tar.add(venv_dir, arcname="")
+    record_relocation(venv_dir)
+    # Mounted venvs link into their image, so are saved from a copy with its contents
+    copy = None
+    if linked_image(venv_dir) is not None:
+        copy = Path(tempfile.mkdtemp(prefix="kslurm-"))
+        unlink_venv(venv_dir, copy)
+    try:
+        codec.write(copy or venv_dir, Path(tmp), venv_cache.get(name))
+    except ArchiveError as err:
+        os.remove(tmp)
+        raise CommandError(str(err))
+    finally:
+        if copy is not None:
+            shutil.rmtree(copy)
 
     slurm_tmp = _get_slurm_tmpdir()
     if slurm_tmp:
@@ -228,11 +324,13 @@ def _save(
     # Do a two stage move in case tmp and dest are on different file systems, which
     # could make the move take some time. This lets us delete the old dest at the last
     # possible second
-    stage = dest.with_suffix(".tar.gz.tmp")
+    stage = dest.with_name(f"{dest.name}.tmp")
     shutil.move(tmp, stage)
     if delete:
-        os.remove(dest)
+        os.remove(venv_cache[name])
     shutil.move(stage, dest)
+    venv_cache[name] = dest
+    venv_cache.update_completion()
 
 
 @command(inline=True)
@@ -368,12 +466,7 @@ def _activate(
         ]
         raise CommandError("\n".join(err))
 
-    shell = _get_shell()
-    if script:
-        with Path(script).open("w") as f:
-            f.write(shell.source(Path(index[name])))
-        return 2
-    shell.activate(Path(index[name]))
+    return _enter_venv(Path(index[name]), script, slurm_tmp)
 
 
 @command
@@ -402,6 +495,13 @@ def _refresh():
         return
 
 
+@command
+def _unmount():
+    """Unmount the venv images held only by the shell running this command"""
+    if slurm_tmp := _get_slurm_tmpdir():
+        _unmount_images(slurm_tmp, os.getppid())
+
+
 def _kpy_wrapper(argv: list[str] = sys.argv):
     with impr.path("kslurm.bin", "kpy-wrapper.sh") as path:
         print(path)
@@ -409,7 +509,7 @@ def _kpy_wrapper(argv: list[str] = sys.argv):
 
 
 @command(inline=True)
-def _rm(name: Optional[str] = positional()):
+def _rm(name: Optional[str] = positional(complete="venvs")):
     """Delete a venv
     Args:
         name (Optional[str], optional):
@@ -426,7 +526,28 @@ def _rm(name: Optional[str] = positional()):
             f"{name} is not a valid venv. Currently saved venvs are:\n{venv_cache}"
         )
 
+    stored = detect_codec(venv_cache[name]) == CODECS["store"]
     os.remove(venv_cache[name])
+    del venv_cache[name]
+    venv_cache.update_completion()
+    if stored:
+        print("Run `kpy gc` to delete stored files no longer used by any venv")
+
+
+@command(inline=True)
+def _gc(dry_run: bool = flag(match=["--dry-run", "-n"])):
+    """Delete stored files no longer used by any saved venv
+
+    Venvs saved with --codec store share their files, which are kept until gc is run
+    after the last venv using them is removed or overwritten.
+
+    Attributes:
+        dry_run: Report what would be deleted, without deleting anything
+    """
+    venv_cache = VenvCache()
+    count, freed = venv_cache.collect_garbage(dry_run)
+    action = "Would delete" if dry_run else "Deleted"
+    print(f"{action} {count} unused files, freeing {freed / 2**20:.1f}MB")
 
 
 @attr.frozen
@@ -441,7 +562,9 @@ class _KpyModel:
             "list": _list,
             "rm": _rm,
             "export": _export,
+            "gc": _gc,
             "_refresh": _refresh,
+            "_unmount": _unmount,
             "_kpy_wrapper": _kpy_wrapper,
         },
     )
@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 
 import subprocess
+import sys
 from typing import Union
 
 import kslurm.text as txt
@@ -47,7 +48,11 @@ def krun(
         console.print(txt.INTERACTIVE_MSG.format(args=slurm.slurm_args))
 
     if not slurm.test:
-        return subprocess.run(slurm.run, shell=True).returncode
+        try:
+            return subprocess.run(slurm.run_argv).returncode
+        except OSError as err:
+            print(f"{slurm.run_argv[0]}: {err.strerror}", file=sys.stderr)
+            return 127
 
 
 if __name__ == "__main__":
@@ -5,14 +5,7 @@ from pathlib import Path
 
 import attr
 
-import neuroglia_helpers
 from kslurm.args import Subcommand, command, error, flag, subcommand
-from kslurm.cli.config import config
-from kslurm.cli.kbatch import kbatch
-from kslurm.cli.kjupyter import kjupyter
-from kslurm.cli.kpy import kpy
-from kslurm.cli.krun import krun
-from kslurm.installer.installer import install
 
 NAME = "kslurm"
 HOME_DIR = "KSLURM_HOME"
@@ -22,6 +15,8 @@ ENTRYPOINTS = ["kbatch", "krun", "kjupyter", "kslurm", "kpy"]
 @command(inline=True)
 def _neuroglia_helpers(show_src: bool = flag(["--src-dir"])):
     if show_src:
+        import neuroglia_helpers
+
         print(Path(neuroglia_helpers.__file__).parent)
     else:
         with impr.path("kslurm.bin", "neuroglia-helpers.sh") as path:
@@ -32,11 +27,16 @@ def _neuroglia_helpers(show_src: bool = flag(["--src-dir"])):
 class KslurmModel:
     command: Subcommand = subcommand(
         commands={
-            "kbatch": kbatch,
-            "krun": krun,
-            "kjupyter": kjupyter,
-            "kpy": kpy,
-            "config": config,
+            "kbatch": "kslurm.cli.kbatch:kbatch",
+            "krun": "kslurm.cli.krun:krun",
+            "kjupyter": "kslurm.cli.kjupyter:kjupyter",
+            "kpy": "kslurm.cli.kpy:kpy",
+            "jobs": "kslurm.cli.jobs:jobs",
+            "wait": "kslurm.cli.jobs:wait",
+            "efficiency": "kslurm.cli.efficiency:efficiency",
+            "config": "kslurm.cli.config:config",
+            "completion": "kslurm.cli.completion:completion",
+            "daemon": "kslurm.cli.daemon:daemon",
             "update": error,
             "neuroglia-helpers": _neuroglia_helpers,
         },
@@ -48,6 +48,8 @@ def main(args: KslurmModel, tail: list[str]) -> int:
     name, func = args.command
     entry = f"kslurm {name}"
     if name == "update":
+        from kslurm.installer.installer import install
+
         install(tail, NAME, HOME_DIR, ENTRYPOINTS)
     return func([entry, *tail])
 
@@ -9,8 +9,8 @@ from pathlib import Path
 from typing import Any, Optional, Union
 
 import attrs
-import requests
 
+from kslurm.appcache import update_completion
 from kslurm.appconfig import Config
 from kslurm.args.command import CommandError
 from kslurm.exceptions import ValidationError
@@ -188,6 +188,8 @@ class DockerData:
     def from_uri(
         cls, uri: URI, digest: Optional[str] = None, token: Optional[str] = None
     ) -> Optional["DockerData"]:
+        import requests
+
         if token is None:
             token = requests.get(
                 f"{AUTHBASE}/token",
@@ -278,6 +280,7 @@ class SingularityDir(type(Path())):
         self.uris.mkdir(exist_ok=True)
         self.snakemake.mkdir(exist_ok=True)
         self.aliases.mkdir(exist_ok=True)
+        self.update_completion()
 
     @property
     def work(self):
@@ -299,6 +302,9 @@ class SingularityDir(type(Path())):
     def aliases(self):
         return self / "aliases"
 
+    def update_completion(self):
+        update_completion("aliases", (alias.name for alias in self.aliases.iterdir()))
+
     def get_data_path(self, container: Container):
         if container.cache_path:
             return self.images / container.cache_path
@@ -434,6 +440,7 @@ class ContainerAlias:
             print(f"Aliasing {app} as {self.alias}")
         self.path.symlink_to(self.singularity_dir.uris / app.uri_path)
         self._image = None
+        self.singularity_dir.update_completion()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+from __future__ import absolute_import, annotations
+
+import contextlib
+import json
+import os
+import signal
+import socket
+import sys
+from typing import Any, Optional
+
+# This module is imported on every call of kslurm-client, so it must only depend on
+# the standard library. Everything else is imported only when falling back to running
+# commands in-process.
+
+# Commands that can be run through the daemon, mapped to their import paths
+ENTRYPOINTS = {
+    "kbatch": "kslurm.cli.kbatch:kbatch",
+    "krun": "kslurm.cli.krun:krun",
+    "kjupyter": "kslurm.cli.kjupyter:kjupyter",
+    "kslurm": "kslurm.cli.main:main",
+    "kpy": "kslurm.cli.kpy:kpy",
+    "kapp": "kslurm.cli.kapp.main:kapp",
+}
+
+# Environment variables read by kslurm at import time. The daemon only runs
+# commands for clients that agree with it on all of them.
+PINNED_ENV = ["HOME", "XDG_CONFIG_HOME", "XDG_CACHE_HOME", "XDG_DATA_HOME"]
+
+FORWARDED_SIGNALS = [signal.SIGINT, signal.SIGTERM, signal.SIGHUP]
+
+# Set to skip the daemon and always run commands in-process
+DISABLE_ENV = "KSLURM_NO_DAEMON"
+
+
+class DaemonUnavailable(Exception):
+    pass
+
+
+def socket_dir() -> str:
+    if runtime := os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(runtime, "kslurm")
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache, "kslurm")
+
+
+def socket_path() -> str:
+    # Home directories are typically shared between cluster nodes, so each host
+    # gets its own daemon
+    return os.path.join(socket_dir(), f"daemon-{socket.gethostname()}.sock")
+
+
+def stamp() -> str:
+    """Identify the installed kslurm code, so outdated daemons can be detected"""
+    stat = os.stat(__file__)
+    return f"{sys.executable}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def encode(message: dict[str, Any]) -> bytes:
+    return json.dumps(message).encode() + b"\n"
+
+
+def _connect(fds: list[int], message: dict[str, Any]):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path())
+        socket.send_fds(sock, [b"\0"], fds)
+        sock.sendall(encode(message))
+        stream = sock.makefile("rb")
+        reply = json.loads(stream.readline() or b"{}")
+    except (OSError, ValueError) as err:
+        sock.close()
+        raise DaemonUnavailable(str(err)) from err
+    return sock, stream, reply
+
+
+def control(action: str) -> Optional[dict[str, Any]]:
+    """Send a control request ("ping" or "stop") to the daemon
+
+    Returns the reply of the daemon, or None if it isn't running
+    """
+    try:
+        sock, _, reply = _connect([], {"control": action})
+    except DaemonUnavailable:
+        return None
+    sock.close()
+    return reply
+
+
+def forward(argv: list[str]) -> int:
+    """Run a command in the daemon, returning its exit code
+
+    The standard streams of the client are passed to the daemon, so the command
+    reads and writes the terminal directly. Raises DaemonUnavailable if the command
+    could not be started in the daemon, in which case it was never run.
+    """
+    sock, stream, reply = _connect(
+        [0, 1, 2],
+        {"stamp": stamp(), "argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)},
+    )
+    with sock:
+        if "pid" not in reply:
+            raise DaemonUnavailable(reply.get("error", "invalid reply"))
+        pid = reply["pid"]
+
+        def relay(signum: int, _: Any):
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signum)
+
+        handlers = {sig: signal.signal(sig, relay) for sig in FORWARDED_SIGNALS}
+        try:
+            result = json.loads(stream.readline() or b"{}")
+        finally:
+            for sig, handler in handlers.items():
+                signal.signal(sig, handler)
+    return result.get("exit", 1)
+
+
+def run_local(argv: list[str]) -> int:
+    from kslurm.args.registry import LazyCommand
+
+    return LazyCommand(ENTRYPOINTS[argv[0]])(argv)
+
+
+def main(argv: list[str] = sys.argv) -> int:
+    if len(argv) < 2 or argv[1] not in ENTRYPOINTS:
+        print(
+            f"Usage: {os.path.basename(argv[0])} <{'|'.join(ENTRYPOINTS)}> [args...]",
+            file=sys.stderr,
+        )
+        return 2
+    if not os.environ.get(DISABLE_ENV):
+        try:
+            return forward(argv[1:])
+        except DaemonUnavailable:
+            pass
+    return run_local(argv[1:])
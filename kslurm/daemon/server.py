@@ -0,0 +1,171 @@
+from __future__ import absolute_import, annotations
+
+import contextlib
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import traceback
+from typing import Any, NoReturn
+
+from kslurm.args.registry import LazyCommand
+from kslurm.daemon.client import (
+    ENTRYPOINTS,
+    PINNED_ENV,
+    control,
+    encode,
+    socket_dir,
+    socket_path,
+    stamp,
+)
+
+# Seconds without any request after which the daemon shuts down
+DEFAULT_IDLE_TIMEOUT = 1800
+
+_COMMANDS = {name: LazyCommand(path) for name, path in ENTRYPOINTS.items()}
+
+
+class DaemonRunning(Exception):
+    pass
+
+
+def preload():
+    """Import all commands and compile their parsers ahead of the first request"""
+    for command in _COMMANDS.values():
+        cli = command.resolve()
+        wrapper = getattr(cli, "__self__", None)
+        if hasattr(wrapper, "get_parsers"):
+            wrapper.get_parsers()
+
+
+def _peer_uid(conn: socket.socket):
+    creds = conn.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    _, uid, _ = struct.unpack("3i", creds)
+    return uid
+
+
+def _bind(path: str):
+    os.makedirs(socket_dir(), mode=0o700, exist_ok=True)
+    if control("ping") is not None:
+        raise DaemonRunning(f"kslurm daemon is already running at {path}")
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)
+    try:
+        sock.bind(path)
+    finally:
+        os.umask(umask)
+    sock.listen()
+    return sock
+
+
+def serve(idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+    """Serve commands until no request arrives within idle_timeout seconds
+
+    Each request is handled in a forked child, which inherits the modules already
+    imported by the daemon and takes over the standard streams of the client
+    """
+    path = socket_path()
+    sock = _bind(path)
+    inode = os.stat(path).st_ino
+    preload()
+
+    def terminate(signum: int, _: Any):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+    # Let the kernel reap finished children
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    sock.settimeout(idle_timeout)
+    try:
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except socket.timeout:
+                return
+            with conn:
+                if _peer_uid(conn) != os.getuid():
+                    continue
+                if os.fork() == 0:
+                    sock.close()
+                    _handle(conn)
+    finally:
+        sock.close()
+        # Don't remove the socket of a daemon started after this one
+        with contextlib.suppress(FileNotFoundError):
+            if os.stat(path).st_ino == inode:
+                os.unlink(path)
+
+
+def _handle(conn: socket.socket) -> NoReturn:
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        conn.settimeout(None)
+        _, fds, _, _ = socket.recv_fds(conn, 1, 3)
+        request = json.loads(conn.makefile("rb").readline() or b"{}")
+        if "control" in request:
+            _control(conn, request["control"])
+        elif request.get("stamp") != stamp():
+            # kslurm has been updated since the daemon started
+            conn.sendall(encode({"error": "outdated daemon"}))
+            os.kill(os.getppid(), signal.SIGTERM)
+        elif any(request["env"].get(var) != os.environ.get(var) for var in PINNED_ENV):
+            conn.sendall(encode({"error": "mismatched environment"}))
+        elif len(fds) != 3 or request["argv"][0] not in _COMMANDS:
+            conn.sendall(encode({"error": "invalid request"}))
+        else:
+            for target, fd in enumerate(fds):
+                os.dup2(fd, target)
+                os.close(fd)
+            os.chdir(request["cwd"])
+            os.environ.clear()
+            os.environ.update(request["env"])
+            conn.sendall(encode({"pid": os.getpid()}))
+            conn.sendall(encode({"exit": _run(request["argv"])}))
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        os._exit(0)
+
+
+def _control(conn: socket.socket, action: str):
+    if action == "stop":
+        os.kill(os.getppid(), signal.SIGTERM)
+    conn.sendall(encode({"pid": os.getppid(), "stamp": stamp()}))
+
+
+def _run(argv: list[str]) -> int:
+    from kslurm.style import reset
+
+    sys.argv = argv
+    sys.stdout.reconfigure(line_buffering=sys.stdout.isatty())  # type: ignore
+    reset()
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    try:
+        code: Any = _COMMANDS[argv[0]](argv)
+    except SystemExit as err:
+        code = err.code
+    except KeyboardInterrupt:
+        code = 130
+    except Exception:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    if code is None:
+        return 0
+    if not isinstance(code, int):
+        print(code, file=sys.stderr)
+        return 1
+    return code
+
+
+if __name__ == "__main__":
+    serve(float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_IDLE_TIMEOUT)
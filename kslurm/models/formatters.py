@@ -1,14 +1,31 @@
 from __future__ import absolute_import, annotations
 
+import functools as ft
 import re
 
-import pint
-
 from kslurm.exceptions import ValidationError
 
-ureg = pint.UnitRegistry()
+# Number of bytes in each memory unit, keyed by lowercase unit prefix. Results are
+# given in decimal megabytes, so binary units (e.g. Gi) don't convert evenly.
+_MEM_UNITS = {
+    "k": 10**3,
+    "m": 10**6,
+    "g": 10**9,
+    "t": 10**12,
+    "ki": 2**10,
+    "mi": 2**20,
+    "gi": 2**30,
+    "ti": 2**40,
+}
+
+_MEM_PATTERN = re.compile(r"^([0-9]+)([GMKTgmkt][Ii]?)[bB]?$")
 
+# Formatters are pure, so results are memoized for the tokens repeated across the
+# argvs of a batch
+_CACHE_SIZE = 1024
 
+
+@ft.lru_cache(maxsize=_CACHE_SIZE)
 def time(time: str):
     if ":" in time:
         if "-" in time:
@@ -25,20 +42,11 @@ def time(time: str):
     return int(min) + int(hours) * 60 + int(days) * 60 * 24
 
 
+@ft.lru_cache(maxsize=_CACHE_SIZE)
 def mem(mem: str):
-    if not (match := re.match(r"^([0-9]+[GMKgmk][Ii]?)[bB]?$", mem)):
+    if not (match := _MEM_PATTERN.match(mem)):
         raise ValidationError(
             "Memory is not formatted correctly. Must be xxx(G|M)[B], e.g. 32G, 4000MB, "
             "etc"
         )
-    return int(
-        ureg(
-            (match.group(1) + "B")
-            .upper()
-            .replace("K", "k")
-            .replace("I", "i")
-            .replace("ki", "Ki")
-        )
-        .to("megabyte")  # type: ignore
-        .m
-    )
+    return int(match.group(1)) * _MEM_UNITS[match.group(2).lower()] // _MEM_UNITS["m"]
@@ -2,21 +2,49 @@ from __future__ import absolute_import, annotations
 
 import functools as ft
 import importlib.resources as impr
-import itertools as it
 import json
-from typing import Dict, cast
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
 
+import appdirs
 import attr
-from tabulate import tabulate
-from typing_extensions import TypedDict
 
+import kslurm.appcache as appcache
 import kslurm.models.formatters as formatters
+from kslurm.exceptions import TemplateError, ValidationError
 
+# Environment variable pointing to site-wide templates, e.g. maintained by a lab
+SITE_TEMPLATES_ENV = "KSLURM_SITE_TEMPLATES"
 
-class Templates(TypedDict):
-    cpus: str
-    mem: str
-    time: str
+SITE_TEMPLATES = Path("/etc/kslurm/job_templates.json")
+
+USER_TEMPLATES = Path(appdirs.user_config_dir("kslurm"), "job_templates.json")
+
+# Searched for in the current directory and each of its parents
+PROJECT_TEMPLATES = "kslurm-templates.json"
+
+# Bumped whenever the compiled form of templates changes
+_INDEX_VERSION = 1
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class JobTemplate:
+    """A named set of resources, with mem in MB and time in minutes
+
+    source is the file in which the template was defined
+    """
+
+    cpu: int
+    mem: int
+    time: int
+    partition: Optional[str] = None
+    gres: Optional[str] = None
+    nodes: Optional[int] = None
+    ntasks: Optional[int] = None
+    constraint: Optional[str] = None
+    source: str = ""
 
 
 @attr.s(auto_attribs=True)
@@ -24,14 +52,144 @@ class TemplateArgs:
     mem: int
     cpu: int
     time: int
+    partition: Optional[str] = None
+    gres: Optional[str] = None
+    nodes: Optional[int] = None
+    ntasks: Optional[int] = None
+    constraint: Optional[str] = None
+
+
+def _mem(value: Any):
+    # Bare numbers are in MB
+    return int(value) if str(value).isdigit() else formatters.mem(str(value))
+
+
+# Fields of template files, with the function validating each of their values
+_FIELDS = {
+    "cpus": ("cpu", int),
+    "mem": ("mem", _mem),
+    "time": ("time", lambda value: formatters.time(str(value))),
+    "partition": ("partition", str),
+    "gres": ("gres", str),
+    "nodes": ("nodes", int),
+    "ntasks": ("ntasks", int),
+    "constraint": ("constraint", str),
+}
+
+_REQUIRED = ["cpus", "mem", "time"]
+
+
+def _packaged():
+    with impr.path("kslurm.data", "slurm_job_templates.json") as path:
+        return Path(path)
+
+
+def template_files() -> List[Path]:
+    """Get the template files that exist, from lowest to highest precedence
+
+    Templates are read from the packaged templates, the site templates (overridden
+    by the KSLURM_SITE_TEMPLATES environment variable), the user templates in the
+    kslurm config directory, then any kslurm-templates.json in the current directory
+    or its parents, the closest taking precedence
+    """
+    site = Path(os.environ.get(SITE_TEMPLATES_ENV) or SITE_TEMPLATES)
+    cwd = Path.cwd()
+    project = [
+        directory / PROJECT_TEMPLATES for directory in [*reversed(cwd.parents), cwd]
+    ]
+    return [
+        path for path in [_packaged(), site, USER_TEMPLATES, *project] if path.is_file()
+    ]
+
+
+def _compile(path: Path) -> Dict[str, Dict[str, Any]]:
+    """Read and validate the templates of a file"""
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as err:
+        raise TemplateError(f"Could not read job templates from {path}: {err}")
+    if not isinstance(data, dict):
+        raise TemplateError(f"Job templates in {path} must be a json object")
+    compiled: Dict[str, Dict[str, Any]] = {}
+    for name, fields in data.items():
+        if not isinstance(fields, dict):
+            raise TemplateError(f"Job template {name} in {path} must be an object")
+        if unknown := set(fields) - set(_FIELDS):
+            raise TemplateError(
+                f"Job template {name} in {path} has unknown fields: "
+                f"{', '.join(sorted(unknown))}"
+            )
+        if missing := [field for field in _REQUIRED if field not in fields]:
+            raise TemplateError(
+                f"Job template {name} in {path} is missing: {', '.join(missing)}"
+            )
+        template: Dict[str, Any] = {"source": str(path)}
+        for field, value in fields.items():
+            attribute, validate = _FIELDS[field]
+            try:
+                template[attribute] = validate(value)
+            except (ValueError, TypeError, ValidationError) as err:
+                raise TemplateError(
+                    f"Invalid {field} in job template {name} in {path}: {value}\n{err}"
+                )
+        compiled[name] = template
+    return compiled
+
+
+def _stamp(paths: List[Path]):
+    """Identify the current version of each template file"""
+    stamps: List[List[Any]] = []
+    for path in paths:
+        stat = path.stat()
+        stamps.append([str(path), stat.st_mtime_ns, stat.st_size])
+    return stamps
+
+
+def _read_index(path: Path, stamp: List[List[Any]]):
+    try:
+        with path.open("r") as f:
+            index = json.load(f)
+        if index["version"] == _INDEX_VERSION and index["sources"] == stamp:
+            return index["templates"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def _write_index(path: Path, stamp: List[List[Any]], compiled: Dict[str, Any]):
+    """Atomically store compiled templates. The index is only a cache, so any
+    failure to write is ignored
+    """
+    index = {"version": _INDEX_VERSION, "sources": stamp, "templates": compiled}
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
 
 
 @ft.cache
-def templates() -> Dict[str, Templates]:
-    with impr.open_text("kslurm.data", "slurm_job_templates.json") as stream:
-        data = json.load(stream)
-    cast(Dict[str, Templates], data)
-    return data
+def templates() -> Dict[str, JobTemplate]:
+    """Get all job templates, merged from every template file
+
+    Templates in files of higher precedence replace those of the same name. The
+    merged templates are compiled into an index in the kslurm cache, reused until any
+    template file is added, removed or modified
+    """
+    paths = template_files()
+    stamp = _stamp(paths)
+    index = appcache.CACHE_PATH / "templates.json"
+    compiled = _read_index(index, stamp)
+    if compiled is None:
+        compiled = {}
+        for path in paths:
+            compiled.update(_compile(path))
+        _write_index(index, stamp, compiled)
+    return {name: JobTemplate(**fields) for name, fields in compiled.items()}
 
 
 def set_template(template: str, mem: int, cpu: int, time: int):
@@ -39,19 +197,40 @@ def set_template(template: str, mem: int, cpu: int, time: int):
         if template not in templates():
             raise Exception(f"{template} is not a valid template")
 
-        return TemplateArgs(
-            mem=int(templates()[template]["mem"]),
-            cpu=int(templates()[template]["cpus"]),
-            time=formatters.time(templates()[template]["time"]),
-        )
+        values = attr.asdict(templates()[template])
+        del values["source"]
+        return TemplateArgs(**values)
     else:
         return TemplateArgs(mem=mem, cpu=cpu, time=time)
 
 
+def update_completion():
+    appcache.update_completion("templates", templates())
+
+
 def list_templates():
-    labelled_values = list(templates().values())
-    headers = ["name"] + list(labelled_values[0].keys())
-    values = [list(value.values()) for value in labelled_values]
-    entries = list(zip(templates().keys(), values))
-    table = [list(it.chain([entry[0]], entry[1])) for entry in entries]
+    from tabulate import tabulate
+
+    from kslurm.slurm.helpers import slurm_time_format
+
+    update_completion()
+
+    columns = ["cpu", "mem", "time"] + [
+        field
+        for field in ["partition", "gres", "nodes", "ntasks", "constraint"]
+        if any(getattr(value, field) is not None for value in templates().values())
+    ]
+    table = [
+        [
+            name,
+            *(
+                slurm_time_format(template.time)
+                if column == "time"
+                else getattr(template, column) or ""
+                for column in columns
+            ),
+        ]
+        for name, template in templates().items()
+    ]
+    headers = ["name", *("cpus" if column == "cpu" else column for column in columns)]
     print(tabulate(table, headers=headers, tablefmt="presto"))
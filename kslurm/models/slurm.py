@@ -75,7 +75,7 @@ class SlurmModel:
     )
 
     mem: int = shape(
-        match=r"^[0-9]+[KMGkmg][Ii]?[Bb]?$",
+        match=r"^[0-9]+[KMGTkmgt][Ii]?[Bb]?$",
         format=formatters.mem,
         default=4000,
         examples=["3000MB (3 GB)", "16G (16GB)"],
@@ -91,11 +91,13 @@ class SlurmModel:
     test: bool = flag(match=["-t", "--test"])
 
     job_template: str = keyword(
-        match=["-j", "--job-template"], format=validators.job_template
+        match=["-j", "--job-template"],
+        format=validators.job_template,
+        complete="templates",
     )
 
     list_job_templates: bool = flag(match=["-J", "--list", "-l"])
 
     account: str = keyword(match=["-a", "--account"])
 
-    venv: str = keyword(["--venv"], default="")
+    venv: str = keyword(["--venv"], default="", complete="venvs")
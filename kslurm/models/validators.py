@@ -3,10 +3,11 @@ from __future__ import absolute_import, annotations
 import re
 
 from kslurm.exceptions import TemplateError, ValidationError
-from kslurm.models.job_templates import templates
 
 
 def job_template(arg: str) -> str:
+    from kslurm.models.job_templates import templates
+
     if arg in templates():
         return arg
     raise TemplateError(f"{arg} is not a valid job-template")
@@ -0,0 +1,242 @@
+from __future__ import absolute_import, annotations
+
+import math
+import re
+import subprocess
+import tempfile
+from typing import Callable, Iterable, Iterator, Optional, Sequence
+
+import attrs
+
+from kslurm.slurm.jobs import ACTIVE_STATES, base_id
+
+SACCT_FIELDS = [
+    "JobID",
+    "JobName",
+    "State",
+    "AllocCPUS",
+    "TotalCPU",
+    "Elapsed",
+    "Timelimit",
+    "ReqMem",
+    "MaxRSS",
+]
+
+# Percentiles reported for each group of jobs
+PERCENTILES = (50, 90, 100)
+
+# Slurm memory units are binary. Sizes are given in MB, as understood by slurm
+_SIZE_UNITS = {"K": 2**-10, "M": 1, "G": 2**10, "T": 2**20, "P": 2**30}
+
+_SIZE_PATTERN = re.compile(r"^([0-9.]+)([KMGTP]?)([cn]?)$")
+
+_DURATION_PATTERN = re.compile(
+    r"^(?:(\d+)-)?(?:(\d+):)?(\d+):(\d+(?:\.\d+)?)$",
+)
+
+
+def parse_duration(text: str) -> Optional[float]:
+    """Read a duration reported by sacct ([D-][HH:]MM:SS[.sss]) as seconds
+
+    Returns None for blank or unlimited durations
+    """
+    if not (match := _DURATION_PATTERN.match(text.strip())):
+        return None
+    days, hours, minutes, seconds = match.groups()
+    return (
+        int(days or 0) * 86400
+        + int(hours or 0) * 3600
+        + int(minutes) * 60
+        + float(seconds)
+    )
+
+
+def parse_size(text: str, cpus: int = 1) -> Optional[float]:
+    """Read a memory size reported by sacct as MB
+
+    Sizes without a unit are in bytes, except ReqMem. Requests per cpu (e.g. 4000Mc,
+    from older versions of slurm) are multiplied by cpus
+    """
+    if not (match := _SIZE_PATTERN.match(text.strip())):
+        return None
+    value, unit, per = match.groups()
+    try:
+        size = float(value) * (_SIZE_UNITS[unit] if unit else 2**-20)
+    except ValueError:
+        return None
+    return size * cpus if per == "c" else size
+
+
+def _ratio(used: Optional[float], available: Optional[float]):
+    if used is None or not available:
+        return None
+    return used / available
+
+
+@attrs.frozen
+class JobUsage:
+    """Resources requested and used by a job, or a task of a job array
+
+    Times are in seconds and memory in MB. Values sacct didn't report are None
+    """
+
+    jobid: str
+    name: str
+    state: str
+    cpus: int
+    elapsed: Optional[float]
+    timelimit: Optional[float]
+    cpu_time: Optional[float]
+    req_mem: Optional[float]
+    max_rss: Optional[float]
+
+    @property
+    def cpu_efficiency(self):
+        """Fraction of the allocated cpu time spent computing"""
+        if self.elapsed is None:
+            return None
+        return _ratio(self.cpu_time, self.elapsed * self.cpus)
+
+    @property
+    def mem_efficiency(self):
+        """Peak memory use as a fraction of the memory requested"""
+        return _ratio(self.max_rss, self.req_mem)
+
+    @property
+    def time_efficiency(self):
+        """Run time as a fraction of the time limit"""
+        return _ratio(self.elapsed, self.timelimit)
+
+
+def read_usage(lines: Iterable[str]) -> Iterator[JobUsage]:
+    """Read jobs from the --parsable2 output of sacct, one at a time
+
+    Each job is followed by its steps, which give its peak memory use, so a job is
+    only yielded once the next one starts. Jobs still queued or running are skipped
+    """
+    job: Optional[list[str]] = None
+    max_rss: Optional[float] = None
+
+    def finish():
+        if job is None or job[2] in ACTIVE_STATES:
+            return None
+        cpus = int(job[3] or 0)
+        return JobUsage(
+            jobid=job[0],
+            name=job[1],
+            state=job[2],
+            cpus=cpus,
+            elapsed=parse_duration(job[5]),
+            timelimit=parse_duration(job[6]),
+            cpu_time=parse_duration(job[4]),
+            req_mem=parse_size(job[7], cpus),
+            max_rss=max_rss,
+        )
+
+    for line in lines:
+        fields = line.rstrip("\n").split("|")
+        if len(fields) != len(SACCT_FIELDS):
+            continue
+        fields[2] = fields[2].split(" ")[0]
+        if "." in fields[0]:
+            rss = parse_size(fields[8])
+            if rss is not None and (max_rss is None or rss > max_rss):
+                max_rss = rss
+            continue
+        if (usage := finish()) is not None:
+            yield usage
+        job, max_rss = fields, parse_size(fields[8])
+    if (usage := finish()) is not None:
+        yield usage
+
+
+def sacct_usage(
+    jobids: Sequence[str] = (),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+) -> Iterator[JobUsage]:
+    """Stream the resource use of jobs from a single sacct call
+
+    Jobs are selected by id, or by time range. Without either, sacct reports jobs of
+    the current user since midnight. Raises OSError if sacct can't be run
+    """
+    argv = ["sacct", "--noheader", "--parsable2", f"--format={','.join(SACCT_FIELDS)}"]
+    if jobids:
+        argv.append(f"--jobs={','.join(jobids)}")
+    if start:
+        argv.append(f"--starttime={start}")
+    if end:
+        argv.append(f"--endtime={end}")
+    # stderr goes to a file, as sacct could block on a full pipe while stdout is read
+    with tempfile.TemporaryFile("w+") as stderr:
+        with subprocess.Popen(
+            argv, stdout=subprocess.PIPE, stderr=stderr, text=True
+        ) as proc:
+            assert proc.stdout is not None
+            yield from read_usage(proc.stdout)
+        if proc.returncode != 0:
+            stderr.seek(0)
+            raise OSError(f"sacct failed: {stderr.read().strip()}")
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Get the q-th percentile of sorted values, by nearest rank"""
+    return values[max(math.ceil(q / 100 * len(values)) - 1, 0)]
+
+
+@attrs.frozen
+class UsageSummary:
+    """Percentiles of the efficiencies of a group of jobs
+
+    Each maps percentiles to efficiencies. Jobs missing a figure are left out of its
+    percentiles
+    """
+
+    group: str
+    jobs: int
+    cpu: dict[int, float]
+    mem: dict[int, float]
+    time: dict[int, float]
+
+
+def summarize(
+    usages: Iterable[JobUsage],
+    group: Callable[[JobUsage], str],
+    percentiles: Sequence[int] = PERCENTILES,
+) -> list[UsageSummary]:
+    """Aggregate job efficiencies into percentiles per group, sorted by group"""
+    figures: dict[str, tuple[list[float], list[float], list[float]]] = {}
+    counts: dict[str, int] = {}
+    for usage in usages:
+        key = group(usage)
+        counts[key] = counts.get(key, 0) + 1
+        cpu, mem, time = figures.setdefault(key, ([], [], []))
+        for values, value in [
+            (cpu, usage.cpu_efficiency),
+            (mem, usage.mem_efficiency),
+            (time, usage.time_efficiency),
+        ]:
+            if value is not None:
+                values.append(value)
+
+    def quantiles(values: list[float]):
+        values.sort()
+        return {q: percentile(values, q) for q in percentiles} if values else {}
+
+    return [
+        UsageSummary(key, counts[key], *(quantiles(values) for values in figures[key]))
+        for key in sorted(figures)
+    ]
+
+
+def by_name(usage: JobUsage):
+    return usage.name
+
+
+def by_template(templates: dict[str, Optional[str]]):
+    """Group jobs by the template they were submitted with, as recorded by kbatch"""
+
+    def group(usage: JobUsage):
+        return templates.get(base_id(usage.jobid)) or "-"
+
+    return group
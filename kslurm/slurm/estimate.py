@@ -0,0 +1,88 @@
+from __future__ import absolute_import, annotations
+
+import datetime as dt
+import re
+import subprocess
+import threading
+import time
+from typing import Optional
+
+from kslurm.appcache import Cache
+
+# Seconds for which an estimate is reused for jobs requesting the same resources
+ESTIMATE_TTL = 120
+
+_START_PATTERN = re.compile(r"(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})")
+
+
+def parse_start(output: str) -> Optional[dt.datetime]:
+    """Read the start time reported by sbatch --test-only"""
+    if match := _START_PATTERN.search(output):
+        return dt.datetime(*map(int, match.groups()))
+    return None
+
+
+class StartEstimate:
+    """Start time estimate of a job, as reported by sbatch --test-only
+
+    The probe is started on construction, so it runs alongside the real submission
+    rather than before it. Estimates are cached for ESTIMATE_TTL seconds, keyed by
+    the requested resources, so repeated submissions don't probe the controller
+    """
+
+    def __init__(self, argv: list[str], script: str, resources: str):
+        self._key = f"start-estimate:{resources}"
+        self._cached = self._read_cache()
+        self._proc: Optional[subprocess.Popen[str]] = None
+        self._stderr = ""
+        if self._cached is not None:
+            return
+        try:
+            self._proc = subprocess.Popen(
+                argv,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+        except OSError:
+            return
+        # The script is fed from a thread, so large scripts can't block submission
+        self._feeder = threading.Thread(target=self._communicate, args=(script,))
+        self._feeder.daemon = True
+        self._feeder.start()
+
+    def _communicate(self, script: str):
+        assert self._proc is not None
+        try:
+            _, self._stderr = self._proc.communicate(script)
+        except (OSError, ValueError):
+            pass
+
+    def _read_cache(self):
+        try:
+            path = Cache().get_path(self._key)
+            if time.time() - path.stat().st_mtime > ESTIMATE_TTL:
+                return None
+            return dt.datetime.fromisoformat(path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def cancel(self):
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.kill()
+
+    def result(self) -> Optional[dt.datetime]:
+        """Wait for the probe to finish and get its estimate, if any"""
+        if self._proc is None:
+            return self._cached
+        self._feeder.join()
+        if self._proc.returncode != 0:
+            return None
+        start = parse_start(self._stderr or "")
+        if start is not None:
+            try:
+                Cache()[self._key] = start.isoformat()
+            except OSError:
+                pass
+        return start
@@ -0,0 +1,450 @@
+from __future__ import absolute_import, annotations
+
+import datetime as dt
+import os
+import sqlite3
+import subprocess
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable, Optional, Tuple
+
+import appdirs
+import attrs
+
+from kslurm.utils import get_hash
+
+if TYPE_CHECKING:
+    from kslurm.slurm.slurm_command import SlurmCommand, SubmitResult
+
+JOBS_DB = Path(appdirs.user_data_dir("kslurm"), "jobs.db")
+
+
+# States of jobs that may still change, which are refreshed with sacct. In order of
+# precedence when summarizing the states of job arrays
+ACTIVE_STATES = (
+    "RUNNING",
+    "PENDING",
+    "CONFIGURING",
+    "COMPLETING",
+    "SUSPENDED",
+    "REQUEUED",
+    "REQUEUE_HOLD",
+    "REQUEUE_FED",
+    "RESIZING",
+    "SIGNALING",
+    "STAGE_OUT",
+    "STOPPED",
+)
+
+# States of jobs that ended without error
+SUCCESS_STATES = ("COMPLETED",)
+
+# Maximum number of job ids given to a single sacct call
+SACCT_BATCH = 500
+
+# Exit code of kslurm wait when jobs are still running once it times out, as with the
+# timeout command
+WAIT_TIMEOUT = 124
+
+# Seconds after which kslurm wait gives up on jobs sacct still doesn't know of. Jobs
+# just submitted may take a moment to appear, but unknown ids never will
+UNKNOWN_GRACE = 300
+
+# State, exit code, and elapsed time of a job, as reported by sacct
+JobState = Tuple[str, str, str]
+
+# State given to jobs unknown to sacct once UNKNOWN_GRACE has passed
+UNKNOWN: JobState = ("UNKNOWN", "", "")
+
+# Final state, peak_mem, run_time and cores of a job (see JobRecord)
+ResourceUse = Tuple[str, Optional[float], Optional[float], Optional[float]]
+
+# Scripts bringing the database from each version to the next, by user_version
+_MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS jobs (
+    jobid TEXT PRIMARY KEY,
+    cluster TEXT,
+    name TEXT,
+    slurm_args TEXT NOT NULL,
+    script_hash TEXT NOT NULL,
+    command TEXT NOT NULL,
+    cwd TEXT NOT NULL,
+    venv TEXT,
+    template TEXT,
+    cpu INTEGER NOT NULL,
+    mem INTEGER NOT NULL,
+    time INTEGER NOT NULL,
+    gpu INTEGER NOT NULL,
+    submitted TEXT NOT NULL,
+    state TEXT,
+    exit_code TEXT,
+    elapsed TEXT,
+    updated TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_submitted ON jobs (submitted);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+CREATE INDEX IF NOT EXISTS jobs_cwd ON jobs (cwd);
+CREATE INDEX IF NOT EXISTS jobs_script_hash ON jobs (script_hash);
+""",
+    """
+ALTER TABLE jobs ADD COLUMN fingerprint TEXT;
+ALTER TABLE jobs ADD COLUMN peak_mem REAL;
+ALTER TABLE jobs ADD COLUMN run_time REAL;
+ALTER TABLE jobs ADD COLUMN cores REAL;
+CREATE INDEX IF NOT EXISTS jobs_fingerprint ON jobs (fingerprint);
+""",
+]
+
+
+def _now():
+    return dt.datetime.now().isoformat(timespec="seconds")
+
+
+@attrs.frozen
+class JobRecord:
+    """A job submitted by kslurm
+
+    Resources are those requested, with mem in MB and time in minutes. state,
+    exit_code and elapsed are as last reported by sacct, and are None until the job
+    is first refreshed. fingerprint identifies the command independently of its
+    arguments (see kslurm.slurm.sizing). Once a job completes, peak_mem (MB),
+    run_time (seconds) and cores (average number of cpus kept busy) record its
+    actual use, taking the maximum over the tasks of job arrays
+    """
+
+    jobid: str
+    slurm_args: str
+    script_hash: str
+    command: str
+    cwd: str
+    cpu: int
+    mem: int
+    time: int
+    gpu: bool = attrs.field(converter=bool)
+    submitted: str = attrs.field(factory=_now)
+    cluster: Optional[str] = None
+    name: Optional[str] = None
+    venv: Optional[str] = None
+    template: Optional[str] = None
+    state: Optional[str] = None
+    exit_code: Optional[str] = None
+    elapsed: Optional[str] = None
+    updated: Optional[str] = None
+    fingerprint: Optional[str] = None
+    peak_mem: Optional[float] = None
+    run_time: Optional[float] = None
+    cores: Optional[float] = None
+
+    @property
+    def active(self):
+        return self.state is None or self.state in ACTIVE_STATES
+
+    @classmethod
+    def from_submission(
+        cls,
+        slurm: SlurmCommand,
+        result: SubmitResult,
+        fingerprint: Optional[str] = None,
+    ):
+        assert result.jobid is not None
+        return cls(
+            jobid=result.jobid,
+            cluster=result.cluster,
+            slurm_args=slurm.slurm_args,
+            script_hash=get_hash(slurm.job_script),
+            command=slurm.command,
+            cwd=os.getcwd(),
+            cpu=slurm.cpu,
+            mem=slurm.mem,
+            time=slurm.minutes,
+            gpu=slurm.gpu,
+            name=slurm.name or None,
+            venv=slurm.venv,
+            template=slurm.job_template or None,
+            fingerprint=fingerprint,
+        )
+
+
+_FIELDS = [field.name for field in attrs.fields(JobRecord)]
+
+
+class JobRegistry:
+    """Database of the jobs submitted by kslurm"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self._path = path or JOBS_DB
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self._path, timeout=10)
+            self._db.row_factory = sqlite3.Row
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            for version, script in enumerate(_MIGRATIONS[version:], version + 1):
+                # Each migration is applied along with its version, or not at all
+                try:
+                    self._db.executescript(
+                        f"BEGIN; {script} PRAGMA user_version = {version}; COMMIT;"
+                    )
+                except sqlite3.Error:
+                    self._db.rollback()
+                    raise
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def add(self, record: JobRecord):
+        values = attrs.asdict(record)
+        with self.db:
+            self.db.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(_FIELDS)}) "
+                f"VALUES ({', '.join(f':{field}' for field in _FIELDS)})",
+                values,
+            )
+
+    def query(
+        self,
+        jobids: Iterable[str] = (),
+        states: Iterable[str] = (),
+        cwd: Optional[str] = None,
+        limit: Optional[int] = None,
+        fingerprint: Optional[str] = None,
+    ) -> list[JobRecord]:
+        """Get recorded jobs, most recently submitted first
+
+        Jobs are filtered by any of the given ids, by any of the given states, by the
+        directory from which they were submitted, and by fingerprint. Jobs not yet
+        refreshed match the PENDING state
+        """
+        clauses: list[str] = []
+        params: list[object] = []
+        if jobids := list(jobids):
+            clauses.append(f"jobid IN ({', '.join('?' * len(jobids))})")
+            params.extend(jobids)
+        if states := [state.upper() for state in states]:
+            pending = " OR state IS NULL" if "PENDING" in states else ""
+            clauses.append(f"(state IN ({', '.join('?' * len(states))}){pending})")
+            params.extend(states)
+        if cwd is not None:
+            clauses.append("cwd = ?")
+            params.append(cwd)
+        if fingerprint is not None:
+            clauses.append("fingerprint = ?")
+            params.append(fingerprint)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT * FROM jobs {where} ORDER BY submitted DESC, rowid DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [
+            JobRecord(**{field: row[field] for field in _FIELDS})
+            for row in self.db.execute(sql, params)
+        ]
+
+    def update(self, states: dict[str, JobState]):
+        """Store the states of recorded jobs, as given by sacct
+
+        Returns the time of the update
+        """
+        updated = _now()
+        with self.db:
+            self.db.executemany(
+                "UPDATE jobs SET state = ?, exit_code = ?, elapsed = ?, updated = ? "
+                "WHERE jobid = ?",
+                [(*state, updated, jobid) for jobid, state in states.items()],
+            )
+        return updated
+
+    def update_usage(self, usages: dict[str, ResourceUse]):
+        """Store the final state and the peak_mem, run_time and cores of jobs"""
+        with self.db:
+            self.db.executemany(
+                "UPDATE jobs SET state = ?, peak_mem = ?, run_time = ?, cores = ?, "
+                "updated = ? WHERE jobid = ?",
+                [(*usage, _now(), jobid) for jobid, usage in usages.items()],
+            )
+
+    def refresh(self, records: list[JobRecord]) -> list[JobRecord]:
+        """Update the state of active jobs with batched sacct calls
+
+        Returns the records with their new state. Records are returned unchanged if
+        sacct can't be run
+        """
+        try:
+            states = sacct([record.jobid for record in records if record.active])
+        except OSError:
+            return records
+        if not states:
+            return records
+        updated = self.update(states)
+        return [
+            attrs.evolve(
+                record,
+                state=states[record.jobid][0],
+                exit_code=states[record.jobid][1],
+                elapsed=states[record.jobid][2],
+                updated=updated,
+            )
+            if record.jobid in states
+            else record
+            for record in records
+        ]
+
+
+def base_id(jobid: str):
+    """Get the id of a job from the id of one of its array tasks or components
+
+    Ids as printed by sbatch --parsable (jobid;cluster) are also accepted
+    """
+    return jobid.split(";")[0].split("_")[0].split("+")[0]
+
+
+def _combine(entries: list[JobState]):
+    """Summarize the states of the tasks of a job array as a single state
+
+    An array is active while any of its tasks are, and otherwise takes the state of
+    its first unsuccessful task
+    """
+    for state in ACTIVE_STATES:
+        for entry in entries:
+            if entry[0] == state:
+                return entry
+    for entry in entries:
+        if entry[0] not in SUCCESS_STATES:
+            return entry
+    return entries[0]
+
+
+def _sacct(jobids: list[str]) -> dict[str, JobState]:
+    proc = subprocess.run(
+        [
+            "sacct",
+            "--jobs",
+            ",".join(jobids),
+            "--allocations",
+            "--noheader",
+            "--parsable2",
+            "--format=JobID,State,ExitCode,Elapsed",
+        ],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if proc.returncode != 0:
+        raise OSError(f"sacct failed: {proc.stderr.strip()}")
+    entries: dict[str, list[JobState]] = {}
+    for line in proc.stdout.splitlines():
+        fields = line.split("|")
+        if len(fields) != 4:
+            continue
+        jobid, state, exit_code, elapsed = fields
+        # Array tasks and components of heterogenous jobs are reported separately
+        jobid = base_id(jobid)
+        # e.g. CANCELLED by 1234
+        state = state.split(" ")[0]
+        entries.setdefault(jobid, []).append((state, exit_code, elapsed))
+    return {jobid: _combine(states) for jobid, states in entries.items()}
+
+
+def sacct(jobids: Iterable[str]) -> dict[str, JobState]:
+    """Get the state, exit code and elapsed time of jobs, keyed by job id
+
+    Ids are given to sacct in batches of SACCT_BATCH, so usually in a single call.
+    Job arrays are summarized as a single state. Jobs not known to sacct are left out.
+    Raises OSError if sacct can't be run
+    """
+    ids = list(dict.fromkeys(base_id(jobid) for jobid in jobids))
+    states: dict[str, JobState] = {}
+    for i in range(0, len(ids), SACCT_BATCH):
+        states.update(_sacct(ids[i : i + SACCT_BATCH]))
+    return states
+
+
+def wait(
+    jobids: Iterable[str],
+    interval: float = 5,
+    max_interval: float = 300,
+    timeout: Optional[float] = None,
+    on_finish: Optional[Callable[[str, JobState], None]] = None,
+    grace: float = UNKNOWN_GRACE,
+) -> dict[str, JobState]:
+    """Wait for jobs to finish, polling all of them with one sacct query each time
+
+    The polling interval doubles after each query, up to max_interval. on_finish is
+    called with each job as it finishes. Returns the final states of the jobs that
+    finished, which will be all of them unless the timeout is reached first. Jobs
+    sacct doesn't yet know of, e.g. those just submitted, are waited on as pending
+    for grace seconds, then finish as UNKNOWN. Raises OSError if sacct can't be run
+    """
+    remaining = list(dict.fromkeys(base_id(jobid) for jobid in jobids))
+    finished: dict[str, JobState] = {}
+    start = time.monotonic()
+    deadline = None if timeout is None else start + timeout
+    while True:
+        states = sacct(remaining)
+        now = time.monotonic()
+        for jobid in remaining:
+            state = states.get(jobid)
+            if state is None and now - start >= grace:
+                state = UNKNOWN
+            if state is not None and state[0] not in ACTIVE_STATES:
+                finished[jobid] = state
+                if on_finish is not None:
+                    on_finish(jobid, state)
+        remaining = [jobid for jobid in remaining if jobid not in finished]
+        if not remaining:
+            return finished
+        delay = interval
+        if deadline is not None:
+            delay = min(delay, deadline - now)
+            if delay <= 0:
+                return finished
+        time.sleep(delay)
+        interval = min(interval * 2, max_interval)
+
+
+def wait_status(jobids: Iterable[str], finished: dict[str, JobState]):
+    """Summarize the outcome of waiting on jobs as an exit code
+
+    0 if every job completed successfully, WAIT_TIMEOUT if any are still running, and
+    1 if any failed, were cancelled, or otherwise ended unsuccessfully
+    """
+    ids = [base_id(jobid) for jobid in jobids]
+    if any(jobid not in finished for jobid in ids):
+        return WAIT_TIMEOUT
+    if any(finished[jobid][0] not in SUCCESS_STATES for jobid in ids):
+        return 1
+    return 0
+
+
+def record_submission(
+    slurm: SlurmCommand, result: SubmitResult, fingerprint: Optional[str] = None
+):
+    """Add a submitted job to the registry
+
+    The registry is only a record, so failing to write it never fails a submission
+    """
+    registry = JobRegistry()
+    try:
+        registry.add(JobRecord.from_submission(slurm, result, fingerprint))
+    except (sqlite3.Error, OSError):
+        pass
+    finally:
+        registry.close()
+
+
+def record_states(states: dict[str, JobState]):
+    """Store the states of any recorded jobs among states, ignoring failures"""
+    registry = JobRegistry()
+    try:
+        registry.update(states)
+    except (sqlite3.Error, OSError):
+        pass
+    finally:
+        registry.close()
@@ -0,0 +1,169 @@
+from __future__ import absolute_import
+
+import datetime as dt
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from types import FrameType
+from typing import Any, Optional
+
+from kslurm.args import keyword, positional
+from kslurm.args.command import command
+
+
+class _Stopped(Exception):
+    pass
+
+
+def _stop(signum: int, frame: Optional[FrameType]):
+    raise _Stopped()
+
+
+def read_results(path: Path) -> dict[int, dict[str, Any]]:
+    """Read the results recorded for each task, keyed by task number
+
+    Lines that can't be read, such as one cut short by the end of the job, are skipped
+    """
+    results: dict[int, dict[str, Any]] = {}
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                    results[int(result["task"])] = result
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return results
+
+
+def pending_tasks(commands: list[str], results: Path):
+    """Get the numbers of the tasks without a recorded result, counting from 1
+
+    A result only counts if it was recorded for the same command, so editing a line
+    of the command file reruns it
+    """
+    done = read_results(results)
+    return [
+        task
+        for task, cmd in enumerate(commands, 1)
+        if done.get(task, {}).get("command") != cmd
+    ]
+
+
+def _end_line(path: Path):
+    """Terminate a last line cut short when the pack was stopped, if any"""
+    try:
+        with path.open("rb+") as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+    except FileNotFoundError:
+        pass
+
+
+def task_argv(cmd: str, cpus: int = 0, mem: int = 0) -> list[str]:
+    """Arguments running one task
+
+    Within an allocation, each task is run as its own job step, limited to its share
+    of the allocation. Elsewhere, tasks are run as local processes
+    """
+    argv = ["bash", "-c", cmd]
+    in_job = os.environ.get("SLURM_JOB_ID") or os.environ.get("SLURM_JOBID")
+    if not in_job or shutil.which("srun") is None:
+        return argv
+    resources = [f"--cpus-per-task={cpus}"] if cpus else []
+    resources += [f"--mem={mem}"] if mem else []
+    return ["srun", "--exact", "--ntasks=1", "--nodes=1", *resources, *argv]
+
+
+def run_pack(
+    commands: list[str], results: Path, slots: int, cpus: int = 0, mem: int = 0
+) -> int:
+    """Run commands, keeping up to slots of them running at once
+
+    The exit code and timing of each task is appended to results as a line of json
+    as soon as it finishes. Tasks already recorded in results are skipped, so a pack
+    stopped by its time limit picks up where it left off when run again. Tasks still
+    running when the pack is stopped are killed and left unrecorded.
+
+    Returns 0 if every task succeeded
+    """
+    pending = deque(pending_tasks(commands, results))
+    running: dict[int, tuple[subprocess.Popen[bytes], int, float, dt.datetime]] = {}
+    failed = any(
+        result.get("exit") != 0
+        for task, result in read_results(results).items()
+        if task not in pending
+    )
+    handlers = {
+        sig: signal.signal(sig, _stop) for sig in (signal.SIGTERM, signal.SIGINT)
+    }
+    try:
+        _end_line(results)
+        with results.open("a", encoding="utf-8") as f:
+            while pending or running:
+                while pending and len(running) < slots:
+                    task = pending.popleft()
+                    proc = subprocess.Popen(task_argv(commands[task - 1], cpus, mem))
+                    running[proc.pid] = (
+                        proc,
+                        task,
+                        time.monotonic(),
+                        dt.datetime.now(),
+                    )
+                pid, status = os.wait()
+                if pid not in running:
+                    continue
+                proc, task, start, started = running.pop(pid)
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                failed = failed or proc.returncode != 0
+                result = {
+                    "task": task,
+                    "command": commands[task - 1],
+                    "exit": proc.returncode,
+                    "start": started.isoformat(timespec="seconds"),
+                    "seconds": round(time.monotonic() - start, 3),
+                }
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+    except _Stopped:
+        # slurm may signal every process of the job, so further signals are ignored
+        # while the tasks are stopped
+        for sig in handlers:
+            signal.signal(sig, signal.SIG_IGN)
+        for proc, *_ in running.values():
+            proc.terminate()
+        for proc, *_ in running.values():
+            proc.wait()
+        return 143
+    finally:
+        for sig, handler in handlers.items():
+            signal.signal(sig, handler)
+    return 1 if failed else 0
+
+
+@command(inline=True)
+def main(
+    index: Path = positional(format=Path, help="File of commands, one per line"),
+    results: Path = positional(format=Path, help="File to which results are written"),
+    slots: int = keyword(["--slots"], default=1, format=int),
+    cpus: int = keyword(["--cpus"], default=0, format=int),
+    mem: int = keyword(["--mem"], default=0, format=int),
+):
+    """Run the tasks of a packed job"""
+    commands = index.read_text(encoding="utf-8").splitlines()
+    return run_pack(commands, results, max(slots, 1), cpus, mem)
+
+
+if __name__ == "__main__":
+    sys.exit(main.cli(["python -m kslurm.slurm.pack", *sys.argv[1:]]))
@@ -0,0 +1,219 @@
+from __future__ import absolute_import, annotations
+
+import datetime as dt
+import math
+import os
+import re
+import shlex
+import sqlite3
+import time
+from typing import Optional, Sequence
+
+import attrs
+
+import kslurm.slurm.helpers as helpers
+import kslurm.slurm.jobs as jobs
+from kslurm.appcache import Cache
+from kslurm.slurm.efficiency import sacct_usage
+from kslurm.slurm.jobs import (
+    ACTIVE_STATES,
+    SUCCESS_STATES,
+    JobRecord,
+    JobRegistry,
+    ResourceUse,
+    base_id,
+)
+from kslurm.utils import get_hash
+
+# Fraction added to the peak use of previous runs when sizing a job
+DEFAULT_MARGIN = 0.2
+
+# Number of the most recent runs of a command used to size it
+HISTORY = 20
+
+# Number of completed runs needed before a command is sized
+MIN_HISTORY = 3
+
+# Seconds between sacct lookups of the use of runs of the same command, so bulk
+# submissions don't each wait on slurmdbd
+LOOKUP_TTL = 300
+
+_DIGITS = re.compile(r"\d+")
+
+
+def _normalize(arg: str):
+    if arg.startswith("-") and "=" in arg:
+        option, value = arg.split("=", 1)
+        return f"{option}={_normalize(value)}"
+    if "/" in arg:
+        # Paths are reduced to their extension, e.g. sub-01/anat.nii.gz -> *.nii.gz
+        name = os.path.basename(arg.rstrip("/"))
+        return "*" + name[name.find(".") :] if "." in name else "*"
+    return _DIGITS.sub("#", arg)
+
+
+def fingerprint(command: Sequence[str]) -> Optional[str]:
+    """Identify a command independently of the data it's run on
+
+    The fingerprint combines the name of the executable with its args, where paths
+    are reduced to their extension and numbers are masked. Commands given as a single
+    string are split as by the shell
+    """
+    if len(command) == 1:
+        try:
+            command = shlex.split(command[0])
+        except ValueError:
+            command = command[0].split()
+    if not command:
+        return None
+    executable = os.path.basename(command[0])
+    return get_hash(shlex.join([executable, *map(_normalize, command[1:])]))
+
+
+@attrs.frozen
+class Sizing:
+    """Resources suggested for a job, with mem in MB and time in minutes
+
+    runs is the number of previous runs on which the suggestion is based
+    """
+
+    cpu: int
+    mem: int
+    time: int
+    runs: int
+
+    def __str__(self):
+        return (
+            f"{self.cpu} cpu{'s' if self.cpu > 1 else ''}, {self.mem}MB, "
+            f"{helpers.slurm_time_format(self.time)}"
+        )
+
+
+def _may_have_ended(record: JobRecord, now: dt.datetime):
+    """Whether a job is known to have ended, or has outlived its time limit"""
+    if record.state is not None and record.state not in ACTIVE_STATES:
+        return True
+    submitted = dt.datetime.fromisoformat(record.submitted)
+    return submitted + dt.timedelta(minutes=record.time) < now
+
+
+def _lookup_due(fingerprint: str):
+    """Whether the use of runs of a command may be read with sacct
+
+    Lookups are allowed once every LOOKUP_TTL seconds per command, and each allowed
+    lookup is recorded, whether or not it then succeeds
+    """
+    try:
+        path = Cache().get_path(f"sizing-lookup:{fingerprint}")
+    except OSError:
+        return True
+    try:
+        if time.time() - path.stat().st_mtime < LOOKUP_TTL:
+            return False
+    except OSError:
+        pass
+    try:
+        path.touch()
+    except OSError:
+        pass
+    return True
+
+
+def _update_usage(registry: JobRegistry, jobids: list[str]):
+    """Read the use of finished jobs with one sacct call and store it"""
+    usages: dict[str, ResourceUse] = {}
+    for usage in sacct_usage(jobids):
+        jobid = base_id(usage.jobid)
+        previous = usages.get(jobid)
+        if previous is not None and previous[0] not in SUCCESS_STATES:
+            continue
+        if usage.state not in SUCCESS_STATES:
+            # Failed runs don't show what a job needs, so aren't used for sizing
+            usages[jobid] = (usage.state, None, None, None)
+            continue
+        if usage.max_rss is None:
+            # Memory use isn't known for every run, e.g. of very short jobs
+            usages.setdefault(jobid, (usage.state, None, None, None))
+            continue
+        cores = (usage.cpu_time or 0) / usage.elapsed if usage.elapsed else 0
+        peak_mem, run_time, prev_cores = previous[1:] if previous else (0, 0, 0)
+        usages[jobid] = (
+            usage.state,
+            max(peak_mem or 0, usage.max_rss),
+            max(run_time or 0, usage.elapsed or 0),
+            max(prev_cores or 0, cores),
+        )
+    registry.update_usage(usages)
+
+
+def suggest(
+    registry: JobRegistry,
+    fingerprint: str,
+    cpu: int,
+    mem: int,
+    time: int,
+    margin: float = DEFAULT_MARGIN,
+) -> Optional[Sizing]:
+    """Suggest tighter resources for a job from previous runs of the same command
+
+    Jobs are sized to the peak use of their last HISTORY completed runs, plus margin.
+    Resources are only ever lowered, and nothing is suggested without at least
+    MIN_HISTORY runs, or if the requested resources are already tight. The use of
+    runs that have ended, or outlived their time limit, is read with a single call
+    to sacct if not yet recorded, at most once every LOOKUP_TTL seconds per command
+    """
+    records = [
+        record
+        for record in registry.query(fingerprint=fingerprint, limit=HISTORY)
+        if record.active or record.state in SUCCESS_STATES
+    ]
+    now = dt.datetime.now()
+    unsized = [
+        record.jobid
+        for record in records
+        if record.peak_mem is None and _may_have_ended(record, now)
+    ]
+    if len(records) < MIN_HISTORY:
+        return None
+    if unsized and _lookup_due(fingerprint):
+        try:
+            _update_usage(registry, unsized)
+        except OSError:
+            pass
+        records = registry.query(jobids=[record.jobid for record in records])
+    runs = [
+        record
+        for record in records
+        if record.state in SUCCESS_STATES and record.peak_mem is not None
+    ]
+    if len(runs) < MIN_HISTORY:
+        return None
+    scale = 1 + margin
+    cores = max(run.cores or 0 for run in runs) * scale
+    peak_mem = max(run.peak_mem or 0 for run in runs) * scale
+    run_time = max(run.run_time or 0 for run in runs) * scale
+    sizing = Sizing(
+        cpu=min(cpu, max(1, math.ceil(cores))),
+        # Rounded up to a multiple of 100MB
+        mem=min(mem, max(100, math.ceil(peak_mem / 100) * 100)),
+        time=min(time, max(1, math.ceil(run_time / 60))),
+        runs=len(runs),
+    )
+    if (sizing.cpu, sizing.mem, sizing.time) == (cpu, mem, time):
+        return None
+    return sizing
+
+
+def suggest_for(
+    fingerprint: str, cpu: int, mem: int, time: int, margin: float = DEFAULT_MARGIN
+) -> Optional[Sizing]:
+    """Suggest resources as with suggest, ignoring any failure to read the registry"""
+    if not jobs.JOBS_DB.exists():
+        return None
+    registry = JobRegistry()
+    try:
+        return suggest(registry, fingerprint, cpu, mem, time, margin)
+    except (sqlite3.Error, OSError):
+        return None
+    finally:
+        registry.close()
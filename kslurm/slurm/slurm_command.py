@@ -3,9 +3,12 @@ from __future__ import absolute_import, annotations
 import importlib.resources as impr
 import os
 import shlex
+import subprocess
 import sys
 from pathlib import Path
-from typing import List, Union
+from typing import List, Optional, Union
+
+import attrs
 
 import kslurm.appconfig as appconfig
 import kslurm.bin
@@ -21,6 +24,25 @@ _LOAD_ENV = (
 )
 
 
+@attrs.frozen
+class SubmitResult:
+    """Outcome of an sbatch submission
+
+    jobid and cluster are read from the --parsable output of sbatch, and are None if
+    the submission failed or nothing was submitted
+    """
+
+    returncode: int
+    jobid: Optional[str] = None
+    cluster: Optional[str] = None
+    stdout: str = ""
+    stderr: str = ""
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+
 class SlurmCommand:
     def __init__(
         self,
@@ -30,6 +52,7 @@ class SlurmCommand:
     ):
         self._name = ""
         self._output = ""
+        self._array = ""
 
         if isinstance(args, TemplateError):
             print(args.msg)
@@ -52,6 +75,11 @@ class SlurmCommand:
         self.time = template_vals.time
         self.cpu = template_vals.cpu
         self.mem = template_vals.mem
+        self.partition = template_vals.partition
+        self.gres = template_vals.gres
+        self.nodes = template_vals.nodes
+        self.ntasks = template_vals.ntasks
+        self.constraint = template_vals.constraint
 
         # Then update if values were specifically supplied on the command line
         if arglist["time"].value is not None:
@@ -61,7 +89,10 @@ class SlurmCommand:
         if arglist["mem"].value is not None:
             self.mem = args.mem
 
-        self.gpu = bool(args.gpu)
+        # Templates requesting gpus are charged to the gpu account
+        self.gpu = bool(args.gpu) or any(
+            res.startswith("gpu") for res in (self.gres or "").split(",")
+        )
         self.x11 = bool(args.x11)
         config = appconfig.Config()
         if not args.account:
@@ -102,6 +133,10 @@ class SlurmCommand:
     def time(self, time: int):
         self._time = time
 
+    @property
+    def minutes(self):
+        return self._time
+
     @property
     def name(self):
         return self._name
@@ -116,27 +151,107 @@ class SlurmCommand:
 
     @output.setter
     def output(self, output: str):
-        self._output = f'--output="{output}"'
+        self._output = output
+
+    @property
+    def venv(self):
+        return self._venv
 
     def set_venv(self, name: str):
         self._venv = name
 
+    def set_array(self, index: Path, tasks: int, throttle: Optional[int] = None):
+        """Submit as a job array, where each task runs one line of the index file
+
+        Lines are numbered from 1, matching the task ids. throttle limits the number
+        of tasks running at once
+        """
+        self._array = f"1-{tasks}" + (f"%{throttle}" if throttle is not None else "")
+        line = f'sed -n "${{SLURM_ARRAY_TASK_ID}}p" {shlex.quote(str(index))}'
+        self._command = [f'eval "$({line})"']
+
+    def set_pack(self, index: Path, results: Path, slots: int):
+        """Run every line of the index file within this one job, slots at a time
+
+        Each task gets an equal share of the requested cpus and memory. Exit codes
+        and timings are written to the results file
+        """
+        self._command = [
+            shlex.join(
+                [
+                    sys.executable,
+                    "-m",
+                    "kslurm.slurm.pack",
+                    str(index),
+                    str(results),
+                    "--slots",
+                    str(slots),
+                    "--cpus",
+                    str(max(self.cpu // slots, 1)),
+                    "--mem",
+                    str(self.mem // slots),
+                ]
+            )
+        ]
+
     ###
     # Command line strings
     ###
     @property
-    def slurm_args(self):
-        s = (
-            f"--account={self.account} --time={self.time} "
-            f"--cpus-per-task={self.cpu} --mem={self.mem}"
+    def resources(self):
+        """Key identifying the resources requested, independent of the command"""
+        return ":".join(
+            str(value or "")
+            for value in [
+                self.account,
+                self.cpu,
+                self.mem,
+                self.time,
+                self.gres_spec,
+                self.partition,
+                self.nodes,
+                self.ntasks,
+                self.constraint,
+            ]
         )
-        if self.gpu:
-            s += " --gres=gpu:1"
+
+    @property
+    def gres_spec(self):
+        """Generic resources from the template, with a gpu added by --gpu"""
+        gres = self.gres.split(",") if self.gres else []
+        if self.gpu and not any(res.startswith("gpu") for res in gres):
+            gres.append("gpu:1")
+        return ",".join(gres)
+
+    @property
+    def slurm_argv(self):
+        argv = [
+            f"--account={self.account}",
+            f"--time={self.time}",
+            f"--cpus-per-task={self.cpu}",
+            f"--mem={self.mem}",
+        ]
+        if self.partition:
+            argv.append(f"--partition={self.partition}")
+        if self.nodes:
+            argv.append(f"--nodes={self.nodes}")
+        if self.ntasks:
+            argv.append(f"--ntasks={self.ntasks}")
+        if self.constraint:
+            argv.append(f"--constraint={self.constraint}")
+        if gres := self.gres_spec:
+            argv.append(f"--gres={gres}")
         if self.x11:
-            s += " --x11"
+            argv.append("--x11")
         if self.name:
-            s += f" --job-name='{self.name}'"
-        return s
+            argv.append(f"--job-name={self.name}")
+        if self._array:
+            argv.append(f"--array={self._array}")
+        return argv
+
+    @property
+    def slurm_args(self):
+        return shlex.join(self.slurm_argv)
 
     @property
     def command(self):
@@ -150,6 +265,13 @@ class SlurmCommand:
     def script(self):
         return "\n".join(["#!/bin/bash", self.venv_load, self.command])
 
+    @property
+    def job_script(self):
+        """Text of the job script as submitted"""
+        if script := self._script_file:
+            return Path(script).read_text()
+        return self.script
+
     @property
     def venv_load(self):
         if self._venv:
@@ -168,42 +290,82 @@ class SlurmCommand:
     # Job submission commands
     ###
     @property
-    def run(self):
+    def run_argv(self):
+        """Arguments of the srun or salloc call running the job interactively"""
         if self.command:
             if os.environ.get("SLURM_JOB_ID") or os.environ.get("SLURM_JOBID"):
-                return f"srun {self.slurm_args} {self.command}"
+                return ["srun", *self.slurm_argv, "bash", "-c", self.command]
             command = self.venv_load + self.command
-            return f"srun {self.slurm_args} bash -c {shlex.quote(command)}"
+            return ["srun", *self.slurm_argv, "bash", "-c", command]
         command = (
-            "srun --pty bash -c "
-            + shlex.quote(f'bash --init-file <(echo "{self.venv_load}";)')
+            ["srun", "--pty", "bash", "-c"]
+            + [f'bash --init-file <(echo "{self.venv_load}";)']
             if self.venv_load
-            else ""
+            else []
         )
-        return f"salloc {self.slurm_args} {command}"
+        return ["salloc", *self.slurm_argv, *command]
 
     @property
-    def batch(self):
-        if self.test:
-            s = "cat"
-        else:
-            s = f"sbatch {self.slurm_args} --parsable {self.output}"
-        if self.command:
-            if "/" in self._command[0] and Path(self._command[0]).is_file():
-                try:
-                    with open(self._command[0], "r", encoding="utf-8") as f:
-                        if f.readline().startswith("#/"):
-                            return f"{s} {self.command}"
-                except UnicodeDecodeError:
-                    pass
-            return f"echo {shlex.quote(self.script)} | {s}"
-        else:
+    def run(self):
+        return shlex.join(self.run_argv)
+
+    @property
+    def _script_file(self):
+        """Path of the command if it is a script to be submitted directly"""
+        if "/" in self._command[0] and Path(self._command[0]).is_file():
+            try:
+                with open(self._command[0], "r", encoding="utf-8") as f:
+                    if f.readline().startswith("#/"):
+                        return self._command[0]
+            except UnicodeDecodeError:
+                pass
+        return None
+
+    @property
+    def batch_argv(self):
+        """Arguments of the sbatch call submitting the job
+
+        Unless the command is a script file, the job script must be given on stdin
+        """
+        if not self.command:
             raise ValidationError("No command given")
+        output = [f"--output={self.output}"] if self.output else []
+        script = self._script_file
+        return [
+            "sbatch",
+            *self.slurm_argv,
+            "--parsable",
+            *output,
+            *([script, *self._command[1:]] if script else []),
+        ]
 
     @property
-    def batch_test(self):
-        s = f"sbatch {self.slurm_args} --test-only"
-        if self.command:
-            return f"echo {shlex.quote(self.script)} | {s}"
-        else:
+    def batch_test_argv(self):
+        """Arguments of an sbatch --test-only call, given the job script on stdin"""
+        if not self.command:
             raise ValidationError("No command given")
+        return ["sbatch", *self.slurm_argv, "--test-only"]
+
+    def submit(self) -> SubmitResult:
+        """Submit the job with sbatch, without going through a shell
+
+        In test mode, nothing is submitted and the job script is returned as stdout
+        """
+        argv = self.batch_argv
+        if self.test:
+            return SubmitResult(returncode=0, stdout=self.job_script)
+        stdin = None if self._script_file else self.script
+        try:
+            proc = subprocess.run(
+                argv, input=stdin, capture_output=True, text=True, check=False
+            )
+        except OSError as err:
+            return SubmitResult(returncode=127, stderr=f"{argv[0]}: {err.strerror}")
+        jobid, _, cluster = proc.stdout.strip().partition(";")
+        return SubmitResult(
+            returncode=proc.returncode,
+            jobid=(jobid or None) if proc.returncode == 0 else None,
+            cluster=cluster or None,
+            stdout=proc.stdout,
+            stderr=proc.stderr,
+        )
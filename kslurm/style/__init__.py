@@ -3,9 +3,10 @@ __submodules__ = ["console"]
 # <AUTOGEN_INIT>
 from kslurm.style.console import (
     console,
+    reset,
     stderr,
 )
 
-__all__ = ["console", "stderr"]
+__all__ = ["console", "reset", "stderr"]
 
 # </AUTOGEN_INIT>
@@ -6,3 +6,13 @@ from kslurm.style.themes import default
 
 console = Console(theme=default)
 stderr = Console(theme=default, stderr=True)
+
+
+def reset():
+    """Reinitialize the consoles after the terminal or environment has changed
+
+    Consoles detect terminal features when created, so processes that take over a
+    new set of standard streams must call this to pick up the new terminal
+    """
+    console.__init__(theme=default)
+    stderr.__init__(theme=default, stderr=True)
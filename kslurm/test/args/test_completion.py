@@ -0,0 +1,95 @@
+from __future__ import absolute_import
+
+import shutil
+import subprocess as sp
+from pathlib import Path
+
+import attr
+import pytest
+
+from kslurm.appcache import update_completion
+from kslurm.args import (
+    Subcommand,
+    choice,
+    command,
+    flag,
+    keyword,
+    positional,
+    subcommand,
+)
+from kslurm.args.arg import SKIPHELP
+from kslurm.args.completion import bash_script, get_node
+
+
+@command(inline=True)
+def _load(
+    name: str = positional(default="", complete="venvs"),
+    new_name: str = keyword(["--as"]),
+    script: str = keyword(["--script"], help=SKIPHELP),
+):
+    pass
+
+
+@command(inline=True)
+def _export(mode: str = choice(["venv", "tar"]), path: str = keyword(["--path"])):
+    pass
+
+
+@attr.frozen
+class _Model:
+    command: Subcommand = subcommand(
+        commands={"load": _load, "export": _export, "_hidden": _load}
+    )
+    verbose: bool = flag(["-v"])
+    venv: str = keyword(["--venv"], default="", complete="venvs")
+
+
+@command
+def _cmd(args: _Model, tail: list[str]):
+    pass
+
+
+def test_completion_tree_is_built_from_models():
+    node = get_node(_cmd.cli, "cmd")
+    assert set(node.words) == {"-h", "--help", "-v", "--venv", "load", "export"}
+    assert node.values == {"--venv": "venvs"}
+    assert set(node.subcommands) == {"load", "export"}
+
+    load = node.subcommands["load"]
+    assert set(load.words) == {"-h", "--help", "--as"}
+    assert load.values == {"--as": None}
+    assert load.sources == ("venvs",)
+    assert {"venv", "tar"} <= set(node.subcommands["export"].words)
+
+
+def test_update_completion_writes_sorted_words(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr("kslurm.appcache.COMPLETION_CACHE", tmp_path)
+    update_completion("venvs", ["b", "a"])
+    assert (tmp_path / "venvs").read_text() == "a\nb\n"
+
+
+@pytest.mark.skipif(shutil.which("bash") is None, reason="bash is not available")
+@pytest.mark.parametrize(
+    "words,expected",
+    [
+        (["cmd", ""], "-h --help -v --venv load export"),
+        (["cmd", "--venv", ""], "other venv1"),
+        (["cmd", "-v", "lo"], "load"),
+        (["cmd", "load", "--as", ""], ""),
+        (["cmd", "load", "v"], "venv1"),
+        (["cmd", "export", "t"], "tar"),
+    ],
+)
+def test_bash_script_completes_words(tmp_path: Path, words: list[str], expected: str):
+    (tmp_path / "venvs").write_text("other\nvenv1\n")
+    script = tmp_path / "completion.bash"
+    script.write_text(bash_script({"cmd": _cmd.cli}, tmp_path))
+    driver = (
+        f"source {script}\n"
+        'COMP_WORDS=("$@")\n'
+        "COMP_CWORD=$((${#COMP_WORDS[@]} - 1))\n"
+        "_kslurm_complete\n"
+        'echo "${COMPREPLY[*]}"\n'
+    )
+    proc = sp.run(["bash", "-c", driver, "bash", *words], capture_output=True)
+    assert proc.stdout.decode().strip() == expected
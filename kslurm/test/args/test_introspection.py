@@ -0,0 +1,85 @@
+from __future__ import absolute_import, annotations
+
+import importlib.util
+import sys
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+import pytest
+
+from kslurm.args import introspection
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(introspection, "INTROSPECTION_CACHE", tmp_path / "cache")
+    monkeypatch.setattr(introspection, "_loaded", {})
+    return tmp_path / "cache"
+
+
+def _import(path: Path, source: str) -> ModuleType:
+    path.write_text(source)
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[path.stem] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class Counter:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self) -> Any:
+        self.calls += 1
+        return {"calls": self.calls}
+
+
+def test_entries_are_loaded_from_disk(tmp_path: Path, cache_dir: Path):
+    module = _import(tmp_path / "_kslurm_cached_mod.py", "def func():\n    '''doc'''\n")
+    compute = Counter()
+    assert introspection.cached(module.func, "test", compute) == {"calls": 1}
+    assert introspection.cached(module.func, "test", compute) == {"calls": 1}
+    assert len(list(cache_dir.iterdir())) == 1
+
+    # Simulate a fresh process
+    introspection._loaded.clear()
+    assert introspection.cached(module.func, "test", compute) == {"calls": 1}
+    assert compute.calls == 1
+
+
+def test_source_changes_invalidate_entries(tmp_path: Path):
+    path = tmp_path / "_kslurm_changed_mod.py"
+    module = _import(path, "def func():\n    '''doc'''\n")
+    compute = Counter()
+    introspection.cached(module.func, "test", compute)
+
+    introspection._loaded.clear()
+    module = _import(path, "def func():\n    '''doc'''\n\n\nVALUE = 1\n")
+    assert introspection.cached(module.func, "test", compute) == {"calls": 2}
+
+
+def test_docstring_changes_invalidate_entries(tmp_path: Path):
+    module = _import(tmp_path / "_kslurm_doc_mod.py", "def func():\n    '''doc'''\n")
+    compute = Counter()
+    introspection.cached(module.func, "test", compute)
+    module.func.__doc__ = "new doc"
+    assert introspection.cached(module.func, "test", compute) == {"calls": 2}
+
+
+def test_related_source_changes_invalidate_entries(tmp_path: Path):
+    module = _import(tmp_path / "_kslurm_main_mod.py", "def func():\n    '''doc'''\n")
+    related_path = tmp_path / "_kslurm_related_mod.py"
+    related = _import(related_path, "class Model:\n    pass\n")
+    compute = Counter()
+    introspection.cached(module.func, "test", compute, related=[related.Model])
+    assert introspection.cached(
+        module.func, "test", compute, related=[related.Model]
+    ) == {"calls": 1}
+
+    related = _import(related_path, "class Model:\n    value = 1\n")
+    assert introspection.cached(
+        module.func, "test", compute, related=[related.Model]
+    ) == {"calls": 2}
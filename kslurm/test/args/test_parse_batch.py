@@ -0,0 +1,47 @@
+from __future__ import absolute_import, annotations
+
+from pathlib import Path
+
+from kslurm.args import parse_batch
+from kslurm.args.arg import FsProbe
+from kslurm.exceptions import TailError
+from kslurm.models import formatters
+from kslurm.models.slurm import SlurmModel
+
+
+def test_each_argv_gets_a_model():
+    results = parse_batch(
+        SlurmModel,
+        [["1:00", "16G", "echo", "a"], ["2-00:00", "gpu", "8", "echo", "b"]],
+    )
+    assert all(result.ok for result in results)
+    first, second = (result.model for result in results)
+    assert first is not None and second is not None
+    assert (first.time, first.mem, first.gpu) == (60, 16000, False)
+    assert (second.time, second.cpu, second.gpu) == (2 * 24 * 60, 8, True)
+    assert [result.tail for result in results] == [["echo", "a"], ["echo", "b"]]
+
+
+def test_invalid_argvs_dont_stop_the_batch():
+    results = parse_batch(
+        SlurmModel, [["--job-template", "notatemplate"], ["4:00", "echo"]]
+    )
+    assert not results[0].ok and results[0].model is None
+    assert results[1].ok and results[1].model is not None
+
+
+def test_unknown_args_can_be_errors():
+    (result,) = parse_batch(SlurmModel, [["1:00", "echo"]], allow_unknown=False)
+    assert result.tail == ["echo"]
+    assert isinstance(result.errors[0], TailError)
+
+
+def test_repeated_tokens_share_work(tmp_path: Path):
+    formatters.mem.cache_clear()
+    before = FsProbe.stat_calls
+    results = parse_batch(
+        SlurmModel, [[f"{tmp_path}/", "16G", "echo"] for _ in range(100)]
+    )
+    assert all(result.ok for result in results)
+    assert FsProbe.stat_calls - before == 1
+    assert formatters.mem.cache_info().misses == 1
@@ -2,6 +2,7 @@
 from __future__ import absolute_import
 
 from copy import copy
+from pathlib import Path
 from typing import Any, NamedTuple
 
 import hypothesis.strategies as st
@@ -9,7 +10,7 @@ from hypothesis import assume, given
 
 import kslurm.args.parser as sc
 from kslurm.args import actions, helpers, keyword, matchers
-from kslurm.args.arg import Context, ParamInterface, Parser
+from kslurm.args.arg import Context, FsProbe, ParamInterface, Parser
 
 
 class CliParsers(NamedTuple):
@@ -226,3 +227,82 @@ def test_parser(params: CliParsers):
     a_result, a_tail = sc._match_args(argv, models, terminate_on_unknown=False)
     assert results == a_result
     assert tail == a_tail
+
+
+def _shape_parser(id: str, pattern: str, priority: int = 10):
+    return Parser(
+        id=id,
+        priority=priority,
+        match=matchers.regex(pattern),
+        action=actions.replace(),
+    )
+
+
+def test_dispatch_indexes_keywords_and_shapes():
+    models = {
+        "flag": Parser(
+            id="flag",
+            priority=20,
+            match=matchers.choice("-f", "--flag"),
+            action=actions.replace(),
+        ),
+        "num": _shape_parser("num", r"^[0-9]+$"),
+        "pos": Parser(
+            id="pos", priority=0, match=matchers.everything(), action=actions.replace()
+        ),
+    }
+    table = sc.compile_parsers(models)
+    assert table.keywords == {"-f": ("flag",), "--flag": ("flag",)}
+    assert table.fallback == ((2, "pos", False),)
+    assert list(table.candidates("--flag")) == [(0, "flag", True), (2, "pos", False)]
+    assert list(table.candidates("12")) == [(1, "num", True), (2, "pos", False)]
+    assert list(table.candidates("word")) == [(2, "pos", False)]
+
+
+def test_overlapping_shapes_respect_priority():
+    models = {
+        "low": _shape_parser("low", r"^[0-9]+", priority=5),
+        "high": _shape_parser("high", r"^[0-9]+G$", priority=10),
+    }
+    parsed, tail = sc.parse_args(["16G", "32", "64G"], models)
+    assert parsed["high"].value == "16G"
+    assert parsed["low"].value == "32"
+    assert tail == ["64G"]
+
+
+def test_invalid_combined_pattern_falls_back_to_individual_tests():
+    models = {
+        "a": _shape_parser("a", r"(?i)^abc$"),
+        "b": _shape_parser("b", r"(?i)^def$"),
+    }
+    table = sc.compile_parsers(models)
+    assert table.shapes is None
+    parsed, tail = sc.parse_args(["DEF", "ABC"], models)
+    assert parsed["a"].value == "ABC"
+    assert parsed["b"].value == "DEF"
+    assert tail == []
+
+
+def _path_parser(id: str, is_dir: bool = False):
+    return Parser(
+        id=id,
+        priority=10,
+        match=matchers.path(is_dir=is_dir),
+        action=actions.replace(),
+    )
+
+
+def test_paths_are_stated_once_per_parse(tmp_path: Path):
+    (tmp_path / "file").touch()
+    models = {
+        "dir": _path_parser("dir", is_dir=True),
+        "file": _path_parser("file"),
+    }
+    missing = str(tmp_path / "missing")
+    argv = [missing, "word", missing, str(tmp_path / "file"), f"{tmp_path}/", missing]
+    before = FsProbe.stat_calls
+    parsed, tail = sc._match_args(argv, models, terminate_on_unknown=False)
+    assert FsProbe.stat_calls - before == 3
+    assert parsed["file"].value == str(tmp_path / "file")
+    assert parsed["dir"].value == f"{tmp_path}/"
+    assert tail == [missing, "word", missing, missing]
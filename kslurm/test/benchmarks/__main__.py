@@ -0,0 +1,65 @@
+from __future__ import absolute_import
+
+import sys
+
+from kslurm.args import flag, keyword
+from kslurm.args.command import command
+from kslurm.test.benchmarks.suite import (
+    BENCHMARKS,
+    DEFAULT_THRESHOLD,
+    compare,
+    load_baselines,
+    measure,
+    sandbox,
+    save_baselines,
+)
+
+
+@command(inline=True)
+def main(
+    select: str = keyword(
+        ["-k"], default="", help="Only run benchmarks whose name contains this text"
+    ),
+    threshold: float = keyword(
+        ["--threshold"],
+        default=DEFAULT_THRESHOLD,
+        format=float,
+        help="Fraction by which a benchmark may exceed its baseline",
+    ),
+    save: bool = flag(["--save"], help="Store the results as the new baselines"),
+):
+    """Time the parser and cli hot paths and compare them with the stored baselines
+
+    Exits with an error if any benchmark is slower than its baseline by more than the
+    threshold
+    """
+    baselines = load_baselines()
+    results: dict[str, float] = {}
+    costs: dict[str, float] = {}
+    with sandbox():
+        for name, setup in BENCHMARKS.items():
+            if select in name:
+                results[name], costs[name] = measure(setup)
+    changes = compare(costs, baselines)
+
+    regressions = 0
+    for name, result in results.items():
+        change = changes[name]
+        if change is None:
+            status = "no baseline"
+        else:
+            status = f"{change:+7.1%}"
+            if change > threshold:
+                status += "  REGRESSION"
+                regressions += 1
+        print(f"{name:<24}{result * 1e6:10.1f} us   {status}")
+
+    if save:
+        save_baselines(costs)
+        print("Saved baselines")
+    elif regressions:
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main.cli(["python -m kslurm.test.benchmarks", *sys.argv[1:]]))
@@ -0,0 +1,57 @@
+"""Per-argv cost of parse_args for SlurmModel
+
+Run with:
+    python -m kslurm.test.benchmarks.parse_args
+"""
+from __future__ import absolute_import, annotations
+
+import itertools as it
+import timeit
+from typing import Any
+
+from kslurm.args import help_parser
+from kslurm.args.helpers import get_arg_dict, get_parsers
+from kslurm.args.parser import DispatchTable, compile_parsers, parse_args
+from kslurm.models.slurm import SlurmModel
+
+_RESOURCES = ["--account", "def-lab", "1-00:00", "16G", "8", "gpu"]
+_REPEATABLE = ["x11", "gpu", "-t"]
+TOKEN_COUNTS = [5, 20, 100]
+
+
+def slurm_argv(tokens: int) -> list[str]:
+    """Build a kbatch style argv of the given length
+
+    Resource args come first, padded with repeatable flags, and the command comes
+    last, so every token but the final one goes through the matchers
+    """
+    argv = _RESOURCES[: tokens - 1]
+    argv += it.islice(it.cycle(_REPEATABLE), max(0, tokens - 1 - len(argv)))
+    return [*argv, "echo"]
+
+
+def slurm_parsers() -> tuple[dict[str, Any], DispatchTable]:
+    parsers = {
+        **get_parsers(get_arg_dict(SlurmModel)),
+        "help": help_parser().with_id("help"),
+    }
+    return parsers, compile_parsers(parsers)
+
+
+def per_argv_cost(tokens: int, number: int = 2000, repeat: int = 5) -> float:
+    """Best time, in seconds, to parse one argv of the given length"""
+    argv = slurm_argv(tokens)
+    parsers, dispatch = slurm_parsers()
+    timer = timeit.Timer(
+        lambda: parse_args(argv, parsers, terminate_on_unknown=True, dispatch=dispatch)
+    )
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    for tokens in TOKEN_COUNTS:
+        print(f"{tokens:>4} tokens: {per_argv_cost(tokens) * 1e6:8.1f} us/argv")
+
+
+if __name__ == "__main__":
+    main()
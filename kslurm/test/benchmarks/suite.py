@@ -0,0 +1,376 @@
+from __future__ import absolute_import, annotations
+
+import contextlib
+import functools as ft
+import importlib
+import io
+import itertools as it
+import json
+import os
+import random
+import subprocess as sp
+import tempfile
+import timeit
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Optional, TypeVar
+from unittest import mock
+
+import hypothesis.strategies as st
+from hypothesis import HealthCheck, Phase, given, settings
+from rich.console import Console
+
+import kslurm.appconfig as appconfig
+import kslurm.args.registry as registry
+import kslurm.slurm.jobs as jobs
+from kslurm.args.batch import parse_batch
+from kslurm.args.completion import CompletionNode, get_node
+from kslurm.args.help_templates import SubcommandTemplate
+from kslurm.args.helpers import get_arg_dict, read_parsers
+from kslurm.args.parser import parse_args
+from kslurm.args.protocols import WrappedCommand
+from kslurm.models.slurm import SlurmModel
+from kslurm.test.benchmarks.parse_args import slurm_parsers
+from kslurm.venv import CODECS
+
+T = TypeVar("T")
+
+BASELINES = Path(__file__).with_name("baselines.json")
+
+# Fraction by which a benchmark may exceed its baseline before being flagged
+DEFAULT_THRESHOLD = 0.25
+
+# Size in MB of the synthetic venv archived by the archive benchmarks
+VENV_SIZE = 8
+
+# Memory backed directory holding the files written by the benchmarks where
+# available, so the archive benchmarks time the codecs rather than disk writeback
+_TMPFS = Path("/dev/shm")
+
+# Number of argvs drawn for each corpus. Draws are derandomized, so every run of the
+# suite times exactly the same argvs
+CORPUS_SIZE = 50
+
+_WORD = st.text("abcdefghijklmnopqrstuvwxyz0123456789_-", min_size=1, max_size=12)
+
+
+def _flatten(tokens: Iterable[list[str]]):
+    return list(it.chain.from_iterable(tokens))
+
+
+_slurm_token = st.one_of(
+    st.builds("{}:{:02}".format, st.integers(0, 99), st.integers(0, 59)).map(
+        lambda time: [time]
+    ),
+    st.builds("{}-{:02}:00".format, st.integers(1, 9), st.integers(0, 23)).map(
+        lambda time: [time]
+    ),
+    st.integers(1, 64).map(lambda cpu: [str(cpu)]),
+    st.builds(
+        "{}{}".format,
+        st.integers(1, 999),
+        st.sampled_from(["M", "G", "MB", "GB", "GiB", "T"]),
+    ).map(lambda mem: [mem]),
+    st.sampled_from(["gpu", "x11", "--x11"]).map(lambda flag: [flag]),
+    st.tuples(st.just("--venv"), _WORD).map(list),
+)
+
+
+@st.composite
+def slurm_argv(draw: st.DrawFn) -> list[str]:
+    """Draw an account and resource args for SlurmModel, followed by a command"""
+    account = [draw(st.sampled_from(["-a", "--account"])), draw(_WORD)]
+    args = _flatten(draw(st.lists(_slurm_token, max_size=8)))
+    return [*account, *args, *draw(st.lists(_WORD, min_size=1, max_size=4))]
+
+
+@st.composite
+def command_argv(draw: st.DrawFn, node: CompletionNode) -> list[str]:
+    """Draw an argv walking down the subcommand tree of node to one of its leaves
+
+    The leaf is given a few of its options, each followed by a value if it takes one,
+    and possibly some positional words
+    """
+    argv: list[str] = []
+    while node.subcommands:
+        name = draw(st.sampled_from(sorted(node.subcommands)))
+        argv.append(name)
+        node = node.subcommands[name]
+    options = [
+        word
+        for word in node.words
+        if word.startswith("-") and word not in ["-h", "--help"]
+    ]
+    if options:
+        for option in draw(st.lists(st.sampled_from(options), max_size=3)):
+            argv.append(option)
+            if option in node.values:
+                # Numbers are valid for both text and numeric options
+                argv.append(str(draw(st.integers(1, 99))))
+    if node.sources:
+        argv.extend(draw(st.lists(_WORD, max_size=2)))
+    return argv
+
+
+def corpus(strategy: st.SearchStrategy[T], size: int = CORPUS_SIZE) -> list[T]:
+    """Draw a reproducible list of examples from strategy"""
+    examples: list[T] = []
+
+    @settings(
+        max_examples=size,
+        derandomize=True,
+        database=None,
+        phases=[Phase.generate],
+        suppress_health_check=list(HealthCheck),
+        deadline=None,
+    )
+    @given(strategy)
+    def collect(example: T):
+        examples.append(example)
+
+    collect()
+    return examples
+
+
+@contextlib.contextmanager
+def sandbox() -> Iterator[Path]:
+    """Point the kslurm config at a temporary pipdir and job registry while running
+    the benchmarks, and keep any other temporary files in the same directory
+    """
+    tmpfs = _TMPFS if os.access(_TMPFS, os.W_OK) else None
+    with tempfile.TemporaryDirectory(dir=tmpfs) as tmp:
+        config = Path(tmp, "config.json")
+        config.write_text(json.dumps({"pipdir": str(Path(tmp, "pipdir"))}))
+        with mock.patch.object(appconfig, "CONFIG_PATH", config), mock.patch.object(
+            jobs, "JOBS_DB", Path(tmp, "jobs.db")
+        ), mock.patch.object(tempfile, "tempdir", tmp):
+            yield Path(tmp)
+
+
+def walk(command: WrappedCommand, argv: list[str]):
+    """Parse argv down a tree of subcommands without running any of them"""
+    while True:
+        wrapper: Any = registry.resolve(command).__self__
+        parsers, dispatch = wrapper.get_parsers()
+        models = wrapper.get_helptext(argv[0]).models
+        parsed, tail = parse_args(
+            argv[1:], parsers, terminate_on_unknown=False, dispatch=dispatch
+        )
+        values, _ = read_parsers(models, parsed)
+        subcommand = next(
+            (
+                values[name]
+                for name, model in models.items()
+                if isinstance(getattr(model, "help_template", None), SubcommandTemplate)
+            ),
+            None,
+        )
+        if not subcommand or not subcommand[0]:
+            return
+        name, command = subcommand
+        argv = [f"{argv[0]} {name}", *(tail or [])]
+
+
+# Each benchmark is set up outside of the timing, returning the operation to time and
+# the number of examples it handles per call, by which its time is divided
+Setup = Callable[[], tuple[Callable[[], Any], int]]
+
+
+def _parse_slurm():
+    argvs = corpus(slurm_argv())
+    parsers, dispatch = slurm_parsers()
+
+    def run():
+        for argv in argvs:
+            parse_args(argv, parsers, terminate_on_unknown=True, dispatch=dispatch)
+
+    return run, len(argvs)
+
+
+def _read_slurm():
+    parsers, dispatch = slurm_parsers()
+    models = get_arg_dict(SlurmModel)
+    parsed = [
+        parse_args(argv, parsers, terminate_on_unknown=True, dispatch=dispatch)[0]
+        for argv in corpus(slurm_argv())
+    ]
+
+    def run():
+        for result in parsed:
+            read_parsers(models, result)
+
+    return run, len(parsed)
+
+
+def _parse_batch():
+    argvs = corpus(slurm_argv())
+    return lambda: parse_batch(SlurmModel, argvs), len(argvs)
+
+
+def _get_arg_dict():
+    return lambda: get_arg_dict(SlurmModel), 1
+
+
+def _render_help():
+    from kslurm.cli.kbatch import kbatch
+
+    helptext = kbatch.get_helptext("kbatch")
+
+    def run():
+        console = Console(
+            width=100, file=io.StringIO(), color_system="truecolor", force_terminal=True
+        )
+        console.print(helptext)
+
+    return run, 1
+
+
+class _Probe:
+    """Stand-in for a sbatch --test-only process reporting no estimate"""
+
+    returncode = 0
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        pass
+
+    def poll(self):
+        return self.returncode
+
+    def communicate(self, input: Optional[str] = None):
+        return "", ""
+
+
+def _kbatch_test():
+    """End-to-end kbatch in test mode, with sbatch replaced by a no-op"""
+    module = importlib.import_module("kslurm.cli.kbatch")
+    argvs = [["kbatch", "-t", *argv] for argv in corpus(slurm_argv())]
+    done = sp.CompletedProcess[str]([], 0, "", "")
+
+    def sbatch(*args: Any, **kwargs: Any):
+        return done
+
+    def run():
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(mock.patch.object(sp, "run", sbatch))
+            stack.enter_context(mock.patch.object(sp, "Popen", _Probe))
+            stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+            stack.enter_context(contextlib.redirect_stderr(io.StringIO()))
+            for argv in argvs:
+                module.kbatch.cli(argv)
+
+    return run, len(argvs)
+
+
+def _walk(name: str, path: str):
+    command = registry.get_command(path)
+    argvs = [[name, *argv] for argv in corpus(command_argv(get_node(command, name)))]
+
+    def run():
+        for argv in argvs:
+            walk(command, argv)
+
+    return run, len(argvs)
+
+
+def fake_venv(path: Path, size: int = VENV_SIZE):
+    """Write a venv-like tree of size MB: many small, compressible python files, and a
+    few large, incompressible shared libraries
+    """
+    rand = random.Random(0)
+    source = "".join(
+        f"def function_{i}(arg):\n    return arg * {i}\n" for i in range(40)
+    )
+    package = path / "lib" / "python3" / "site-packages" / "package"
+    package.mkdir(parents=True)
+    for i in range(size * 1024 * 1024 // 2 // len(source)):
+        (package / f"module_{i}.py").write_text(source)
+    for i in range(4):
+        (package / f"_ext_{i}.so").write_bytes(rand.randbytes(size * 1024 * 1024 // 8))
+    (path / "bin").mkdir()
+    (path / "bin" / "python").symlink_to("/usr/bin/python3")
+
+
+def _archive(codec_name: str, action: str):
+    """Save or load a venv with a codec, timed per MB of venv"""
+    codec = CODECS[codec_name]
+    tmp = Path(tempfile.mkdtemp(prefix="kslurm-bench-"))
+    fake_venv(tmp / "venv")
+    archive = tmp / f"venv{codec.suffix}"
+    codec.write(tmp / "venv", archive)
+
+    def run():
+        if action == "save":
+            codec.write(tmp / "venv", archive)
+        else:
+            # Each load overwrites the files of the last
+            codec.extract(archive, tmp / "out")
+
+    return run, VENV_SIZE
+
+
+BENCHMARKS: dict[str, Setup] = {
+    "parse_args[kbatch]": _parse_slurm,
+    "read_parsers[kbatch]": _read_slurm,
+    "parse_batch[kbatch]": _parse_batch,
+    "get_arg_dict[kbatch]": _get_arg_dict,
+    "help[kbatch]": _render_help,
+    "cli[kbatch -t]": _kbatch_test,
+    "walk[kpy]": lambda: _walk("kpy", "kslurm.cli.kpy:kpy"),
+    "walk[kapp]": lambda: _walk("kapp", "kslurm.cli.kapp.main:kapp"),
+    # Images are mounted rather than extracted on load, which can't be compared
+    **{
+        f"{action}[{codec}]": ft.partial(_archive, codec, action)
+        for action in ["save", "load"]
+        for codec in CODECS
+        if codec != "squashfs"
+    },
+}
+
+
+def calibrate() -> float:
+    """Time a fixed pure python workload, in seconds"""
+    timer = timeit.Timer(lambda: sorted(str(i) for i in range(1000)))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=7, number=number)) / number
+
+
+def measure(setup: Setup, repeat: int = 7) -> tuple[float, float]:
+    """Time a single example of a benchmark
+
+    Returns the best time in seconds, along with that time relative to the
+    calibration workload timed right before and after. Baselines store the relative
+    cost, so they remain meaningful on faster or slower machines, and under varying
+    load
+    """
+    run, size = setup()
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    before = calibrate()
+    result = min(timer.repeat(repeat=repeat, number=number)) / number / size
+    calibration = (before + calibrate()) / 2
+    return result, result / calibration
+
+
+def load_baselines(path: Path = BASELINES) -> dict[str, float]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_baselines(costs: dict[str, float], path: Path = BASELINES):
+    """Store the relative costs of benchmarks, keeping the baselines of any not run"""
+    baselines = {**load_baselines(path), **costs}
+    path.write_text(json.dumps(dict(sorted(baselines.items())), indent=2) + "\n")
+
+
+def compare(
+    costs: dict[str, float], baselines: dict[str, float]
+) -> dict[str, Optional[float]]:
+    """Get the change of each relative cost from its baseline
+
+    Changes are given as fractions of the baseline (e.g. 0.1 for 10% slower), or None
+    for benchmarks without a baseline
+    """
+    return {
+        name: cost / baselines[name] - 1 if name in baselines else None
+        for name, cost in costs.items()
+    }
@@ -1,15 +1,34 @@
 from __future__ import absolute_import, annotations
 
+import os
+import subprocess as sp
+import time
 from pathlib import Path
+from typing import Any
 from unittest import mock
 
-from pytest import CaptureFixture
+import pytest
+from pytest import CaptureFixture, MonkeyPatch
 
+from kslurm.appcache import ARRAY_INDEX_TTL, array_index
 from kslurm.cli.kbatch import kbatch
 
 
+@pytest.fixture(autouse=True)
+def cache(tmp_path: Path, monkeypatch: MonkeyPatch):
+    monkeypatch.setattr("kslurm.appcache.CACHE_PATH", tmp_path / "cache")
+    monkeypatch.setattr("kslurm.appcache.ARRAY_CACHE", tmp_path / "arrays")
+    monkeypatch.setattr("kslurm.slurm.jobs.JOBS_DB", tmp_path / "jobs.db")
+
+
+def _sbatch(stdout: str = "1234\n"):
+    return mock.patch(
+        "subprocess.run", return_value=sp.CompletedProcess([], 0, stdout, "")
+    )
+
+
 def test_batch_submits_testmode(capsys: CaptureFixture[str]):
-    with mock.patch("subprocess.run") as subprocess:
+    with _sbatch() as subprocess:
 
         kbatch.cli(
             [
@@ -27,13 +46,12 @@ def test_batch_submits_testmode(capsys: CaptureFixture[str]):
             "--account=ctb-akhanf --time=03:00:00 --cpus-per-task=1 --mem=4000"
             in str(out)
         )
-        subprocess.assert_called_with(
-            "echo '#!/bin/bash\n\ncommand' | cat", shell=True, stdout=-1, stderr=-2
-        )
+        assert "#!/bin/bash\n\ncommand" in out.out
+        subprocess.assert_not_called()
 
 
 def test_params_can_be_altered(capsys: CaptureFixture[str]):
-    with mock.patch("subprocess.run") as subprocess:
+    with _sbatch() as subprocess:
         starting_cwd = Path.cwd()
 
         kbatch.cli(
@@ -58,11 +76,196 @@ def test_params_can_be_altered(capsys: CaptureFixture[str]):
             "--mem=5000 --gres=gpu:1" in str(out)
         )
         subprocess.assert_called_with(
-            "echo '#!/bin/bash\n\ncommand' | sbatch --account=some-account "
-            "--time=2-09:11:00 --cpus-per-task=8 --mem=5000 --gres=gpu:1 "
-            "--parsable ",
-            shell=True,
-            stdout=-1,
-            stderr=-2,
+            [
+                "sbatch",
+                "--account=some-account",
+                "--time=2-09:11:00",
+                "--cpus-per-task=8",
+                "--mem=5000",
+                "--gres=gpu:1",
+                "--parsable",
+            ],
+            input="#!/bin/bash\n\ncommand",
+            capture_output=True,
+            text=True,
+            check=False,
         )
+        assert "scancel 1234" in out.out
         assert Path.cwd() == starting_cwd / "kslurm"
+
+
+def test_array_file_submits_one_job_array(tmp_path: Path, capsys: CaptureFixture[str]):
+    cmds = tmp_path / "cmds.txt"
+    cmds.write_text("echo a\n\n# comment\necho b\necho c\n")
+    with _sbatch() as subprocess:
+        kbatch.cli(
+            [
+                "kbatch",
+                "--account",
+                "some-account",
+                "--array-file",
+                str(cmds),
+                "--throttle",
+                "2",
+            ]
+        )
+
+    (index,) = (tmp_path / "arrays").iterdir()
+    assert index.read_text() == "echo a\necho b\necho c\n"
+    assert "3 commands from" in capsys.readouterr().out
+    script = f'#!/bin/bash\n\neval "$(sed -n "${{SLURM_ARRAY_TASK_ID}}p" {index})"'
+    subprocess.assert_called_with(
+        [
+            "sbatch",
+            "--account=some-account",
+            "--time=03:00:00",
+            "--cpus-per-task=1",
+            "--mem=4000",
+            "--array=1-3%2",
+            "--parsable",
+        ],
+        input=script,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+
+
+def test_array_file_cannot_be_combined_with_a_command(
+    tmp_path: Path, capsys: CaptureFixture[str]
+):
+    cmds = tmp_path / "cmds.txt"
+    cmds.write_text("echo a\n")
+    with mock.patch("subprocess.run") as subprocess:
+        code = kbatch.cli(
+            ["kbatch", "-a", "some-account", "--array-file", str(cmds), "echo"]
+        )
+    assert code == 1
+    assert "--array-file" in capsys.readouterr().err
+    subprocess.assert_not_called()
+
+
+def test_array_file_throttle_must_be_positive(
+    tmp_path: Path, capsys: CaptureFixture[str]
+):
+    cmds = tmp_path / "cmds.txt"
+    cmds.write_text("echo a\n")
+    with mock.patch("subprocess.run") as subprocess:
+        code = kbatch.cli(
+            ["kbatch", "-a", "acct", "--array-file", str(cmds), "--throttle", "0"]
+        )
+    assert code == 1
+    assert "--throttle" in capsys.readouterr().err
+    subprocess.assert_not_called()
+
+
+def test_unused_array_indices_are_pruned(tmp_path: Path):
+    old = array_index(["echo old"])
+    reused = array_index(["echo reused"])
+    expired = time.time() - ARRAY_INDEX_TTL - 60
+    for path in [old, reused]:
+        os.utime(path, (expired, expired))
+    assert array_index(["echo reused"]) == reused
+    array_index(["echo new"])
+    assert sorted(p.name for p in (tmp_path / "arrays").iterdir()) == sorted(
+        [reused.name, array_index(["echo new"]).name]
+    )
+
+
+@pytest.mark.parametrize(
+    ("args", "calls"),
+    [([], ["probe", "submit"]), (["--no-estimate"], ["submit"])],
+)
+def test_start_estimate_runs_alongside_submission(args: list[str], calls: list[str]):
+    made: list[str] = []
+    probe = mock.MagicMock(returncode=1)
+    probe.communicate.return_value = ("", "")
+
+    def popen(*args: Any, **kwargs: Any):
+        made.append("probe")
+        return probe
+
+    def run(*args: Any, **kwargs: Any):
+        made.append("submit")
+        return sp.CompletedProcess([], 0, "1234\n", "")
+
+    with mock.patch("subprocess.run", run), mock.patch("subprocess.Popen", popen):
+        kbatch.cli(["kbatch", "-a", "some-account", *args, "command"])
+    assert made == calls
+
+
+def test_failed_submission_reports_sbatch_output(capsys: CaptureFixture[str]):
+    failed = sp.CompletedProcess([], 1, "", "sbatch: error: invalid account\n")
+    with mock.patch("subprocess.run", return_value=failed):
+        code = kbatch.cli(["kbatch", "-a", "bad", "--no-estimate", "command"])
+    assert code == 1
+    assert "invalid account" in capsys.readouterr().out
+
+
+def test_cluster_is_split_from_job_id(capsys: CaptureFixture[str]):
+    with _sbatch("1234;graham\n"):
+        kbatch.cli(["kbatch", "-a", "some-account", "--no-estimate", "command"])
+    assert "scancel 1234\n" in capsys.readouterr().out
+
+
+def test_missing_sbatch_is_reported(
+    monkeypatch: MonkeyPatch, capsys: CaptureFixture[str]
+):
+    monkeypatch.setenv("PATH", "")
+    assert kbatch.cli(["kbatch", "-a", "some-account", "command"]) == 1
+    assert "sbatch:" in capsys.readouterr().out
+
+
+def test_pack_runs_commands_within_one_job(tmp_path: Path, capsys: CaptureFixture[str]):
+    cmds = tmp_path / "cmds.txt"
+    cmds.write_text("echo a\necho b\necho c\n")
+    kbatch.cli(
+        [
+            "kbatch",
+            "-t",
+            "-a",
+            "some-account",
+            "--pack",
+            str(cmds),
+            "--slots",
+            "2",
+            "4G",
+        ]
+    )
+
+    out = capsys.readouterr().out
+    assert "--cpus-per-task=2" in out
+    assert "3 of 3 commands from" in out
+    (index,) = (tmp_path / "arrays").iterdir()
+    results = tmp_path / "cmds.txt.results.jsonl"
+    assert f"kslurm.slurm.pack {index} {results} --slots 2 --cpus 1 --mem 2000" in out
+
+
+def test_pack_skips_commands_already_run(tmp_path: Path, capsys: CaptureFixture[str]):
+    cmds = tmp_path / "cmds.txt"
+    cmds.write_text("echo a\n")
+    (tmp_path / "cmds.txt.results.jsonl").write_text(
+        '{"task": 1, "command": "echo a", "exit": 0}\n'
+    )
+    with mock.patch("subprocess.run") as subprocess:
+        kbatch.cli(["kbatch", "-a", "some-account", "--pack", str(cmds)])
+    assert "already run" in capsys.readouterr().out
+    subprocess.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--pack", "cmds.txt", "echo"],
+        ["--pack", "cmds.txt", "--slots", "4", "2"],
+        ["--slots", "4", "echo"],
+    ],
+)
+def test_invalid_packs_are_rejected(
+    args: list[str], tmp_path: Path, capsys: CaptureFixture[str]
+):
+    (tmp_path / "cmds.txt").write_text("echo a\n")
+    with mock.patch("subprocess.run") as subprocess:
+        code = kbatch.cli(["kbatch", "-a", "some-account", str(tmp_path), *args])
+    assert code == 1
+    subprocess.assert_not_called()
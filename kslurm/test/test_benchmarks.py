@@ -0,0 +1,40 @@
+from __future__ import absolute_import, annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from kslurm.test.benchmarks import suite
+from kslurm.venv import ArchiveError
+
+
+def test_every_benchmark_has_a_baseline():
+    assert set(suite.load_baselines()) == set(suite.BENCHMARKS)
+
+
+@pytest.mark.parametrize("name", suite.BENCHMARKS)
+def test_benchmarks_run(name: str):
+    with suite.sandbox():
+        try:
+            run, size = suite.BENCHMARKS[name]()
+            run()
+        except ArchiveError as err:
+            pytest.skip(str(err))
+    assert size > 0
+
+
+def test_corpus_is_reproducible():
+    assert suite.corpus(suite.slurm_argv(), 10) == suite.corpus(suite.slurm_argv(), 10)
+
+
+def test_compare_gives_change_from_baseline():
+    changes = suite.compare({"a": 1.5, "b": 0.5, "c": 1.0}, {"a": 1.0, "b": 1.0})
+    assert changes == {"a": 0.5, "b": -0.5, "c": None}
+
+
+def test_saving_keeps_baselines_of_benchmarks_not_run(tmp_path: Path):
+    path = tmp_path / "baselines.json"
+    path.write_text(json.dumps({"a": 1.0, "b": 2.0}))
+    suite.save_baselines({"b": 3.0, "c": 4.0}, path)
+    assert suite.load_baselines(path) == {"a": 1.0, "b": 3.0, "c": 4.0}
@@ -0,0 +1,106 @@
+from __future__ import absolute_import, annotations
+
+import os
+import subprocess as sp
+import sys
+import time
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+import kslurm.appconfig as appconfig
+from kslurm.daemon import client
+
+ROOT = Path(__file__).parents[2]
+
+
+@pytest.fixture(autouse=True)
+def isolated_env(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path / "run"))
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "config"))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.delenv(client.DISABLE_ENV, raising=False)
+    (tmp_path / "config" / "kslurm").mkdir(parents=True)
+    (tmp_path / "config" / "kslurm" / "config.json").write_text('{"pipdir": "/pipdir"}')
+
+
+def _start(idle_timeout: float = 30):
+    proc = sp.Popen(
+        [sys.executable, "-m", "kslurm.daemon.server", str(idle_timeout)],
+        cwd=ROOT,
+        stderr=sp.PIPE,
+    )
+    for _ in range(200):
+        if client.control("ping") is not None:
+            return proc
+        if proc.poll() is not None:
+            break
+        time.sleep(0.05)
+    proc.kill()
+    raise AssertionError(
+        f"daemon failed to start: {proc.stderr and proc.stderr.read()}"
+    )
+
+
+@pytest.fixture
+def daemon() -> Iterator[sp.Popen[bytes]]:
+    proc = _start()
+    yield proc
+    proc.terminate()
+    proc.wait(5)
+
+
+def test_commands_run_in_daemon(
+    daemon: sp.Popen[bytes], capfd: pytest.CaptureFixture[str]
+):
+    assert client.forward(["kslurm", "config", "pipdir"]) == 0
+    assert capfd.readouterr().out == "/pipdir\n"
+
+
+def test_exit_codes_are_returned(
+    daemon: sp.Popen[bytes], capfd: pytest.CaptureFixture[str]
+):
+    assert client.forward(["kslurm", "notacommand"]) == 1
+    assert "Invalid value" in capfd.readouterr().err
+
+
+def test_outdated_daemon_is_not_used(
+    daemon: sp.Popen[bytes], monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(client, "stamp", lambda: "new version")
+    with pytest.raises(client.DaemonUnavailable):
+        client.forward(["kslurm", "config", "pipdir"])
+    # Outdated daemons shut themselves down
+    assert daemon.wait(5) == 0
+
+
+def test_mismatched_environment_is_not_served(
+    daemon: sp.Popen[bytes], tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "data"))
+    with pytest.raises(client.DaemonUnavailable):
+        client.forward(["kslurm", "config", "pipdir"])
+
+
+def test_falls_back_to_running_in_process(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+):
+    monkeypatch.setattr(
+        appconfig, "CONFIG_PATH", tmp_path / "config" / "kslurm" / "config.json"
+    )
+    assert client.control("ping") is None
+    assert client.main(["kslurm-client", "kslurm", "config", "pipdir"]) == 0
+    assert capsys.readouterr().out == "/pipdir\n"
+
+
+def test_daemon_stops_when_idle():
+    proc = _start(idle_timeout=0.5)
+    assert proc.wait(10) == 0
+    assert not os.path.exists(client.socket_path())
+
+
+def test_daemon_can_be_stopped(daemon: sp.Popen[bytes]):
+    assert client.control("stop") is not None
+    assert daemon.wait(5) == 0
+    assert client.control("ping") is None
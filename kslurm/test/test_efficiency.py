@@ -0,0 +1,139 @@
+from __future__ import absolute_import, annotations
+
+import io
+import subprocess as sp
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+import pytest
+from pytest import CaptureFixture, MonkeyPatch
+
+from kslurm.cli.efficiency import efficiency
+from kslurm.slurm.efficiency import (
+    by_name,
+    parse_duration,
+    parse_size,
+    percentile,
+    read_usage,
+    summarize,
+)
+
+SACCT = """\
+1001|align|COMPLETED|4|02:00:00|01:00:00|04:00:00|8G|
+1001.batch|batch|COMPLETED|4|02:00:00|01:00:00||0|2097152K
+1001.extern|extern|COMPLETED|4|00:00:00|01:00:00||0|1024K
+1002_1|align|FAILED|4|01:00.500|00:30:00|04:00:00|8G|
+1002_1.batch|batch|FAILED|4|01:00.500|00:30:00||0|6G
+1002_[2-3]|align|PENDING|4|00:00:00|00:00:00|04:00:00|8G|
+1003|sort|CANCELLED by 1234|1|00:00:00|1-00:00:00|2-00:00:00|4000Mc|
+"""
+
+
+@pytest.mark.parametrize(
+    ("text", "seconds"),
+    [
+        ("01:00:00", 3600),
+        ("1-02:00:00", 93600),
+        ("05:01.250", 301.25),
+        ("UNLIMITED", None),
+        ("", None),
+    ],
+)
+def test_durations_are_parsed(text: str, seconds: float):
+    assert parse_duration(text) == seconds
+
+
+def test_sizes_are_parsed():
+    assert parse_size("2097152K") == 2048
+    assert parse_size("1.5G") == 1536
+    assert parse_size("4000Mc", cpus=2) == 8000
+    assert parse_size("4000Mn", cpus=2) == 4000
+    assert parse_size("1048576") == 1
+    assert parse_size("") is None
+
+
+def test_usage_is_read_per_job():
+    first, second, third = read_usage(io.StringIO(SACCT))
+    assert (first.jobid, first.max_rss, first.req_mem) == ("1001", 2048, 8192)
+    assert first.cpu_efficiency == 0.5
+    assert first.mem_efficiency == 0.25
+    assert first.time_efficiency == 0.25
+    assert (second.jobid, second.state, second.max_rss) == ("1002_1", "FAILED", 6144)
+    assert third.state == "CANCELLED" and third.req_mem == 4000
+    assert third.cpu_efficiency == 0 and third.mem_efficiency is None
+
+
+def test_percentiles_are_by_nearest_rank():
+    values = [float(i) for i in range(1, 11)]
+    assert [percentile(values, q) for q in (10, 50, 90, 100)] == [1, 5, 9, 10]
+
+
+def test_usage_is_summarized_by_group():
+    align, sort = summarize(read_usage(io.StringIO(SACCT)), by_name)
+    assert (align.group, align.jobs, sort.group, sort.jobs) == ("align", 2, "sort", 1)
+    assert align.mem == {50: 0.25, 90: 0.75, 100: 0.75}
+    assert sort.mem == {}
+
+
+_Popen = sp.Popen
+
+
+def _sacct(argv: list[str], **kwargs: Any):
+    return _Popen(["printf", "%s", SACCT], **kwargs)
+
+
+def test_efficiency_makes_one_sacct_call(capsys: CaptureFixture[str]):
+    calls: list[list[str]] = []
+
+    def popen(argv: list[str], **kwargs: Any):
+        calls.append(argv)
+        return _sacct(argv, **kwargs)
+
+    with mock.patch("subprocess.Popen", popen):
+        assert efficiency.cli(["kslurm efficiency", "--csv", "1001", "1002"]) == 0
+    (call,) = calls
+    assert "--jobs=1001,1002" in call
+    assert capsys.readouterr().out.splitlines() == [
+        "Name,Jobs,CPU p50,CPU p90,CPU max,Mem p50,Mem p90,Mem max,Time p50,"
+        "Time p90,Time max",
+        "align,2,1%,50%,50%,25%,75%,75%,12%,25%,25%",
+        "sort,1,0%,0%,0%,,,,50%,50%,50%",
+    ]
+
+
+def test_efficiency_groups_by_template(
+    tmp_path: Path, monkeypatch: MonkeyPatch, capsys: CaptureFixture[str]
+):
+    from kslurm.slurm.jobs import JobRecord, JobRegistry
+
+    monkeypatch.setattr("kslurm.slurm.jobs.JOBS_DB", tmp_path / "jobs.db")
+    registry = JobRegistry()
+    for jobid in ["1001", "1002"]:
+        registry.add(
+            JobRecord(jobid, "", "", "", "", 4, 8000, 240, False, template="regular")
+        )
+    registry.close()
+    with mock.patch("subprocess.Popen", _sacct):
+        efficiency.cli(["kslurm efficiency", "--by", "template", "--csv"])
+    rows = capsys.readouterr().out.splitlines()[1:]
+    assert [row.split(",")[:2] for row in rows] == [["-", "1"], ["regular", "2"]]
+
+
+def test_sacct_warnings_cannot_block_reading(capsys: CaptureFixture[str]):
+    # More warnings than fit in a pipe, written before any output
+    script = 'yes warning | head -c 1000000 >&2; printf "%s" "$1"'
+
+    def popen(argv: list[str], **kwargs: Any):
+        return _Popen(["sh", "-c", script, "sacct", SACCT], **kwargs)
+
+    with mock.patch("subprocess.Popen", popen):
+        assert efficiency.cli(["kslurm efficiency", "--csv", "1001", "1002"]) == 0
+    assert "align" in capsys.readouterr().out
+
+
+def test_missing_sacct_is_reported(
+    monkeypatch: MonkeyPatch, capsys: CaptureFixture[str]
+):
+    monkeypatch.setenv("PATH", "")
+    assert efficiency.cli(["kslurm efficiency", "--per-job"]) == 1
@@ -0,0 +1,56 @@
+from __future__ import absolute_import, annotations
+
+import datetime as dt
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from kslurm.slurm import estimate
+from kslurm.slurm.estimate import StartEstimate, parse_start
+
+_PROBE_OUTPUT = "sbatch: Job 1 to start at 2030-01-02T03:04:05 using 1 processors"
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr("kslurm.appcache.CACHE_PATH", tmp_path)
+
+
+def _popen(returncode: int = 0, stderr: str = _PROBE_OUTPUT):
+    proc = mock.MagicMock()
+    proc.returncode = returncode
+    proc.communicate.return_value = ("", stderr)
+    return mock.patch("subprocess.Popen", return_value=proc)
+
+
+def test_parse_start():
+    assert parse_start(_PROBE_OUTPUT) == dt.datetime(2030, 1, 2, 3, 4, 5)
+    assert parse_start("sbatch: error: invalid account") is None
+
+
+def test_estimates_are_cached_by_resources():
+    with _popen() as popen:
+        assert StartEstimate(["sbatch"], "script", "a:1").result() == dt.datetime(
+            2030, 1, 2, 3, 4, 5
+        )
+        assert StartEstimate(["sbatch"], "script", "a:1").result() == dt.datetime(
+            2030, 1, 2, 3, 4, 5
+        )
+        StartEstimate(["sbatch"], "script", "a:2").result()
+    assert popen.call_count == 2
+
+
+def test_stale_estimates_are_probed_again(monkeypatch: pytest.MonkeyPatch):
+    with _popen() as popen:
+        StartEstimate(["sbatch"], "script", "a:1").result()
+        monkeypatch.setattr(estimate, "ESTIMATE_TTL", -1)
+        StartEstimate(["sbatch"], "script", "a:1").result()
+    assert popen.call_count == 2
+
+
+def test_failed_probes_give_no_estimate():
+    with _popen(returncode=1) as popen:
+        assert StartEstimate(["sbatch"], "script", "a:1").result() is None
+        assert StartEstimate(["sbatch"], "script", "a:1").result() is None
+    assert popen.call_count == 2
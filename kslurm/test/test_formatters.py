@@ -0,0 +1,49 @@
+from __future__ import absolute_import, annotations
+
+import pint
+import pytest
+from hypothesis import assume, given
+from hypothesis import strategies as st
+
+import kslurm.models.formatters as formatters
+from kslurm.exceptions import ValidationError
+
+ureg = pint.UnitRegistry()
+
+UNITS = [
+    f"{prefix}{binary}{suffix}"
+    for prefix in "KMGTkmgt"
+    for binary in ["", "i", "I"]
+    for suffix in ["", "B", "b"]
+]
+
+
+def pint_mem(mem: str):
+    """Reference implementation of formatters.mem, converting with pint"""
+    quantity = (
+        mem.rstrip("Bb").upper().replace("K", "k").replace("I", "i").replace("ki", "Ki")
+    )
+    return int(ureg(quantity + "B").to("megabyte").m)
+
+
+# pint converts through floats, so only compare quantities whose size in bytes can be
+# represented exactly
+@given(value=st.integers(min_value=0, max_value=10**9), unit=st.sampled_from(UNITS))
+def test_mem_matches_pint(value: int, unit: str):
+    mem = f"{value}{unit}"
+    assume((formatters.mem(mem) + 1) * 10**6 < 2**53)
+    assert formatters.mem(mem) == pint_mem(mem)
+
+
+@pytest.mark.parametrize(
+    "mem,megabytes",
+    [("4000MB", 4000), ("32G", 32000), ("1T", 1000000), ("1Gi", 1073), ("512k", 0)],
+)
+def test_mem_converts_to_megabytes(mem: str, megabytes: int):
+    assert formatters.mem(mem) == megabytes
+
+
+@pytest.mark.parametrize("mem", ["", "32", "G", "3.5G", "32P", "32GiBs", "-1G"])
+def test_mem_rejects_invalid_formats(mem: str):
+    with pytest.raises(ValidationError):
+        formatters.mem(mem)
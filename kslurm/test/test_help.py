@@ -1,6 +1,85 @@
-from __future__ import absolute_import, annotations
+from __future__ import absolute_import
 
+from pathlib import Path
+from typing import Any
 
-def test_basics():
-    pass
-    # help.print_help("script", models.ArgList())
+import attr
+import pytest
+
+from kslurm.args import flag, introspection, keyword
+from kslurm.args.command import _render, command
+from kslurm.models.slurm import SlurmModel
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(introspection, "INTROSPECTION_CACHE", tmp_path / "cache")
+    monkeypatch.setattr(introspection, "_loaded", {})
+    return tmp_path / "cache"
+
+
+@attr.frozen
+class _Model:
+    verbose: bool = flag(["-v"], help="Verbose")
+    name: str = keyword(["--name"], help="Name")
+
+
+@command
+def _cmd(args: _Model):
+    """Do a thing"""
+
+
+def test_rendering_does_not_duplicate_rows():
+    helptext = _cmd.get_helptext("cmd")
+    _render(helptext.with_usage_only())
+    assert _render(helptext).count("--name") == 1
+
+
+def test_help_is_rendered_once(capsys: "pytest.CaptureFixture[str]", mocker: Any):
+    _cmd.print_help("cmd")
+    rendered = capsys.readouterr().out
+    assert "--name" in rendered
+
+    get_helptext = mocker.patch.object(_cmd, "get_helptext")
+    introspection._loaded.clear()
+    _cmd.print_help("cmd")
+    assert capsys.readouterr().out == rendered
+    get_helptext.assert_not_called()
+
+
+def test_usage_is_cached_separately(capsys: "pytest.CaptureFixture[str]"):
+    _cmd.print_help("cmd")
+    _cmd.print_help("cmd", usage_only=True)
+    full, usage = capsys.readouterr().out.split("USAGE")[1:]
+    assert "--name" in full
+    assert "--name" not in usage
+
+
+@attr.frozen
+class _SlurmModel(SlurmModel):
+    verbose: bool = flag(["-v"], help="Verbose")
+
+
+@command
+def _slurm_cmd(args: _SlurmModel):
+    """Do a thing on the cluster"""
+
+
+@pytest.mark.parametrize("edited", ["slurm.py", "help.py", "help_templates.py"])
+def test_help_is_rendered_again_when_its_sources_change(
+    capsys: "pytest.CaptureFixture[str]", mocker: Any, edited: str
+):
+    _slurm_cmd.print_help("cmd")
+    rendered = capsys.readouterr().out
+
+    file_hash = introspection._file_hash
+    mocker.patch.object(
+        introspection,
+        "_file_hash",
+        lambda path: "edited" if Path(path).name == edited else file_hash(path),
+    )
+    get_helptext = mocker.spy(_slurm_cmd, "get_helptext")
+    introspection._loaded.clear()
+    _slurm_cmd.print_help("cmd")
+    assert capsys.readouterr().out == rendered
+    get_helptext.assert_called_once()
@@ -0,0 +1,165 @@
+from __future__ import absolute_import, annotations
+
+import json
+import os
+import subprocess as sp
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+import pytest
+from pytest import CaptureFixture, MonkeyPatch
+
+import kslurm.models.job_templates as job_templates
+from kslurm.cli.kbatch import kbatch
+from kslurm.exceptions import TemplateError
+
+
+@pytest.fixture(autouse=True)
+def layers(tmp_path: Path, monkeypatch: MonkeyPatch):
+    monkeypatch.setattr("kslurm.appcache.CACHE_PATH", tmp_path / "cache")
+    monkeypatch.setattr("kslurm.slurm.jobs.JOBS_DB", tmp_path / "jobs.db")
+    monkeypatch.setattr(job_templates, "USER_TEMPLATES", tmp_path / "user.json")
+    monkeypatch.setenv(job_templates.SITE_TEMPLATES_ENV, str(tmp_path / "site.json"))
+    project = tmp_path / "project"
+    (project / "sub").mkdir(parents=True)
+    monkeypatch.chdir(project / "sub")
+    job_templates.templates.cache_clear()
+    yield
+    job_templates.templates.cache_clear()
+
+
+def _write(path: Path, templates: dict[str, Any]):
+    path.write_text(json.dumps(templates))
+
+
+def test_packaged_templates_are_compiled():
+    template = job_templates.templates()["16core64gb24h"]
+    assert (template.cpu, template.mem, template.time) == (16, 64000, 24 * 60)
+    assert template.partition is None
+
+
+def test_later_layers_override_earlier(tmp_path: Path):
+    _write(
+        tmp_path / "site.json", {"Regular": {"cpus": 2, "mem": "8G", "time": "1:00"}}
+    )
+    _write(
+        tmp_path / "user.json",
+        {"Mine": {"cpus": 4, "mem": "4000", "time": "2:00", "partition": "user"}},
+    )
+    _write(
+        tmp_path / "project" / job_templates.PROJECT_TEMPLATES,
+        {
+            "Mine": {
+                "cpus": 1,
+                "mem": 1000,
+                "time": "1-00:00",
+                "partition": "gpu",
+                "gres": "gpu:a100:2",
+                "nodes": 2,
+                "ntasks": 4,
+                "constraint": "cascade",
+            }
+        },
+    )
+    templates = job_templates.templates()
+    assert templates["Regular"].mem == 8000
+    assert templates["Regular"].source == str(tmp_path / "site.json")
+    assert templates["Mine"] == job_templates.JobTemplate(
+        cpu=1,
+        mem=1000,
+        time=24 * 60,
+        partition="gpu",
+        gres="gpu:a100:2",
+        nodes=2,
+        ntasks=4,
+        constraint="cascade",
+        source=str(tmp_path / "project" / job_templates.PROJECT_TEMPLATES),
+    )
+    assert "Fat" in templates
+
+
+@pytest.mark.parametrize(
+    "template",
+    [
+        {"cpus": 1, "mem": "1000"},
+        {"cpus": 1, "mem": "lots", "time": "1:00"},
+        {"cpus": 1, "mem": "1000", "time": "1:00", "queue": "short"},
+        {"cpus": "many", "mem": "1000", "time": "1:00"},
+        {"cpus": 1, "mem": "1000", "time": "1"},
+    ],
+)
+def test_invalid_templates_name_their_file(tmp_path: Path, template: dict[str, Any]):
+    _write(tmp_path / "user.json", {"Broken": template})
+    with pytest.raises(TemplateError, match=r"Broken in .*user\.json"):
+        job_templates.templates()
+
+
+def test_compiled_templates_are_reused_until_a_file_changes(tmp_path: Path):
+    user = tmp_path / "user.json"
+    _write(user, {"Mine": {"cpus": 4, "mem": "4000", "time": "2:00"}})
+    assert job_templates.templates()["Mine"].cpu == 4
+    assert (tmp_path / "cache" / "templates.json").exists()
+
+    job_templates.templates.cache_clear()
+    with mock.patch.object(job_templates, "_compile") as compile:
+        assert job_templates.templates()["Mine"].cpu == 4
+    compile.assert_not_called()
+
+    job_templates.templates.cache_clear()
+    _write(user, {"Mine": {"cpus": 8, "mem": "4000", "time": "2:00"}})
+    stat = user.stat()
+    os.utime(user, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert job_templates.templates()["Mine"].cpu == 8
+
+    job_templates.templates.cache_clear()
+    user.unlink()
+    assert "Mine" not in job_templates.templates()
+
+
+def test_kbatch_requests_template_resources(tmp_path: Path):
+    _write(
+        tmp_path / "project" / job_templates.PROJECT_TEMPLATES,
+        {
+            "Mine": {
+                "cpus": 2,
+                "mem": "2G",
+                "time": "1:00",
+                "partition": "short",
+                "gres": "nvme:1",
+                "nodes": 1,
+                "constraint": "skylake",
+            }
+        },
+    )
+    with mock.patch(
+        "subprocess.run", return_value=sp.CompletedProcess([], 0, "1234\n", "")
+    ) as run, mock.patch("subprocess.Popen") as popen:
+        kbatch.cli(
+            ["kbatch", "--no-estimate", "--account", "acc", "-j", "Mine", "gpu", "cmd"]
+        )
+    popen.assert_not_called()
+    assert run.call_args.args[0] == [
+        "sbatch",
+        "--account=acc",
+        "--time=01:00:00",
+        "--cpus-per-task=2",
+        "--mem=2000",
+        "--partition=short",
+        "--nodes=1",
+        "--constraint=skylake",
+        "--gres=nvme:1,gpu:1",
+        "--parsable",
+    ]
+
+
+def test_templates_list_their_extra_fields(tmp_path: Path, capsys: CaptureFixture[str]):
+    _write(
+        tmp_path / "user.json",
+        {"Mine": {"cpus": 2, "mem": "2G", "time": "1:00", "partition": "short"}},
+    )
+    job_templates.list_templates()
+    out = capsys.readouterr().out
+    assert "partition" in out.splitlines()[0]
+    assert "constraint" not in out
+    assert "short" in out
@@ -0,0 +1,278 @@
+from __future__ import absolute_import, annotations
+
+import json
+import subprocess as sp
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+import pytest
+from pytest import CaptureFixture, MonkeyPatch
+
+from kslurm.cli.jobs import jobs
+from kslurm.cli.jobs import wait as jobs_wait
+from kslurm.cli.kbatch import kbatch
+from kslurm.slurm.jobs import (
+    WAIT_TIMEOUT,
+    JobRecord,
+    JobRegistry,
+    sacct,
+    wait,
+    wait_status,
+)
+
+
+@pytest.fixture(autouse=True)
+def registry(tmp_path: Path, monkeypatch: MonkeyPatch):
+    monkeypatch.setattr("kslurm.slurm.jobs.JOBS_DB", tmp_path / "jobs.db")
+    registry = JobRegistry()
+    yield registry
+    registry.close()
+
+
+def _record(jobid: str, **kwargs: Any):
+    return JobRecord(
+        **{
+            "jobid": jobid,
+            "slurm_args": "--account=some-account",
+            "script_hash": "abc",
+            "command": f"echo {jobid}",
+            "cwd": "/home/user",
+            "cpu": 1,
+            "mem": 4000,
+            "time": 180,
+            "gpu": False,
+            "submitted": f"2026-01-01T00:00:{jobid[-2:]}",
+            **kwargs,
+        }
+    )
+
+
+def _sacct(*lines: str):
+    return mock.patch(
+        "subprocess.run",
+        return_value=sp.CompletedProcess([], 0, "".join(f"{line}\n" for line in lines)),
+    )
+
+
+def test_submissions_are_recorded(
+    tmp_path: Path, registry: JobRegistry, monkeypatch: MonkeyPatch
+):
+    # kbatch changes into the directory it's given
+    monkeypatch.chdir(Path.cwd())
+    with _sbatch("1234;graham\n"):
+        kbatch.cli(
+            ["kbatch", "-a", "some-account", "--no-estimate", str(tmp_path), "4G", "ls"]
+        )
+    (record,) = registry.query()
+    assert (record.jobid, record.cluster, record.cwd) == (
+        "1234",
+        "graham",
+        str(tmp_path),
+    )
+    assert (record.mem, record.cpu, record.time, record.gpu) == (4000, 1, 180, False)
+    assert record.slurm_args.startswith("--account=some-account --time=03:00:00")
+    assert record.command == "ls" and record.state is None
+
+
+def _sbatch(stdout: str):
+    return mock.patch(
+        "subprocess.run", return_value=sp.CompletedProcess([], 0, stdout, "")
+    )
+
+
+def test_queries_filter_and_order_jobs(registry: JobRegistry):
+    for jobid in ["1001", "1002", "1003"]:
+        registry.add(_record(jobid))
+    registry.add(_record("1004", state="FAILED", cwd="/scratch"))
+
+    assert [r.jobid for r in registry.query()] == ["1004", "1003", "1002", "1001"]
+    assert [r.jobid for r in registry.query(limit=2)] == ["1004", "1003"]
+    assert [r.jobid for r in registry.query(states=["failed"])] == ["1004"]
+    assert [r.jobid for r in registry.query(states=["pending"])] == [
+        "1003",
+        "1002",
+        "1001",
+    ]
+    assert [r.jobid for r in registry.query(cwd="/scratch")] == ["1004"]
+    assert [r.jobid for r in registry.query(jobids=["1001", "1003"])] == [
+        "1003",
+        "1001",
+    ]
+
+
+def test_active_jobs_are_refreshed_with_one_sacct_call(registry: JobRegistry):
+    registry.add(_record("1001", state="COMPLETED"))
+    registry.add(_record("1002"))
+    registry.add(_record("1003", state="RUNNING"))
+    with _sacct(
+        "1002|CANCELLED by 5|0:15|00:01:00", "1003|COMPLETED|0:0|01:00:00"
+    ) as run:
+        records = registry.refresh(registry.query())
+    (call,) = run.call_args_list
+    assert "1003,1002" in call.args[0]
+    assert [(r.jobid, r.state) for r in records] == [
+        ("1003", "COMPLETED"),
+        ("1002", "CANCELLED"),
+        ("1001", "COMPLETED"),
+    ]
+    assert registry.query(jobids=["1002"])[0].exit_code == "0:15"
+
+
+def test_array_tasks_are_summarized():
+    with _sacct(
+        "1001_1|COMPLETED|0:0|00:01:00",
+        "1001_2|FAILED|1:0|00:01:00",
+        "1002_1|COMPLETED|0:0|00:01:00",
+        "1002_[2-5]|PENDING|0:0|00:00:00",
+        "1003_1|COMPLETED|0:0|00:01:00",
+    ):
+        states = sacct(["1001", "1002", "1003"])
+    assert {jobid: state[0] for jobid, state in states.items()} == {
+        "1001": "FAILED",
+        "1002": "PENDING",
+        "1003": "COMPLETED",
+    }
+
+
+def test_missing_sacct_keeps_recorded_states(
+    registry: JobRegistry, monkeypatch: MonkeyPatch
+):
+    monkeypatch.setenv("PATH", "")
+    registry.add(_record("1001"))
+    (record,) = registry.refresh(registry.query())
+    assert record.state is None
+
+
+def test_jobs_lists_recorded_jobs(registry: JobRegistry, capsys: CaptureFixture[str]):
+    registry.add(_record("1001", state="COMPLETED", exit_code="0:0"))
+    registry.add(_record("1002"))
+    with _sacct("1002|RUNNING|0:0|00:05:00"):
+        assert jobs.cli(["kslurm jobs", "--state", "running"]) == 0
+    out = capsys.readouterr().out
+    assert "1002" in out and "RUNNING" in out and "1001" not in out
+
+    assert jobs.cli(["kslurm jobs", "--no-refresh", "--json", "1001"]) == 0
+    (line,) = capsys.readouterr().out.splitlines()
+    assert json.loads(line)["exit_code"] == "0:0"
+
+
+class _Sacct:
+    """Fake sacct reporting a sequence of outputs, one per call"""
+
+    def __init__(self, *outputs: str):
+        self.outputs = list(outputs)
+        self.calls: list[list[str]] = []
+
+    def __call__(self, argv: list[str], **kwargs: Any):
+        self.calls.append(argv)
+        return sp.CompletedProcess(argv, 0, self.outputs.pop(0))
+
+
+@pytest.fixture
+def sleeps(monkeypatch: MonkeyPatch):
+    sleeps: list[float] = []
+    monkeypatch.setattr("time.sleep", sleeps.append)
+    return sleeps
+
+
+def test_waiting_polls_all_jobs_at_once_with_backoff(sleeps: list[float]):
+    fake = _Sacct(
+        "1001|RUNNING|0:0|00:01:00\n",
+        "1001|RUNNING|0:0|00:02:00\n1002|PENDING|0:0|00:00:00\n",
+        "1001|COMPLETED|0:0|00:03:00\n1002_1|RUNNING|0:0|00:00:10\n",
+        "1002_1|COMPLETED|0:0|00:01:00\n1002_2|COMPLETED|0:0|00:01:00\n",
+    )
+    with mock.patch("subprocess.run", fake):
+        finished = wait(["1001", "1002;graham"], interval=1, max_interval=3)
+    assert sleeps == [1, 2, 3]
+    assert [call[2] for call in fake.calls] == ["1001,1002"] * 3 + ["1002"]
+    assert finished == {
+        "1001": ("COMPLETED", "0:0", "00:03:00"),
+        "1002": ("COMPLETED", "0:0", "00:01:00"),
+    }
+    assert wait_status(["1001", "1002"], finished) == 0
+
+
+def test_wait_exit_code_summarizes_states():
+    assert wait_status(["1"], {"1": ("COMPLETED", "0:0", "")}) == 0
+    assert (
+        wait_status(
+            ["1", "2"], {"1": ("COMPLETED", "0:0", ""), "2": ("TIMEOUT", "0:0", "")}
+        )
+        == 1
+    )
+    assert wait_status(["1", "2"], {"1": ("FAILED", "1:0", "")}) == WAIT_TIMEOUT
+
+
+def test_wait_command_reports_and_records_jobs(
+    registry: JobRegistry, sleeps: list[float], capsys: CaptureFixture[str]
+):
+    registry.add(_record("1001"))
+    fake = _Sacct("1001|OUT_OF_MEMORY|0:125|00:10:00\n")
+    with mock.patch("subprocess.run", fake):
+        assert jobs_wait.cli(["kslurm wait", "1001"]) == 1
+    assert "Job 1001 OUT_OF_MEMORY" in capsys.readouterr().out
+    assert registry.query()[0].state == "OUT_OF_MEMORY"
+
+
+def test_wait_times_out(sleeps: list[float], monkeypatch: MonkeyPatch):
+    clock = iter(range(0, 100, 10))
+    monkeypatch.setattr("time.monotonic", lambda: next(clock))
+    fake = _Sacct(*["1001|PENDING|0:0|00:00:00\n"] * 3)
+    with mock.patch("subprocess.run", fake):
+        code = jobs_wait.cli(["kslurm wait", "--timeout", "25", "-q", "1001"])
+    assert code == WAIT_TIMEOUT
+    assert sleeps == [5, 5]
+
+
+def test_kbatch_can_wait_for_its_job(sleeps: list[float], monkeypatch: MonkeyPatch):
+    monkeypatch.chdir(Path.cwd())
+    outputs = iter(
+        [
+            sp.CompletedProcess([], 0, "1234\n", ""),
+            sp.CompletedProcess([], 0, "1234|FAILED|1:0|00:00:05\n", ""),
+        ]
+    )
+    with mock.patch("subprocess.run", lambda *args, **kwargs: next(outputs)):
+        code = kbatch.cli(["kbatch", "-a", "acct", "--no-estimate", "--wait", "ls"])
+    assert code == 1
+
+
+def test_failing_sacct_stops_waiting(sleeps: list[float], capsys: CaptureFixture[str]):
+    failed = sp.CompletedProcess([], 1, "", "sacct: error: slurmdbd unavailable\n")
+    with mock.patch("subprocess.run", return_value=failed):
+        assert jobs_wait.cli(["kslurm wait", "1001"]) == 1
+    assert "slurmdbd unavailable" in capsys.readouterr().err
+    assert not sleeps
+
+
+def test_jobs_unknown_to_sacct_fail_after_a_grace_period(
+    sleeps: list[float], monkeypatch: MonkeyPatch, capsys: CaptureFixture[str]
+):
+    clock = iter(range(0, 1000, 100))
+    monkeypatch.setattr("time.monotonic", lambda: next(clock))
+    fake = _Sacct(*["1001|COMPLETED|0:0|00:01:00\n"] * 4)
+    with mock.patch("subprocess.run", fake):
+        assert jobs_wait.cli(["kslurm wait", "1001", "9999"]) == 1
+    assert len(fake.calls) == 3
+    assert "Job 9999 is not known to sacct" in capsys.readouterr().out
+
+
+def test_interrupted_waits_record_finished_jobs(
+    registry: JobRegistry, monkeypatch: MonkeyPatch
+):
+    registry.add(_record("1001"))
+    registry.add(_record("1002"))
+
+    def interrupt(delay: float):
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr("time.sleep", interrupt)
+    fake = _Sacct("1001|COMPLETED|0:0|00:01:00\n1002|RUNNING|0:0|00:01:00\n")
+    with mock.patch("subprocess.run", fake):
+        assert jobs_wait.cli(["kslurm wait", "1001", "1002"]) == 130
+    assert {r.jobid: r.state for r in registry.query()} == {
+        "1001": "COMPLETED",
+        "1002": None,
+    }
@@ -0,0 +1,68 @@
+from __future__ import absolute_import, annotations
+
+import json
+from pathlib import Path
+
+import pytest
+from pytest import MonkeyPatch
+
+from kslurm.slurm.pack import pending_tasks, read_results, run_pack, task_argv
+
+
+@pytest.fixture(autouse=True)
+def outside_job(monkeypatch: MonkeyPatch):
+    monkeypatch.delenv("SLURM_JOB_ID", raising=False)
+    monkeypatch.delenv("SLURM_JOBID", raising=False)
+
+
+def test_every_task_is_recorded(tmp_path: Path):
+    results = tmp_path / "results.jsonl"
+    commands = [f"echo {i} >> {tmp_path / 'out'}" for i in range(5)] + ["exit 3"]
+    assert run_pack(commands, results, slots=3) == 1
+
+    recorded = read_results(results)
+    assert sorted(recorded) == [1, 2, 3, 4, 5, 6]
+    assert [recorded[task]["exit"] for task in range(1, 7)] == [0, 0, 0, 0, 0, 3]
+    assert all(result["seconds"] >= 0 for result in recorded.values())
+    assert sorted((tmp_path / "out").read_text().split()) == list("01234")
+
+
+def test_slots_limit_running_tasks(tmp_path: Path):
+    results = tmp_path / "results.jsonl"
+    lock = tmp_path / "lock"
+    # Fails if another task holds the lock
+    command = f"mkdir {lock} && sleep 0.05 && rmdir {lock}"
+    assert run_pack([command] * 4, results, slots=1) == 0
+
+
+def test_resuming_skips_recorded_tasks(tmp_path: Path):
+    results = tmp_path / "results.jsonl"
+    results.write_text(
+        json.dumps({"task": 1, "command": "exit 1", "exit": 0})
+        + "\n"
+        + json.dumps({"task": 2, "command": "changed", "exit": 0})
+        + "\n"
+        + '{"task": 3, "comm'
+    )
+    commands = ["exit 1", "true", "true"]
+    assert pending_tasks(commands, results) == [2, 3]
+    assert run_pack(commands, results, slots=2) == 0
+    assert pending_tasks(commands, results) == []
+
+
+def test_tasks_run_as_job_steps_within_a_job(monkeypatch: MonkeyPatch):
+    monkeypatch.setenv("SLURM_JOB_ID", "1234")
+    monkeypatch.setattr("shutil.which", lambda name: f"/usr/bin/{name}")
+    assert task_argv("echo a", cpus=2, mem=1000) == [
+        "srun",
+        "--exact",
+        "--ntasks=1",
+        "--nodes=1",
+        "--cpus-per-task=2",
+        "--mem=1000",
+        "bash",
+        "-c",
+        "echo a",
+    ]
+    monkeypatch.delenv("SLURM_JOB_ID")
+    assert task_argv("echo a", cpus=2) == ["bash", "-c", "echo a"]
@@ -0,0 +1,191 @@
+from __future__ import absolute_import, annotations
+
+import sqlite3
+import subprocess as sp
+from pathlib import Path
+from typing import Any, Optional
+from unittest import mock
+
+import attrs
+import pytest
+from pytest import CaptureFixture, MonkeyPatch
+
+from kslurm.cli.kbatch import kbatch
+from kslurm.slurm import jobs
+from kslurm.slurm.jobs import JobRecord, JobRegistry
+from kslurm.slurm.sizing import Sizing, fingerprint, suggest
+
+_Popen = sp.Popen
+
+
+@pytest.fixture(autouse=True)
+def registry(tmp_path: Path, monkeypatch: MonkeyPatch):
+    monkeypatch.setattr("kslurm.slurm.jobs.JOBS_DB", tmp_path / "jobs.db")
+    monkeypatch.setattr("kslurm.appcache.CACHE_PATH", tmp_path / "cache")
+    monkeypatch.chdir(Path.cwd())
+    registry = JobRegistry()
+    yield registry
+    registry.close()
+
+
+def _run(
+    jobid: str,
+    state: Optional[str] = "COMPLETED",
+    peak_mem: Optional[float] = None,
+    run_time: Optional[float] = None,
+    cores: Optional[float] = None,
+):
+    return JobRecord(
+        jobid,
+        "",
+        "",
+        "align sub-01.nii",
+        "/home",
+        cpu=4,
+        mem=16000,
+        time=600,
+        gpu=False,
+        submitted=f"2026-01-01T00:00:{jobid[-2:]}",
+        state=state,
+        fingerprint="fp",
+        peak_mem=peak_mem,
+        run_time=run_time,
+        cores=cores,
+    )
+
+
+def test_fingerprints_ignore_data():
+    assert fingerprint(["/opt/bin/align", "data/sub-01.nii.gz", "--threads=4"]) == (
+        fingerprint(["align", "other/sub-22.nii.gz", "--threads=8"])
+    )
+    assert fingerprint(["align sub-01.nii.gz 'a b'"]) == fingerprint(
+        ["align", "sub-02.nii.gz", "a b"]
+    )
+    assert fingerprint(["align", "data/sub-01.nii.gz"]) != fingerprint(
+        ["align", "data/sub-01.txt"]
+    )
+    assert fingerprint(["align", "--fast"]) != fingerprint(["sort", "--fast"])
+
+
+def test_jobs_are_sized_to_peak_use_with_margin(registry: JobRegistry):
+    for i, (mem, time, cores) in enumerate([(1000, 600, 0.9), (2000, 1200, 1.5)]):
+        registry.add(_run(f"10{i}", peak_mem=mem, run_time=time, cores=cores))
+    assert suggest(registry, "fp", 4, 16000, 600) is None
+    registry.add(_run("1003", peak_mem=1500, run_time=300, cores=1.0))
+    assert suggest(registry, "fp", 4, 16000, 600) == Sizing(2, 2400, 24, 3)
+    assert suggest(registry, "fp", 4, 16000, 600, margin=0) == Sizing(2, 2000, 20, 3)
+    # Resources are never raised
+    assert suggest(registry, "fp", 1, 1000, 10) is None
+
+
+def test_failed_runs_are_not_used(registry: JobRegistry):
+    for i in range(3):
+        registry.add(_run(f"100{i}", peak_mem=1000, run_time=60, cores=1))
+    registry.add(_run("1004", state="OUT_OF_MEMORY", peak_mem=8000))
+    sizing = suggest(registry, "fp", 4, 16000, 600)
+    assert sizing is not None and sizing.mem == 1200
+
+
+SACCT = """\
+1001|align|COMPLETED|4|01:00:00|00:30:00|10:00:00|16000M|
+1001.batch|batch|COMPLETED|4|01:00:00|00:30:00||0|1000M
+1002_1|align|COMPLETED|4|00:30:00|00:30:00|10:00:00|16000M|
+1002_1.batch|batch|COMPLETED|4|00:30:00|00:30:00||0|3000M
+1002_2|align|COMPLETED|4|00:30:00|00:40:00|10:00:00|16000M|
+1002_2.batch|batch|COMPLETED|4|00:30:00|00:40:00||0|500M
+1003|align|FAILED|4|00:30:00|00:30:00|10:00:00|16000M|
+1003.batch|batch|FAILED|4|00:30:00|00:30:00||0|500M
+1004|align|COMPLETED|4|00:30:00|00:10:00|10:00:00|16000M|
+1004.batch|batch|COMPLETED|4|00:30:00|00:10:00||0|100M
+"""
+
+
+def test_use_of_finished_runs_is_read_with_one_sacct_call(registry: JobRegistry):
+    for jobid in ["1001", "1002", "1003", "1004"]:
+        registry.add(_run(jobid, state=None))
+    registry.add(attrs.evolve(_run("1005", state="RUNNING"), submitted=jobs._now()))
+    calls: list[list[str]] = []
+
+    def popen(argv: list[str], **kwargs: Any):
+        calls.append(argv)
+        return _Popen(["printf", "%s", SACCT], **kwargs)
+
+    with mock.patch("subprocess.Popen", popen):
+        sizing = suggest(registry, "fp", 4, 16000, 600)
+    (call,) = calls
+    assert "--jobs=1004,1003,1002,1001" in call
+    assert sizing == Sizing(4, 3600, 48, 3)
+    (array,) = registry.query(jobids=["1002"])
+    assert (array.peak_mem, array.run_time, array.cores) == (3000, 2400, 1)
+    assert registry.query(jobids=["1003"])[0].state == "FAILED"
+
+
+def test_usage_lookups_skip_running_jobs_and_are_throttled(registry: JobRegistry):
+    for jobid in ["1001", "1002", "1003"]:
+        registry.add(_run(jobid, peak_mem=1000, run_time=60, cores=1))
+    # Just submitted, and not yet refreshed
+    registry.add(attrs.evolve(_run("1004", state=None), submitted=jobs._now()))
+    with mock.patch("subprocess.Popen") as popen:
+        assert suggest(registry, "fp", 4, 16000, 600) is not None
+    popen.assert_not_called()
+
+    registry.add(_run("1000", state=None))
+    calls: list[list[str]] = []
+
+    def popen_(argv: list[str], **kwargs: Any):
+        calls.append(argv)
+        return _Popen(["printf", ""], **kwargs)
+
+    with mock.patch("subprocess.Popen", popen_):
+        suggest(registry, "fp", 4, 16000, 600)
+        suggest(registry, "fp", 4, 16000, 600)
+    (call,) = calls
+    assert "--jobs=1000" in call
+
+
+def test_v1_registries_are_migrated(tmp_path: Path):
+    path = tmp_path / "old.db"
+    db = sqlite3.connect(path)
+    db.executescript(jobs._MIGRATIONS[0] + "PRAGMA user_version = 1;")
+    db.close()
+    registry = JobRegistry(path)
+    registry.add(_run("1001", peak_mem=100))
+    assert registry.query()[0].peak_mem == 100
+    assert registry.db.execute("PRAGMA user_version").fetchone()[0] == 2
+    registry.close()
+
+
+@pytest.fixture
+def history(registry: JobRegistry):
+    for i in range(3):
+        registry.add(
+            attrs.evolve(
+                _run(f"100{i}", peak_mem=1000, run_time=1200, cores=1),
+                fingerprint=fingerprint(["align", "sub-01.nii"]),
+            )
+        )
+
+
+def test_kbatch_suggests_resources(history: None, capsys: CaptureFixture[str]):
+    kbatch.cli(["kbatch", "-t", "-a", "acct", "16G", "2:00", "align", "sub-02.nii"])
+    out = capsys.readouterr().out
+    assert "suggest 1 cpu, 1200MB, 00:24:00" in out
+    assert "--mem=16000" in out
+
+
+def test_kbatch_can_auto_size(history: None, capsys: CaptureFixture[str]):
+    kbatch.cli(
+        ["kbatch", "-t", "-a", "acct", "--auto-size", "16G", "align", "sub-02.nii"]
+    )
+    out = capsys.readouterr().out
+    assert "--time=00:24:00 --cpus-per-task=1 --mem=1200" in out
+
+
+def test_suggestions_can_be_turned_off(
+    history: None, tmp_path: Path, monkeypatch: MonkeyPatch, capsys: CaptureFixture[str]
+):
+    config = tmp_path / "config.json"
+    config.write_text('{"autosize": "off"}')
+    monkeypatch.setattr("kslurm.appconfig.CONFIG_PATH", config)
+    kbatch.cli(["kbatch", "-t", "-a", "acct", "16G", "align", "sub-02.nii"])
+    assert "suggest" not in capsys.readouterr().out
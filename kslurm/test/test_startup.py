@@ -0,0 +1,115 @@
+from __future__ import absolute_import, annotations
+
+import json
+import os
+import re
+import subprocess as sp
+import sys
+from pathlib import Path
+from typing import Any, Optional
+
+import pytest
+
+PYPROJECT = Path(__file__).parents[2] / "pyproject.toml"
+
+# Modules that no entry point should import before a subcommand needs them
+HEAVY_MODULES = ["requests", "virtualenv", "InquirerPy", "yaspin", "pint"]
+
+# Modules that must never be imported by commands run from shell hooks
+HOOK_EXCLUDED_MODULES = [*HEAVY_MODULES, "tabulate", "docstring_parser"]
+
+# Generous upper bound on the run time of shell hook commands, in seconds, to catch
+# gross regressions without being sensitive to the speed of the test machine
+HOOK_BUDGET = 1.0
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print("\\n" + json.dumps({{"elapsed": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def _entry_points() -> dict[str, tuple[str, str]]:
+    text = PYPROJECT.read_text()
+    section = re.search(
+        r"^\[tool\.poetry\.scripts\]\n(.*?)(?:^\[|\Z)", text, re.M | re.S
+    )
+    assert section
+    return {
+        name: (module, attr)
+        for name, module, attr in re.findall(
+            r"^(\S+)\s*=\s*'([\w\.]+):([\w\.]+)'", section.group(1), re.M
+        )
+    }
+
+
+def _probe(code: str, env: Optional[dict[str, str]] = None) -> dict[str, Any]:
+    proc = sp.run(
+        [sys.executable, "-c", _PROBE.format(code=code)],
+        capture_output=True,
+        env={**os.environ, **(env or {})},
+        cwd=PYPROJECT.parent,
+    )
+    assert proc.returncode == 0, proc.stderr.decode()
+    return json.loads(proc.stdout.decode().splitlines()[-1])
+
+
+@pytest.fixture
+def isolated_env(tmp_path: Path):
+    return {
+        "XDG_CONFIG_HOME": str(tmp_path / "config"),
+        "XDG_CACHE_HOME": str(tmp_path / "cache"),
+    }
+
+
+def test_all_entry_points_are_checked():
+    assert set(_entry_points()) == {
+        "kbatch",
+        "krun",
+        "kjupyter",
+        "kslurm",
+        "kpy",
+        "kapp",
+        "kslurm-client",
+    }
+
+
+@pytest.mark.parametrize("name", sorted(_entry_points()))
+def test_entry_point_imports_are_light(name: str, isolated_env: dict[str, str]):
+    module, _ = _entry_points()[name]
+    result = _probe(f"import {module}", isolated_env)
+    assert not set(HEAVY_MODULES) & set(result["modules"])
+
+
+def _warm_probe(code: str, env: dict[str, str]):
+    """Probe code after running it once to populate the introspection cache"""
+    _probe(code, env)
+    return _probe(code, env)
+
+
+def test_kslurm_config_is_light(isolated_env: dict[str, str]):
+    result = _warm_probe(
+        "from kslurm.cli.main import main\nmain.cli(['kslurm', 'config', 'pipdir'])",
+        isolated_env,
+    )
+    assert not set(HOOK_EXCLUDED_MODULES) & set(result["modules"])
+    assert result["elapsed"] < HOOK_BUDGET
+
+
+def test_kpy_refresh_is_light(tmp_path: Path, isolated_env: dict[str, str]):
+    venv = tmp_path / "venv"
+    venv.mkdir()
+    (venv / "pyvenv.cfg").write_text("prompt = venv\n")
+    result = _warm_probe(
+        "from kslurm.cli.kpy import kpy\nkpy.cli(['kpy', '_refresh'])",
+        {**isolated_env, "VIRTUAL_ENV": str(venv)},
+    )
+    assert not set(HOOK_EXCLUDED_MODULES) & set(result["modules"])
+    assert result["elapsed"] < HOOK_BUDGET
+
+
+def test_daemon_client_is_light(isolated_env: dict[str, str]):
+    result = _probe("import kslurm.daemon.client", isolated_env)
+    assert not {"attr", "rich", "kslurm.args"} & set(result["modules"])
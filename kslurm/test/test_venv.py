@@ -0,0 +1,406 @@
+from __future__ import absolute_import, annotations
+
+import json
+import os
+import shutil
+import subprocess as sp
+import tarfile
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from pytest import MonkeyPatch
+
+import kslurm.appconfig as appconfig
+from kslurm.venv import (
+    CODECS,
+    IMAGE_MARKER,
+    RELOCATION_MANIFEST,
+    ArchiveError,
+    KpyIndex,
+    VenvCache,
+    VenvPrompt,
+    _PyEnvCfg,
+    default_codec,
+    detect_codec,
+    rebase_venv,
+    record_relocation,
+    unmount_images,
+    venv_state,
+)
+
+
+@pytest.fixture
+def venv(tmp_path: Path):
+    venv = tmp_path / "venv"
+    (venv / "bin").mkdir(parents=True)
+    (venv / "bin" / "activate").write_text('VIRTUAL_ENV="/old/venv"\n')
+    (venv / "bin" / "python").symlink_to("/usr/bin/python3")
+    (venv / "lib").mkdir()
+    (venv / "lib" / "module.py").write_text("x = 1\n" * 1000)
+    return venv
+
+
+@pytest.fixture
+def config(tmp_path: Path, monkeypatch: MonkeyPatch):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"pipdir": str(tmp_path / "pipdir")}))
+    monkeypatch.setattr(appconfig, "CONFIG_PATH", path)
+    monkeypatch.setattr("kslurm.appcache.COMPLETION_CACHE", tmp_path / "completion")
+    return path
+
+
+def _same_tree(a: Path, b: Path):
+    assert sorted(p.relative_to(a) for p in a.rglob("*")) == sorted(
+        p.relative_to(b) for p in b.rglob("*")
+    )
+    assert (b / "lib" / "module.py").read_text() == "x = 1\n" * 1000
+    assert (b / "bin" / "python").is_symlink()
+
+
+@pytest.mark.parametrize("name", CODECS)
+def test_archives_round_trip(name: str, venv: Path, tmp_path: Path, config: Path):
+    codec = CODECS[name]
+    if not codec.available:
+        pytest.skip(f"{name} is not installed")
+    archive = tmp_path / f"venv{codec.suffix}"
+    codec.write(venv, archive)
+    assert detect_codec(archive) == codec
+    detect_codec(archive).extract(archive, tmp_path / "out")
+    _same_tree(venv, tmp_path / "out")
+
+
+def test_corrupt_archives_raise(tmp_path: Path):
+    codec = CODECS["zstd"]
+    if not codec.available:
+        pytest.skip("zstd is not installed")
+    archive = tmp_path / "venv.tar.zst"
+    archive.write_bytes(codec.magic + b"garbage")
+    with pytest.raises(ArchiveError, match="zstd failed"):
+        codec.extract(archive, tmp_path / "out")
+
+
+def test_gzip_works_without_external_tools(
+    venv: Path, tmp_path: Path, monkeypatch: MonkeyPatch
+):
+    monkeypatch.setattr("shutil.which", lambda cmd: None)
+    codec = CODECS["gzip"]
+    codec.write(venv, tmp_path / "venv.tar.gz")
+    codec.extract(tmp_path / "venv.tar.gz", tmp_path / "out")
+    _same_tree(venv, tmp_path / "out")
+    with pytest.raises(ArchiveError, match="zstd"):
+        CODECS["zstd"].write(venv, tmp_path / "venv.tar.zst")
+
+
+def test_legacy_archives_are_listed_and_loaded(
+    venv: Path, tmp_path: Path, config: Path
+):
+    pipdir = tmp_path / "pipdir" / "venv_archives"
+    pipdir.mkdir(parents=True)
+    with tarfile.open(pipdir / "old.tar.gz", "w:gz") as tar:
+        tar.add(venv, arcname="")
+    CODECS["none"].write(venv, pipdir / "plain.tar")
+    (pipdir / "staged.tar.gz.tmp").touch()
+
+    cache = VenvCache()
+    assert set(cache) == {"old", "plain"}
+    cache.extract("old", tmp_path / "out")
+    _same_tree(venv, tmp_path / "out")
+    assert cache.get_path("new", CODECS["lz4"]) == pipdir / "new.tar.lz4"
+
+
+def test_default_codec_is_read_from_config(config: Path):
+    config.write_text(json.dumps({"kpy.codec": "lz4"}))
+    assert default_codec() == CODECS["lz4"]
+    config.write_text(json.dumps({"kpy.codec": "bz2"}))
+    with pytest.raises(ArchiveError, match="kpy.codec"):
+        default_codec()
+
+
+@pytest.fixture
+def squashfs_tools(tmp_path: Path, monkeypatch: MonkeyPatch):
+    """Stand-ins for the squashfs tools, storing images as tar files after the
+    squashfs magic, "mounting" them by extraction, and "unmounting" them by deletion
+    """
+    bin_dir = tmp_path / "tools"
+    bin_dir.mkdir()
+    scripts = {
+        "mksquashfs": 'printf hsqs > "$2" && tar -c -C "$1" . >> "$2"',
+        "unsquashfs": 'mkdir -p "$4" && tail -c +5 "$5" | tar -x -C "$4"',
+        "squashfuse": 'echo "$2" >> "$(dirname "$0")/mounts" && '
+        'tail -c +5 "$1" | tar -x -C "$2"',
+        "fusermount3": 'echo "$2" >> "$(dirname "$0")/unmounts" && '
+        'find "$2" -mindepth 1 -delete',
+    }
+    for name, script in scripts.items():
+        (bin_dir / name).write_text(f"#!/bin/sh\n{script}\n")
+        (bin_dir / name).chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return bin_dir
+
+
+def test_squashfs_images_are_mounted_once(
+    venv: Path, tmp_path: Path, config: Path, squashfs_tools: Path
+):
+    codec = CODECS["squashfs"]
+    pipdir = tmp_path / "pipdir" / "venv_archives"
+    pipdir.mkdir(parents=True)
+    codec.write(venv, pipdir / "image.sqfs")
+    assert detect_codec(pipdir / "image.sqfs") == codec
+
+    cache = VenvCache()
+    index = KpyIndex(tmp_path / "job")
+    assert cache.mount("image", tmp_path / "first", index, tmp_path / "job")
+    assert cache.mount("image", tmp_path / "second", index, tmp_path / "job")
+    index.write()
+
+    mounts = (squashfs_tools / "mounts").read_text().split()
+    assert len(mounts) == 1
+    assert list(KpyIndex(tmp_path / "job").mounts.values()) == mounts
+    for loaded in [tmp_path / "first", tmp_path / "second"]:
+        assert (loaded / "lib").resolve() == Path(mounts[0], "lib")
+        assert not (loaded / "bin").is_symlink()
+        assert (loaded / "bin" / "python").is_symlink()
+        assert (loaded / "lib" / "module.py").read_text() == "x = 1\n" * 1000
+
+
+def test_mounted_venvs_are_saved_with_the_contents_of_their_image(
+    venv: Path,
+    tmp_path: Path,
+    config: Path,
+    squashfs_tools: Path,
+    monkeypatch: MonkeyPatch,
+):
+    from kslurm.cli.kpy import kpy
+
+    pipdir = tmp_path / "pipdir" / "venv_archives"
+    pipdir.mkdir(parents=True)
+    CODECS["squashfs"].write(venv, pipdir / "image.sqfs")
+    index = KpyIndex(tmp_path / "job")
+    VenvCache().mount("image", tmp_path / "loaded", index, tmp_path / "job")
+
+    monkeypatch.setenv("VIRTUAL_ENV", str(tmp_path / "loaded"))
+    monkeypatch.setenv("SLURM_TMPDIR", str(tmp_path / "job"))
+    kpy.cli(["kpy", "save", "resaved", "--codec", "none"])
+    CODECS["none"].extract(pipdir / "resaved.tar", tmp_path / "out")
+    assert not (tmp_path / "out" / "lib").is_symlink()
+    assert not (tmp_path / "out" / IMAGE_MARKER).exists()
+    assert (tmp_path / "out" / "lib" / "module.py").read_text() == "x = 1\n" * 1000
+    assert (tmp_path / "out" / "bin" / "python").is_symlink()
+
+
+def test_images_are_unmounted_once_no_longer_held(
+    venv: Path, tmp_path: Path, config: Path, squashfs_tools: Path
+):
+    pipdir = tmp_path / "pipdir" / "venv_archives"
+    pipdir.mkdir(parents=True)
+    CODECS["squashfs"].write(venv, pipdir / "image.sqfs")
+    index = KpyIndex(tmp_path / "job")
+    VenvCache().mount("image", tmp_path / "loaded", index, tmp_path / "job")
+    index["loaded"] = str(tmp_path / "loaded")
+    (mountpoint,) = index.mounts.values()
+    exited = sp.Popen(["true"])
+    exited.wait()
+    for owner in [1, os.getpid(), exited.pid]:
+        index.hold(mountpoint, owner)
+
+    unmount_images(index, 1)
+    assert not (squashfs_tools / "unmounts").exists()
+    unmount_images(index, os.getpid())
+    assert (squashfs_tools / "unmounts").read_text().split() == [mountpoint]
+    assert not Path(mountpoint).exists()
+    assert not index.mounts and not index.owners and "loaded" not in index
+
+
+def test_loading_shells_unmount_their_images(
+    venv: Path,
+    tmp_path: Path,
+    config: Path,
+    squashfs_tools: Path,
+    monkeypatch: MonkeyPatch,
+):
+    from kslurm.cli.kpy import kpy
+
+    pipdir = tmp_path / "pipdir" / "venv_archives"
+    pipdir.mkdir(parents=True)
+    CODECS["squashfs"].write(venv, pipdir / "image.sqfs")
+    monkeypatch.setenv("SLURM_TMPDIR", str(tmp_path / "job"))
+    script = tmp_path / "script"
+    assert kpy.cli(["kpy", "load", "image", "--script", str(script)]) == 2
+    assert script.read_text().endswith("\n_kpy_unmount_on_exit\n")
+    (mountpoint,) = KpyIndex(tmp_path / "job").owners
+    assert KpyIndex(tmp_path / "job").owners[mountpoint] == [os.getppid()]
+
+    kpy.cli(["kpy", "_unmount"])
+    assert (squashfs_tools / "unmounts").read_text().split() == [mountpoint]
+    assert "image" not in KpyIndex(tmp_path / "job")
+
+
+def test_squashfs_images_can_be_extracted(
+    venv: Path, tmp_path: Path, squashfs_tools: Path
+):
+    codec = CODECS["squashfs"]
+    codec.write(venv, tmp_path / "image.sqfs")
+    codec.extract(tmp_path / "image.sqfs", tmp_path / "out")
+    _same_tree(venv, tmp_path / "out")
+
+
+def test_tar_archives_are_not_mounted(venv: Path, tmp_path: Path, config: Path):
+    pipdir = tmp_path / "pipdir" / "venv_archives"
+    pipdir.mkdir(parents=True)
+    CODECS["none"].write(venv, pipdir / "plain.tar")
+    index = KpyIndex(tmp_path / "job")
+    assert not VenvCache().mount("plain", tmp_path / "out", index, tmp_path / "job")
+    assert not index.mounts
+
+
+def _scripts(venv: Path, count: int = 3):
+    activate = venv / "bin" / "activate"
+    activate.write_text('# activate\nVIRTUAL_ENV="/old/venv"\nexport VIRTUAL_ENV\n')
+    for i in range(count):
+        script = venv / "bin" / f"tool{i}"
+        script.write_text(f"#!/old/venv/bin/python\nimport tool{i}\n")
+        script.chmod(0o755)
+    binary = venv / "bin" / "binary"
+    binary.write_bytes(b"\x7fELF\x00\xff" * 100)
+    binary.chmod(0o755)
+    (venv / "bin" / "data").write_text("#!/old/venv/bin/python\n")
+
+
+@pytest.mark.parametrize("count", [3, 100])
+def test_venvs_are_rebased_from_their_manifest(venv: Path, tmp_path: Path, count: int):
+    _scripts(venv, count)
+    record_relocation(venv)
+    assert json.loads((venv / RELOCATION_MANIFEST).read_text()) == {
+        "scripts": sorted(f"bin/tool{i}" for i in range(count)),
+        "activate": [1],
+    }
+    moved = tmp_path / "moved"
+    venv.rename(moved)
+    with mock.patch("kslurm.venv._python_scripts") as scan:
+        rebase_venv(moved)
+    scan.assert_not_called()
+
+    python = moved.resolve() / "bin" / "python"
+    for i in range(count):
+        assert (moved / "bin" / f"tool{i}").read_text() == (
+            f"#!{python}\nimport tool{i}\n"
+        )
+    assert (moved / "bin" / "activate").read_text() == (
+        f'# activate\nVIRTUAL_ENV="{moved.resolve()}"\nexport VIRTUAL_ENV\n'
+    )
+    assert (moved / "bin" / "binary").read_bytes() == b"\x7fELF\x00\xff" * 100
+    assert (moved / "bin" / "data").read_text() == "#!/old/venv/bin/python\n"
+
+
+def test_venvs_without_a_manifest_are_scanned(venv: Path, tmp_path: Path):
+    _scripts(venv)
+    moved = tmp_path / "moved"
+    venv.rename(moved)
+    rebase_venv(moved)
+    python = moved.resolve() / "bin" / "python"
+    assert (moved / "bin" / "tool0").read_text() == f"#!{python}\nimport tool0\n"
+    assert (moved / "bin" / "binary").read_bytes() == b"\x7fELF\x00\xff" * 100
+    assert (
+        f'VIRTUAL_ENV="{moved.resolve()}"' in (moved / "bin" / "activate").read_text()
+    )
+
+
+def _install(venv: Path, dist: str, python: str = "python3.9", **files: str):
+    dist_info = venv / "lib" / python / "site-packages" / f"{dist}.dist-info"
+    dist_info.mkdir(parents=True)
+    (dist_info / "RECORD").write_text(f"{dist}.dist-info/RECORD,,\n")
+    for name, contents in files.items():
+        (dist_info / f"{name}.json").write_text(contents)
+    return dist_info
+
+
+def test_venv_state_follows_pip_freeze(venv: Path):
+    _install(venv, "numpy-1.26.0")
+    _install(venv, "pip-23.0")
+    state = venv_state(venv)
+
+    # Ignored by pip freeze
+    (venv / "lib" / "python3.9" / "site-packages" / "pip-23.0.dist-info").rename(
+        venv / "lib" / "python3.9" / "site-packages" / "pip-24.0.dist-info"
+    )
+    _install(venv, "setuptools-69.0")
+    (
+        venv
+        / "lib"
+        / "python3.9"
+        / "site-packages"
+        / "numpy-1.26.0.dist-info"
+        / "RECORD"
+    ).write_text("")
+    assert venv_state(venv) == state
+
+    _install(venv, "Typing_Extensions-4.0")
+    assert venv_state(venv) != state
+    shutil.rmtree(
+        venv / "lib" / "python3.9" / "site-packages" / "Typing_Extensions-4.0.dist-info"
+    )
+    assert venv_state(venv) == state
+    _install(
+        venv,
+        "mypkg-0.1",
+        direct_url='{"url": "file:///src", "dir_info": {"editable": true}}',
+    )
+    assert venv_state(venv) != state
+
+
+def test_build_backends_are_tracked_from_python_3_12(venv: Path):
+    state = venv_state(venv)
+    _install(venv, "setuptools-69.0", python="python3.12")
+    assert venv_state(venv) != state
+
+
+def test_prompts_are_marked_when_the_venv_changes(venv: Path):
+    (venv / "pyvenv.cfg").write_text("prompt = myenv\n")
+    (venv / "bin" / "activate").write_text('PS1="(myenv) ${PS1-}"\n')
+    _install(venv, "numpy-1.26.0")
+    prompt = VenvPrompt(venv)
+    prompt.update_hash()
+    prompt.save()
+
+    with mock.patch("kslurm.venv._pip_freeze") as freeze:
+        _install(venv, "scipy-1.11.0")
+        VenvPrompt(venv).refresh()
+        assert VenvPrompt(venv).name == "*myenv"
+        shutil.rmtree(
+            venv / "lib" / "python3.9" / "site-packages" / "scipy-1.11.0.dist-info"
+        )
+        VenvPrompt(venv).refresh()
+    freeze.assert_not_called()
+    assert VenvPrompt(venv).name == "myenv"
+    assert "(myenv)" in (venv / "bin" / "activate").read_text()
+
+
+def test_prompts_of_older_venvs_use_pip_freeze(venv: Path):
+    (venv / "pyvenv.cfg").write_text("prompt = myenv\nstate_hash = 0\n")
+    (venv / "bin" / "activate").write_text('PS1="(myenv) ${PS1-}"\n')
+    with mock.patch("kslurm.venv._pip_freeze", return_value=b"numpy==1.26.0\n"):
+        VenvPrompt(venv).refresh()
+    assert VenvPrompt(venv).name == "*myenv"
+
+    prompt = VenvPrompt(venv)
+    prompt.update_hash()
+    prompt.save()
+    assert "state_hash" not in (venv / "pyvenv.cfg").read_text()
+
+
+def test_pyvenv_cfg_round_trips(venv: Path):
+    (venv / "pyvenv.cfg").write_text(
+        "home = /usr/bin\n\n# comment\nprompt = 'quoted'\nversion=3.9.1\n"
+    )
+    cfg = _PyEnvCfg(venv)
+    assert dict(cfg) == {
+        "home": "/usr/bin",
+        "prompt": "'quoted'",
+        "version": "3.9.1",
+    }
+    cfg.write()
+    assert dict(_PyEnvCfg(venv)) == dict(cfg)
+    assert (venv / "pyvenv.cfg").read_text() == (
+        "home = /usr/bin\nprompt = 'quoted'\nversion = 3.9.1\n"
+    )
@@ -0,0 +1,168 @@
+from __future__ import absolute_import, annotations
+
+import json
+import os
+import time
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from pytest import MonkeyPatch
+
+import kslurm.appconfig as appconfig
+import kslurm.venv_store as venv_store
+from kslurm.venv import CODECS, VenvCache, detect_codec
+from kslurm.venv_store import VenvStore, read_manifest
+
+
+def _venv(path: Path, version: str):
+    (path / "bin").mkdir(parents=True)
+    (path / "bin" / "activate").write_text('VIRTUAL_ENV="/old/venv"\n')
+    (path / "bin" / "tool").write_text("#!/old/venv/bin/python\n")
+    (path / "bin" / "tool").chmod(0o755)
+    (path / "bin" / "python").symlink_to("/usr/bin/python3")
+    (path / "pyvenv.cfg").write_text("prompt = venv\n")
+    package = path / "lib" / "site-packages" / "package"
+    package.mkdir(parents=True)
+    (package / "__init__.py").write_text("shared = True\n" * 1000)
+    (package / "version.py").write_text(f"version = {version!r}\n")
+    (path / "lib64").symlink_to("lib")
+    return path
+
+
+@pytest.fixture
+def store(tmp_path: Path):
+    return VenvStore(tmp_path / "store")
+
+
+def _blobs(store: VenvStore):
+    return sorted(path.name for path in store.blobs.glob("*/*"))
+
+
+def test_venvs_round_trip(store: VenvStore, tmp_path: Path):
+    venv = _venv(tmp_path / "venv", "1")
+    store.save(venv, tmp_path / "venv.manifest.json")
+    dest = tmp_path / "out"
+    store.restore(tmp_path / "venv.manifest.json", dest)
+
+    assert sorted(p.relative_to(venv) for p in venv.rglob("*")) == sorted(
+        p.relative_to(dest) for p in dest.rglob("*")
+    )
+    assert (dest / "lib64").readlink() == Path("lib")
+    assert (dest / "bin" / "python").readlink() == Path("/usr/bin/python3")
+    assert os.access(dest / "bin" / "tool", os.X_OK)
+    init = dest / "lib" / "site-packages" / "package" / "__init__.py"
+    assert init.read_text() == "shared = True\n" * 1000
+
+
+def test_files_are_stored_once(store: VenvStore, tmp_path: Path):
+    _, first = store.save(_venv(tmp_path / "a", "1"), tmp_path / "a.json")
+    blobs = _blobs(store)
+    _, second = store.save(_venv(tmp_path / "b", "2"), tmp_path / "b.json")
+    assert len(_blobs(store)) == len(blobs) + 1
+    assert second == len("version = '2'\n")
+    assert first > second
+
+
+def test_files_in_bin_are_never_linked(store: VenvStore, tmp_path: Path):
+    store.save(_venv(tmp_path / "venv", "1"), tmp_path / "venv.json")
+    dest = tmp_path / "out"
+    store.restore(tmp_path / "venv.json", dest)
+    assert (
+        dest / "lib" / "site-packages" / "package" / "version.py"
+    ).stat().st_nlink > 1
+    for path in [dest / "bin" / "activate", dest / "bin" / "tool", dest / "pyvenv.cfg"]:
+        assert path.stat().st_nlink == 1
+        path.write_text("rebased")
+    store.restore(tmp_path / "venv.json", tmp_path / "again")
+    assert (tmp_path / "again" / "bin" / "activate").read_text() != "rebased"
+
+
+def test_unchanged_files_are_not_hashed_again(store: VenvStore, tmp_path: Path):
+    venv = _venv(tmp_path / "venv", "1")
+    entries, _ = store.save(venv, tmp_path / "first.json")
+    (venv / "lib" / "site-packages" / "package" / "version.py").write_text("v = 2\n")
+    with mock.patch.object(venv_store, "_hash", wraps=venv_store._hash) as hash:
+        store.save(venv, tmp_path / "second.json", entries)
+    assert [call.args[0].name for call in hash.call_args_list] == ["version.py"]
+
+
+def test_garbage_collection_keeps_referenced_and_recent_blobs(
+    store: VenvStore, tmp_path: Path
+):
+    store.save(_venv(tmp_path / "a", "1"), tmp_path / "a.json")
+    store.save(_venv(tmp_path / "b", "2"), tmp_path / "b.json")
+    total = len(_blobs(store))
+
+    assert store.collect_garbage([tmp_path / "a.json"]) == (0, 0)
+    assert store.collect_garbage([tmp_path / "a.json"], grace=-1, dry_run=True)[0] == 1
+    assert len(_blobs(store)) == total
+    count, freed = store.collect_garbage([tmp_path / "a.json"], grace=-1)
+    assert (count, freed) == (1, len("version = '2'\n"))
+    store.restore(tmp_path / "a.json", tmp_path / "out")
+
+
+def test_saves_in_progress_hold_off_garbage_collection(
+    store: VenvStore, tmp_path: Path
+):
+    store.save(_venv(tmp_path / "a", "1"), tmp_path / "a.json")
+    store.save(_venv(tmp_path / "b", "2"), tmp_path / "b.json")
+    old = time.time() - 2 * venv_store.GC_GRACE
+    for blob in store.blobs.glob("*/*"):
+        os.utime(blob, (old, old))
+
+    collected: list[tuple[int, int]] = []
+
+    def add_blob(src: Path, blob: Path):
+        collected.append(store.collect_garbage([tmp_path / "a.json"]))
+        return 0
+
+    with mock.patch.object(store, "_add_blob", add_blob):
+        store.save(tmp_path / "a", tmp_path / "c.json")
+    assert set(collected) == {(0, 0)}
+    # Markers left by saves that never finished are ignored after the grace period
+    (store.saves / "crashed").touch()
+    os.utime(store.saves / "crashed", (old, old))
+    assert store.collect_garbage([tmp_path / "a.json"])[0] == 1
+
+
+def test_blobs_of_other_users_can_be_reused(store: VenvStore, tmp_path: Path):
+    venv = _venv(tmp_path / "venv", "1")
+    entries, _ = store.save(venv, tmp_path / "first.json")
+    with mock.patch("os.utime", side_effect=PermissionError):
+        again, added = store.save(venv, tmp_path / "second.json")
+    assert (again, added) == (entries, 0)
+
+
+def test_saved_venvs_are_manifests_in_the_cache(
+    tmp_path: Path, monkeypatch: MonkeyPatch
+):
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({"pipdir": str(tmp_path / "pipdir")}))
+    monkeypatch.setattr(appconfig, "CONFIG_PATH", config)
+    monkeypatch.setattr("kslurm.appcache.COMPLETION_CACHE", tmp_path / "completion")
+    codec = CODECS["store"]
+    cache = VenvCache()
+    path = cache.get_path("stored", codec)
+    codec.write(_venv(tmp_path / "venv", "1"), path)
+    assert detect_codec(path) == codec
+    assert read_manifest(path)
+
+    cache = VenvCache()
+    cache.extract("stored", tmp_path / "out")
+    assert (tmp_path / "out" / "pyvenv.cfg").read_text() == "prompt = venv\n"
+    path.unlink()
+    count, _ = VenvCache().collect_garbage(dry_run=True)
+    assert count == 0
+
+
+def test_restoring_over_a_venv_leaves_blobs_intact(store: VenvStore, tmp_path: Path):
+    store.save(_venv(tmp_path / "a", "1"), tmp_path / "a.json")
+    store.save(_venv(tmp_path / "b", "2"), tmp_path / "b.json")
+    store.restore(tmp_path / "a.json", tmp_path / "out")
+    with mock.patch("os.link", side_effect=OSError):
+        store.restore(tmp_path / "b.json", tmp_path / "out")
+    version = Path("lib", "site-packages", "package", "version.py")
+    assert (tmp_path / "out" / version).read_text() == "version = '2'\n"
+    store.restore(tmp_path / "a.json", tmp_path / "again")
+    assert (tmp_path / "again" / version).read_text() == "version = '1'\n"
@@ -1,6 +1,7 @@
 from __future__ import absolute_import, annotations
 
 import hashlib
+import os
 from typing import TypeVar, Union
 
 T = TypeVar("T")
@@ -15,3 +16,11 @@ def get_hash(item: Union[str, bytes], method: str = "md5"):
         return hashlib.sha512(item).hexdigest()
     else:
         raise TypeError(f"method '{method}' is not a valid hash method")
+
+
+def available_cpus():
+    """Get the number of cpus this process may run on, e.g. those allocated by slurm"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
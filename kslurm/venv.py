@@ -1,22 +1,344 @@
 from __future__ import absolute_import, annotations
 
+import concurrent.futures as cf
 import json
 import os
 import re
+import shutil
 import subprocess as sp
+import tarfile
+import tempfile
 from collections import UserDict
 from pathlib import Path
-from typing import Any
+from typing import IO, Any, Optional
 
-from virtualenv.create import pyenv_cfg  # type: ignore
+import attr
 
-from kslurm.appconfig import PipDir
-from kslurm.utils import get_hash
+from kslurm.appcache import update_completion
+from kslurm.appconfig import Config, PipDir
+from kslurm.utils import available_cpus, get_hash
+from kslurm.venv_store import MANIFEST_MAGIC, VenvStore, read_manifest
+
+# Written into venvs when saved, listing the files to update when they're loaded
+RELOCATION_MANIFEST = ".kpy-relocation.json"
+
+# Written into venvs set up by link_venv, holding the mount point of their image
+IMAGE_MARKER = ".kpy-image"
+
+# Longest shebang read. Linux truncates shebangs well before this
+_MAX_SHEBANG = 4096
+
+# Number of scripts beyond which venvs are rebased in parallel
+_PARALLEL_SCRIPTS = 64
+
+_SHEBANG = re.compile(rb"^#!/.*python.*$")
+
+# Left out of pip freeze, and so of venv states. The build backends are only left
+# out before python 3.12
+_FREEZE_EXCLUDED = {"pip"}
+_FREEZE_BUILD_BACKENDS = {"setuptools", "wheel", "distribute"}
+
+# \x22 and \x27 are " and ' char
+_VIRTUAL_ENV = re.compile(r"(?<=^VIRTUAL_ENV=([\x22\x27])).*(?=\1$)")
+
+# Saved venvs are trusted, and contain absolute symlinks to the base python, which
+# newer versions of tarfile refuse to extract by default
+_EXTRACT_ARGS = {"filter": "fully_trusted"} if hasattr(tarfile, "data_filter") else {}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _pipeline(
+    commands: list[list[str]], stdin: Optional[IO[bytes]] = None, stdout: Any = None
+):
+    """Run commands, piping the output of each into the next
+
+    Their stderr is only shown if any fail
+    """
+    procs: list[tuple[list[str], sp.Popen[bytes], IO[bytes]]] = []
+    for i, command in enumerate(commands):
+        stderr = tempfile.TemporaryFile()
+        proc = sp.Popen(
+            command,
+            stdin=procs[-1][1].stdout if procs else stdin,
+            stdout=stdout if i == len(commands) - 1 else sp.PIPE,
+            stderr=stderr,
+        )
+        if procs:
+            # Leave the pipe to the next command only, so it sees EOF
+            procs[-1][1].stdout.close()  # type: ignore
+        procs.append((command, proc, stderr))
+    errors: list[str] = []
+    for command, proc, stderr in procs:
+        if proc.wait():
+            stderr.seek(0)
+            message = stderr.read().decode(errors="replace").strip()
+            errors.append(
+                f"{Path(command[0]).name} failed ({proc.returncode}) {message}"
+            )
+        stderr.close()
+    if errors:
+        raise ArchiveError("\n".join(errors))
+
+
+@attr.frozen
+class ArchiveCodec:
+    """A compression format for saved venvs
+
+    Archives are piped through the first of compressors (or decompressors) found on
+    the PATH, where {threads} is replaced by the number of cpus available. If none are
+    found, or tar isn't installed, archives are read and written in-process by tarfile
+    using mode, for formats it supports
+    """
+
+    name: str
+    suffix: str
+    magic: bytes
+    compressors: tuple[tuple[str, ...], ...] = ()
+    decompressors: tuple[tuple[str, ...], ...] = ()
+    mode: Optional[str] = None
+
+    @staticmethod
+    def _find(commands: tuple[tuple[str, ...], ...]):
+        for command in commands:
+            if shutil.which(command[0]):
+                return [arg.format(threads=available_cpus()) for arg in command]
+        return None
+
+    def compressor(self):
+        return self._find(self.compressors)
+
+    def decompressor(self):
+        return self._find(self.decompressors)
+
+    @property
+    def available(self):
+        return self.mode is not None or bool(shutil.which("tar") and self.compressor())
+
+    def _missing(self):
+        return ArchiveError(
+            f"{self.name} archives need tar and {self.compressors[0][0]} to be "
+            "installed"
+        )
+
+    def write(self, src: Path, dest: Path, previous: Optional[Path] = None):
+        """Archive the contents of src into dest
+
+        previous is an earlier archive of the same venv, which codecs may use to
+        save faster
+        """
+        tar = shutil.which("tar")
+        compressor = self.compressor()
+        if tar and (compressor or self.mode == ""):
+            with dest.open("wb") as out:
+                _pipeline(
+                    [[tar, "-c", "-f", "-", "-C", str(src), "."]]
+                    + ([compressor] if compressor else []),
+                    stdout=out,
+                )
+            return
+        if self.mode is None:
+            raise self._missing()
+        # tarfile defaults to the slowest gzip level, 6 matches the gzip default
+        level = {"compresslevel": 6} if self.mode == "gz" else {}
+        with tarfile.open(dest, f"w:{self.mode}", **level) as tar_file:
+            tar_file.add(src, arcname="")
+
+    def extract(self, path: Path, dest: Path):
+        """Extract the archive at path into dest"""
+        tar = shutil.which("tar")
+        decompressor = self.decompressor()
+        if tar and (decompressor or self.mode == ""):
+            dest.mkdir(parents=True, exist_ok=True)
+            with path.open("rb") as f:
+                _pipeline(
+                    ([decompressor] if decompressor else [])
+                    + [
+                        [tar, "-x", "-p", "--no-same-owner", "-f", "-", "-C", str(dest)]
+                    ],
+                    stdin=f,
+                )
+            return
+        if self.mode is None:
+            raise self._missing()
+        with tarfile.open(path, f"r:{self.mode}") as tar_file:
+            tar_file.extractall(dest, **_EXTRACT_ARGS)
+
+
+@attr.frozen
+class SquashfsCodec(ArchiveCodec):
+    """Saves venvs as squashfs images, which can be mounted rather than extracted
+
+    Images are written by mksquashfs, extracted by unsquashfs, mounted read-only by
+    the first of mounters found on the PATH, and unmounted by the first of unmounters
+    """
+
+    mounters: tuple[str, ...] = ()
+    unmounters: tuple[tuple[str, ...], ...] = ()
+
+    @property
+    def available(self):
+        return self.compressor() is not None
+
+    def _missing(self):
+        return ArchiveError(
+            f"{self.name} images need {self.compressors[0][0]} to be installed"
+        )
+
+    def write(self, src: Path, dest: Path, previous: Optional[Path] = None):
+        if (compressor := self.compressor()) is None:
+            raise self._missing()
+        _pipeline(
+            [[compressor[0], str(src), str(dest), *compressor[1:]]], stdout=sp.DEVNULL
+        )
+
+    def extract(self, path: Path, dest: Path):
+        if (decompressor := self.decompressor()) is None:
+            raise ArchiveError(
+                f"{self.name} images need {self.decompressors[0][0]} or "
+                f"{self.mounters[0]} to be loaded"
+            )
+        _pipeline([[*decompressor, "-d", str(dest), str(path)]], stdout=sp.DEVNULL)
+
+    def mount(self, path: Path, mountpoint: Path):
+        """Mount the image at path read-only on mountpoint"""
+        for mounter in self.mounters:
+            if mounter := shutil.which(mounter):
+                mountpoint.mkdir(parents=True, exist_ok=True)
+                _pipeline([[mounter, str(path), str(mountpoint)]], stdout=sp.DEVNULL)
+                return
+        raise ArchiveError(f"Mounting {self.name} images needs {self.mounters[0]}")
+
+    def unmount(self, mountpoint: Path):
+        """Unmount an image mounted by mount, and remove its mount point"""
+        if (unmounter := self._find(self.unmounters)) is None:
+            raise ArchiveError(
+                f"Unmounting {self.name} images needs {self.unmounters[0][0]}"
+            )
+        _pipeline([[*unmounter, str(mountpoint)]], stdout=sp.DEVNULL)
+        try:
+            mountpoint.rmdir()
+        except OSError:
+            pass
+
+
+@attr.frozen
+class StoreCodec(ArchiveCodec):
+    """Saves venvs to the content addressed store in the pipdir, as manifests listing
+    their files, so files shared by saved venvs are only stored once
+    """
+
+    @property
+    def available(self):
+        return True
+
+    @staticmethod
+    def store():
+        return VenvStore(PipDir() / "venv_store")
+
+    def write(self, src: Path, dest: Path, previous: Optional[Path] = None):
+        entries = []
+        if previous is not None and detect_codec(previous) == self:
+            entries = read_manifest(previous)
+        self.store().save(src, dest, entries)
+
+    def extract(self, path: Path, dest: Path):
+        self.store().restore(path, dest)
+
+
+CODECS = {
+    codec.name: codec
+    for codec in [
+        ArchiveCodec(
+            "zstd",
+            ".tar.zst",
+            b"\x28\xb5\x2f\xfd",
+            compressors=(("zstd", "-q", "-c", "-T{threads}"),),
+            decompressors=(("zstd", "-d", "-q", "-c"),),
+        ),
+        ArchiveCodec(
+            "lz4",
+            ".tar.lz4",
+            b"\x04\x22\x4d\x18",
+            compressors=(("lz4", "-q", "-c"),),
+            decompressors=(("lz4", "-d", "-q", "-c"),),
+        ),
+        ArchiveCodec(
+            "gzip",
+            ".tar.gz",
+            b"\x1f\x8b",
+            compressors=(("pigz", "-c", "-p", "{threads}"), ("gzip", "-c")),
+            decompressors=(("pigz", "-d", "-c"), ("gzip", "-d", "-c")),
+            mode="gz",
+        ),
+        SquashfsCodec(
+            "squashfs",
+            ".sqfs",
+            b"hsqs",
+            compressors=(
+                ("mksquashfs", "-noappend", "-no-progress", "-processors", "{threads}"),
+            ),
+            decompressors=(("unsquashfs", "-no-progress", "-force"),),
+            mounters=("squashfuse_ll", "squashfuse"),
+            unmounters=(("fusermount3", "-u"), ("fusermount", "-u"), ("umount",)),
+        ),
+        StoreCodec("store", ".manifest.json", MANIFEST_MAGIC),
+        ArchiveCodec("none", ".tar", b"", mode=""),
+    ]
+}
+
+_ARCHIVE_RE = re.compile(
+    r"(.+)(?:" + "|".join(re.escape(c.suffix) for c in CODECS.values()) + r")$"
+)
+
+
+def detect_codec(path: Path) -> ArchiveCodec:
+    """Get the codec of an archive from its first bytes, whatever its suffix"""
+    with path.open("rb") as f:
+        header = f.read(max(len(codec.magic) for codec in CODECS.values()))
+    for codec in CODECS.values():
+        if codec.magic and header.startswith(codec.magic):
+            return codec
+    return CODECS["none"]
+
+
+def default_codec() -> ArchiveCodec:
+    """Get the codec set as kpy.codec in the config, or zstd if installed"""
+    if name := Config().get("kpy.codec"):
+        try:
+            return CODECS[name]
+        except KeyError:
+            raise ArchiveError(
+                f"Invalid kpy.codec in config: {name}. Must be one of "
+                f"{', '.join(CODECS)}"
+            )
+    zstd = CODECS["zstd"]
+    return zstd if zstd.available else CODECS["gzip"]
+
+
+def _running(pid: int):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
 
 
 class KpyIndex(UserDict[str, str]):
+    """Venvs initialized in a job, mapped to their directories
+
+    mounts maps the venv images mounted in the job to their mount points, so each
+    image is only mounted once, and owners maps mount points to the pids of the
+    processes using them, so images can be unmounted once they all exit
+    """
+
     def __init__(self, slurm_tmpdir: Path):
         self._path = slurm_tmpdir / "tmp" / "kpy-index.json"
+        self._mounts_path = slurm_tmpdir / "tmp" / "kpy-mounts.json"
         if not self._path.exists():
             self._path.parent.mkdir(parents=True, exist_ok=True)
             with self._path.open("w") as f:
@@ -25,10 +347,38 @@ class KpyIndex(UserDict[str, str]):
         else:
             with self._path.open("r") as f:
                 self.data = json.load(f)
+        self.mounts: dict[str, str] = {}
+        self.owners: dict[str, list[int]] = {}
+        if self._mounts_path.exists():
+            with self._mounts_path.open("r") as f:
+                mounts = json.load(f)
+            self.mounts, self.owners = mounts["mounts"], mounts["owners"]
 
     def write(self):
         with self._path.open("w") as f:
             json.dump(self.data, f)
+        if self.mounts or self._mounts_path.exists():
+            with self._mounts_path.open("w") as f:
+                json.dump({"mounts": self.mounts, "owners": self.owners}, f)
+
+    def hold(self, mountpoint: str, owner: int):
+        """Record owner as using the image mounted on mountpoint"""
+        owners = self.owners.setdefault(mountpoint, [])
+        if owner not in owners:
+            owners.append(owner)
+
+    def release(self, owner: int):
+        """Stop owner from holding images, returning the mount points of the images no
+        longer held by any running process
+        """
+        released: list[str] = []
+        for mountpoint, owners in self.owners.items():
+            if owner not in owners:
+                continue
+            owners[:] = [pid for pid in owners if pid != owner and _running(pid)]
+            if not owners:
+                released.append(mountpoint)
+        return released
 
     def __str__(self):
         return "• " + "\n• ".join(self.data.keys()) if self.data else ""
@@ -39,31 +389,188 @@ class VenvCache(UserDict[str, Path]):
         pipdir = PipDir()
         self.venv_cache = pipdir / "venv_archives"
         self.venv_cache.mkdir(exist_ok=True)
-        venvs_re = [
-            re.search(r"(.+)\.tar\.gz$", str(f.name)) for f in self.venv_cache.iterdir()
+        self.data = {}
+        for path in self.venv_cache.iterdir():
+            if match := _ARCHIVE_RE.match(path.name):
+                self.data[match.group(1)] = path
+        self.update_completion()
+
+    def update_completion(self):
+        update_completion("venvs", self.data)
+
+    def get_path(self, name: str, codec: ArchiveCodec):
+        """Get the path of a venv saved with codec"""
+        return self.venv_cache / f"{name}{codec.suffix}"
+
+    def extract(self, name: str, dest: Path):
+        """Extract a saved venv into dest, whatever the codec it was saved with"""
+        path = self.data[name]
+        detect_codec(path).extract(path, dest)
+
+    def collect_garbage(self, dry_run: bool = False):
+        """Delete the files of the venv store no longer used by any saved venv
+
+        Returns the number of files deleted and the bytes they freed
+        """
+        store = CODECS["store"]
+        manifests = [
+            path
+            for path in self.venv_cache.iterdir()
+            if path.is_file() and detect_codec(path) == store
         ]
-        venvs = [r.group(1) for r in venvs_re if r]
-        self.data = {v: self._construct_path(v) for v in venvs}
+        return StoreCodec.store().collect_garbage(manifests, dry_run=dry_run)
 
-    def get_path(self, name: str):
-        try:
-            return self.data[name]
-        except KeyError:
-            return self._construct_path(name)
+    def mount(self, name: str, dest: Path, index: KpyIndex, mount_dir: Path):
+        """Set up dest as a venv backed by the mounted image of a saved venv
 
-    def _construct_path(self, name: str):
-        return (self.venv_cache / name).with_suffix(".tar.gz")
+        Images already mounted, as recorded in index, are reused. Returns False if
+        the venv wasn't saved as an image, and raises ArchiveError if it can't be
+        mounted
+        """
+        path = self.data[name]
+        codec = detect_codec(path)
+        if not isinstance(codec, SquashfsCodec):
+            return False
+        # Images overwritten since being mounted are mounted again
+        key = f"{path.resolve()}:{path.stat().st_mtime_ns}"
+        if (mountpoint := index.mounts.get(key)) is None:
+            mountpoint = tempfile.mkdtemp(prefix="kslurm-image-", dir=mount_dir)
+            codec.mount(path, Path(mountpoint))
+            index.mounts[key] = mountpoint
+        link_venv(Path(mountpoint), dest)
+        return True
 
     def __str__(self):
         return "• " + "\n• ".join(self.data.keys()) if self.data else ""
 
 
+def link_venv(image: Path, venv_dir: Path):
+    """Set up venv_dir as a venv whose packages are read from a read-only image
+
+    bin and the files at the top of the venv are copied, so they can be rebased and
+    prompts updated, while everything else (e.g. lib) is linked into the image
+    """
+    venv_dir.mkdir(parents=True, exist_ok=True)
+    for entry in image.iterdir():
+        target = venv_dir / entry.name
+        if entry.is_symlink():
+            target.symlink_to(os.readlink(entry))
+        elif entry.name == "bin":
+            shutil.copytree(entry, target, symlinks=True)
+        elif entry.is_file():
+            shutil.copy2(entry, target)
+        else:
+            target.symlink_to(entry)
+    (venv_dir / IMAGE_MARKER).write_text(str(image))
+
+
+def linked_image(venv_dir: Path) -> Optional[Path]:
+    """Get the mount point of the image a venv was linked into by link_venv"""
+    try:
+        return Path((venv_dir / IMAGE_MARKER).read_text())
+    except FileNotFoundError:
+        return None
+
+
+def unlink_venv(venv_dir: Path, dest: Path):
+    """Copy a venv set up by link_venv to dest, with the contents of its image in
+    place of the links into it
+    """
+    image = linked_image(venv_dir)
+    dest.mkdir(parents=True, exist_ok=True)
+    for entry in venv_dir.iterdir():
+        target = dest / entry.name
+        if entry.name == IMAGE_MARKER:
+            continue
+        if entry.is_symlink():
+            link = os.readlink(entry)
+            if Path(link).parent == image:
+                shutil.copytree(link, target, symlinks=True)
+            else:
+                target.symlink_to(link)
+        elif entry.is_dir():
+            shutil.copytree(entry, target, symlinks=True)
+        else:
+            shutil.copy2(entry, target)
+
+
+def unmount_images(index: KpyIndex, owner: int):
+    """Unmount the images held by owner and no other running process
+
+    Unmounted images are dropped from index, along with the venvs linked into them.
+    Raises ArchiveError if any image can't be unmounted, once the rest have been
+    """
+    codec = CODECS["squashfs"]
+    assert isinstance(codec, SquashfsCodec)
+    errors: list[str] = []
+    for mountpoint in index.release(owner):
+        try:
+            codec.unmount(Path(mountpoint))
+        except ArchiveError as err:
+            errors.append(str(err))
+            continue
+        del index.owners[mountpoint]
+        for key, mounted in list(index.mounts.items()):
+            if mounted == mountpoint:
+                del index.mounts[key]
+        for name, venv_dir in list(index.items()):
+            if linked_image(Path(venv_dir)) == Path(mountpoint):
+                del index[name]
+    if errors:
+        raise ArchiveError("\n".join(errors))
+
+
 def _pip_freeze(venv_dir: Path):
     return sp.run(
         [venv_dir / "bin" / "python", "-m", "pip", "freeze"], capture_output=True
     ).stdout
 
 
+def _canonical_name(name: str):
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def _dist_state(site_packages: Path):
+    """List the distributions in site_packages as pip freeze would
+
+    Names and versions are read from the names of the .dist-info directories, and
+    the origin of editable and url installs from their direct_url.json. Legacy
+    .egg-info and .egg-link installs are listed by name
+    """
+    match = re.fullmatch(r"python(\d+)\.(\d+)", site_packages.parent.name)
+    excluded = set(_FREEZE_EXCLUDED)
+    if match is None or tuple(map(int, match.groups())) < (3, 12):
+        excluded |= _FREEZE_BUILD_BACKENDS
+    with os.scandir(site_packages) as entries:
+        for entry in entries:
+            if entry.name.endswith(".dist-info"):
+                name, _, dist_version = entry.name[: -len(".dist-info")].rpartition("-")
+                name = _canonical_name(name)
+                if name in excluded:
+                    continue
+                try:
+                    with open(Path(entry.path, "direct_url.json"), "r") as f:
+                        origin = f" @ {f.read().strip()}"
+                except FileNotFoundError:
+                    origin = ""
+                yield f"{name}=={dist_version}{origin}"
+            elif entry.name.endswith((".egg-info", ".egg-link")):
+                yield entry.name
+
+
+def venv_state(venv_dir: Path):
+    """Fingerprint of the packages installed in a venv, read from site-packages
+
+    Changes when packages are installed, upgraded or removed, as the output of pip
+    freeze in the venv would, without starting python. Packages from the system
+    site-packages aren't included
+    """
+    state: list[str] = []
+    for site_packages in venv_dir.glob("lib/python*/site-packages"):
+        state.extend(_dist_state(site_packages))
+    return get_hash("\n".join(sorted(state)))
+
+
 def _file_sub(path: Path, *replacements: tuple[str, str]):
     with path.open("r") as f:
         contents = f.read()
@@ -78,9 +585,34 @@ class PromptRefreshError(Exception):
     pass
 
 
+class _PyEnvCfg(UserDict[str, str]):
+    """Read and write the pyvenv.cfg of a venv
+
+    Holds its "key = value" lines, with values kept as written. Lines without an =,
+    such as blank lines, are skipped. Used instead of virtualenv, which is too
+    expensive to import in the shell hooks calling kpy
+    """
+
+    def __init__(self, venv_dir: Path):
+        self.path = venv_dir / "pyvenv.cfg"
+        self.data = {}
+        if not self.path.exists():
+            return
+        for line in self.path.read_text(encoding="utf-8").splitlines():
+            key, sep, value = line.partition("=")
+            if sep:
+                self.data[key.strip()] = value.strip()
+
+    def write(self):
+        self.path.write_text(
+            "".join(f"{key} = {value}\n" for key, value in self.data.items()),
+            encoding="utf-8",
+        )
+
+
 class VenvPrompt:
     def __init__(self, venv_dir: Path):
-        self.cfg: Any = pyenv_cfg.PyEnvCfg.from_folder(venv_dir)  # type: ignore
+        self.cfg = _PyEnvCfg(venv_dir)
         self.venv_dir = venv_dir
         try:
             self.name = self.cfg["prompt"]
@@ -92,16 +624,22 @@ class VenvPrompt:
         self.cfg["prompt"] = name
 
     def update_hash(self):
-        self.cfg["state_hash"] = get_hash(_pip_freeze(self.venv_dir))
+        self.cfg.pop("state_hash", None)
+        self.cfg["venv_state"] = venv_state(self.venv_dir)
 
     def refresh(self):
-        try:
+        # Venvs saved by older versions hold the hash of pip freeze, which is still
+        # used until they're next saved
+        if "venv_state" in self.cfg:
+            state_hash = self.cfg["venv_state"]
+            hsh = venv_state(self.venv_dir)
+        elif "state_hash" in self.cfg:
             state_hash = self.cfg["state_hash"]
-        except KeyError:
+            hsh = get_hash(_pip_freeze(self.venv_dir))
+        else:
             raise PromptRefreshError()
 
         try:
-            hsh = get_hash(_pip_freeze(self.venv_dir))
             if hsh != state_hash and self.name[0] != "*":
                 self.update_prompt("*" + self.name)
             elif hsh == state_hash and self.name[0] == "*":
@@ -135,39 +673,108 @@ class VenvPrompt:
         # )
 
 
-def rebase_venv(venv_dir: Path):
-    with (venv_dir / "bin" / "activate").open("r") as f:
-        resolved = venv_dir.resolve()
-        lines = f.read().splitlines()
-        # \x22 and \x27 are " and ' char
-        subbed = [
-            re.sub(
-                r"(?<=^VIRTUAL_ENV=([\x22\x27])).*(?=\1$)",
-                str(resolved),
-                line,
-            )
-            for line in lines
-        ]
-    with (venv_dir / "bin" / "activate").open("w") as f:
-        f.write("\n".join(subbed))
+def _first_line(path: Path):
+    with path.open("rb") as f:
+        return f.readline(_MAX_SHEBANG)
+
+
+def _python_scripts(venv_dir: Path):
+    """Find the executables in bin starting with a python shebang
 
+    Only the first line of each file is read
+    """
     for root, _, files in os.walk(venv_dir / "bin"):
         for file in files:
             path = Path(root, file)
             if path.is_symlink() or not os.access(path, os.X_OK):
                 continue
-            with path.open("r") as f:
-                lines = f.read().splitlines()
-                try:
-                    subbed = [
-                        re.sub(
-                            r"(?<=^#!)\/.*python.*$",
-                            str(resolved / "bin" / "python"),
-                            lines[0],
-                        ),
-                        *lines[1:],
-                    ]
-                except IndexError:
-                    subbed = lines
-            with path.open("w") as f:
-                f.write("\n".join(subbed))
+            try:
+                if _SHEBANG.match(_first_line(path).rstrip(b"\r\n")):
+                    yield path
+            except OSError:
+                continue
+
+
+def record_relocation(venv_dir: Path):
+    """Write the relocation manifest of a venv, listing the files updated when it's
+    loaded elsewhere
+
+    These are the scripts in bin with a python shebang, and the lines of activate
+    setting VIRTUAL_ENV
+    """
+    lines = (venv_dir / "bin" / "activate").read_text().splitlines()
+    manifest = {
+        "scripts": sorted(
+            path.relative_to(venv_dir).as_posix() for path in _python_scripts(venv_dir)
+        ),
+        "activate": [i for i, line in enumerate(lines) if _VIRTUAL_ENV.search(line)],
+    }
+    with (venv_dir / RELOCATION_MANIFEST).open("w") as f:
+        json.dump(manifest, f)
+
+
+def _read_relocation(venv_dir: Path) -> Optional[dict[str, Any]]:
+    try:
+        with (venv_dir / RELOCATION_MANIFEST).open("r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _rebase_shebang(path: Path, python: bytes):
+    """Point a python shebang at python, rewriting only the start of the file"""
+    with path.open("r+b") as f:
+        line = f.readline(_MAX_SHEBANG)
+        shebang = line.rstrip(b"\r\n")
+        if not _SHEBANG.match(shebang):
+            return
+        new = b"#!" + python + line[len(shebang) :]
+        if new == line:
+            return
+        rest = f.read()
+        f.seek(0)
+        f.write(new)
+        f.write(rest)
+        f.truncate()
+
+
+def _rebase_activate(path: Path, resolved: str, offsets: Optional[list[int]]):
+    """Set VIRTUAL_ENV in activate, on the lines at offsets if given"""
+    lines = path.read_text().splitlines(keepends=True)
+    if offsets is None or any(
+        i >= len(lines) or not _VIRTUAL_ENV.search(lines[i].rstrip("\r\n"))
+        for i in offsets
+    ):
+        offsets = range(len(lines))
+    for i in offsets:
+        ending = lines[i][len(lines[i].rstrip("\r\n")) :]
+        lines[i] = _VIRTUAL_ENV.sub(resolved, lines[i].rstrip("\r\n")) + ending
+    path.write_text("".join(lines))
+
+
+def rebase_venv(venv_dir: Path):
+    """Update the paths of a venv moved to venv_dir
+
+    Files are found from the relocation manifest written when the venv was saved, or
+    by scanning bin for venvs saved without one
+    """
+    resolved = venv_dir.resolve()
+    manifest = _read_relocation(venv_dir)
+    _rebase_activate(
+        venv_dir / "bin" / "activate",
+        str(resolved),
+        manifest["activate"] if manifest else None,
+    )
+
+    if manifest:
+        scripts = [venv_dir / script for script in manifest["scripts"]]
+    else:
+        scripts = list(_python_scripts(venv_dir))
+    python = str(resolved / "bin" / "python").encode()
+    if len(scripts) < _PARALLEL_SCRIPTS:
+        for script in scripts:
+            _rebase_shebang(script, python)
+        return
+    with cf.ThreadPoolExecutor(available_cpus()) as pool:
+        for _ in pool.map(lambda script: _rebase_shebang(script, python), scripts):
+            pass
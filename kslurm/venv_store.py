@@ -0,0 +1,245 @@
+from __future__ import absolute_import, annotations
+
+import concurrent.futures as cf
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterable
+
+from kslurm.utils import available_cpus
+
+# Written as the first key of every manifest, so they can be recognized from their
+# first bytes
+MANIFEST_MAGIC = b'{"kpy_manifest": 1'
+
+# Seconds for which unreferenced blobs are kept, and garbage collection held off by
+# saves in progress, as they may belong to a venv still being saved
+GC_GRACE = 3600
+
+_READ_SIZE = 2**20
+
+# Manifest entries are lists, starting with their kind and path:
+#   ["d", path, mode]
+#   ["l", path, target]
+#   ["f", path, mode, digest, size, mtime_ns]
+Entry = list[Any]
+
+
+def _hash(path: Path):
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(_READ_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _linkable(path: str):
+    """Whether a file may be restored as a hardlink to its blob
+
+    bin and the files at the top of the venv are modified in place when venvs are
+    loaded, which would modify the blob
+    """
+    return "/" in path and not path.startswith("bin/")
+
+
+def read_manifest(path: Path) -> list[Entry]:
+    with path.open("r") as f:
+        return json.load(f)["entries"]
+
+
+def write_manifest(path: Path, entries: list[Entry]):
+    with path.open("w") as f:
+        f.write(MANIFEST_MAGIC.decode())
+        f.write(', "entries": ')
+        json.dump(entries, f, separators=(",", ":"))
+        f.write("}")
+
+
+class VenvStore:
+    """Content addressed store of the files of saved venvs
+
+    Each file is stored once as a blob named by the sha256 of its contents, shared by
+    every venv containing it. Saved venvs are manifests listing their files, links
+    and directories. Blobs are read-only, so the hardlinks to them made when venvs
+    are restored can't be modified in place. Each save in progress holds a marker in
+    saves
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.blobs = root / "blobs"
+        self.saves = root / "saves"
+
+    def blob(self, digest: str, mode: int):
+        executable = ".x" if mode & stat.S_IXUSR else ""
+        return self.blobs / digest[:2] / f"{digest}{executable}"
+
+    def _add_blob(self, src: Path, blob: Path):
+        """Store a file as blob unless already stored, returning the bytes added"""
+        if blob.exists():
+            # Mark the blob as in use, protecting it from garbage collection. Blobs of
+            # other users can't be touched, but are protected by the save marker
+            try:
+                os.utime(blob)
+            except OSError:
+                pass
+            return 0
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        tmp = blob.with_name(f".{blob.name}.{os.getpid()}.{threading.get_ident()}")
+        shutil.copyfile(src, tmp)
+        os.chmod(tmp, 0o555 if blob.name.endswith(".x") else 0o444)
+        os.replace(tmp, blob)
+        return blob.stat().st_size
+
+    def save(
+        self, src: Path, manifest: Path, previous: Iterable[Entry] = ()
+    ) -> tuple[list[Entry], int]:
+        """Add the files of the venv at src to the store, and write its manifest
+
+        Files are hashed and copied in parallel. Files whose size and mtime match
+        their entry in previous, a manifest of an earlier save, aren't hashed again.
+        Returns the entries of the manifest, and the number of bytes added
+        """
+        self.saves.mkdir(parents=True, exist_ok=True)
+        fd, marker = tempfile.mkstemp(dir=self.saves)
+        os.close(fd)
+        try:
+            return self._save(src, manifest, previous)
+        finally:
+            os.remove(marker)
+
+    def _save(
+        self, src: Path, manifest: Path, previous: Iterable[Entry]
+    ) -> tuple[list[Entry], int]:
+        known = {entry[1]: entry for entry in previous if entry[0] == "f"}
+        entries: list[Entry] = []
+        files: list[tuple[str, Path, os.stat_result]] = []
+        for root, dirs, names in os.walk(src):
+            dirs.sort()
+            for name in sorted([*dirs, *names]):
+                path = Path(root, name)
+                rel = path.relative_to(src).as_posix()
+                st = path.lstat()
+                if stat.S_ISLNK(st.st_mode):
+                    entries.append(["l", rel, os.readlink(path)])
+                elif stat.S_ISDIR(st.st_mode):
+                    entries.append(["d", rel, stat.S_IMODE(st.st_mode)])
+                elif stat.S_ISREG(st.st_mode):
+                    files.append((rel, path, st))
+
+        def store(file: tuple[str, Path, os.stat_result]):
+            rel, path, st = file
+            entry = known.get(rel)
+            if entry is not None and entry[4:] == [st.st_size, st.st_mtime_ns]:
+                digest = entry[3]
+            else:
+                digest = _hash(path)
+            mode = stat.S_IMODE(st.st_mode)
+            added = self._add_blob(path, self.blob(digest, mode))
+            return ["f", rel, mode, digest, st.st_size, st.st_mtime_ns], added
+
+        added = 0
+        with cf.ThreadPoolExecutor(available_cpus()) as pool:
+            for entry, size in pool.map(store, files):
+                entries.append(entry)
+                added += size
+        write_manifest(manifest, entries)
+        return entries, added
+
+    def restore(self, manifest: Path, dest: Path):
+        """Rebuild the venv listed in manifest at dest
+
+        Files are hardlinked to their blobs where possible, and otherwise copied in
+        parallel. Files already in dest are replaced
+        """
+        entries = read_manifest(manifest)
+        dest.mkdir(parents=True, exist_ok=True)
+        for entry in entries:
+            if entry[0] == "d":
+                (dest / entry[1]).mkdir(exist_ok=True)
+        # Hardlinks only work within a filesystem, which is checked once
+        link = True
+
+        def restore(entry: Entry):
+            nonlocal link
+            _, rel, mode, digest, _, mtime_ns = entry
+            blob = self.blob(digest, mode)
+            target = dest / rel
+            if link and _linkable(rel):
+                try:
+                    os.link(blob, target)
+                    return
+                except FileExistsError:
+                    target.unlink()
+                    os.link(blob, target)
+                    return
+                except OSError:
+                    link = False
+            # Existing files may be links to blobs, which mustn't be written to
+            target.unlink(missing_ok=True)
+            shutil.copyfile(blob, target)
+            os.chmod(target, mode)
+            os.utime(target, ns=(mtime_ns, mtime_ns))
+
+        with cf.ThreadPoolExecutor(available_cpus()) as pool:
+            for _ in pool.map(restore, [e for e in entries if e[0] == "f"]):
+                pass
+        for entry in entries:
+            if entry[0] == "l":
+                (dest / entry[1]).unlink(missing_ok=True)
+                (dest / entry[1]).symlink_to(entry[2])
+        for entry in reversed(entries):
+            if entry[0] == "d":
+                os.chmod(dest / entry[1], entry[2])
+
+    def _saving(self, since: float):
+        """Whether a save started after since is in progress"""
+        if not self.saves.exists():
+            return False
+        for marker in self.saves.iterdir():
+            try:
+                if marker.stat().st_mtime > since:
+                    return True
+            except FileNotFoundError:
+                continue
+        return False
+
+    def collect_garbage(
+        self, manifests: Iterable[Path], grace: float = GC_GRACE, dry_run: bool = False
+    ) -> tuple[int, int]:
+        """Delete blobs not listed in any of manifests, unless used within grace
+        seconds
+
+        Nothing is deleted while a save started within grace seconds is in progress,
+        as its manifest isn't written yet. Returns the number of blobs deleted and the
+        bytes they freed
+        """
+        cutoff = time.time() - grace
+        if self._saving(cutoff):
+            return 0, 0
+        referenced: set[str] = set()
+        for manifest in manifests:
+            referenced.update(
+                self.blob(entry[3], entry[2]).name
+                for entry in read_manifest(manifest)
+                if entry[0] == "f"
+            )
+        if not self.blobs.exists():
+            return 0, 0
+        count = freed = 0
+        for directory in self.blobs.iterdir():
+            for blob in directory.iterdir():
+                st = blob.stat()
+                if blob.name in referenced or st.st_mtime > cutoff:
+                    continue
+                count += 1
+                freed += st.st_size
+                if not dry_run:
+                    blob.unlink()
+        return count, freed